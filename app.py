@@ -1,8 +1,18 @@
 import streamlit as st
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from src.const import *
-from src.search_engine import (process_qa, process_search, restaurant_search)
-from src.utils import (get_query_type, is_bonus_query, is_tds_qa, select_root_and_get_cards_list, select_card_to_open)
-from streamlit_agraph import (Config, Edge, Node, agraph)
+from src.metrics import (collect_samples, get_logger, get_stage_summary, new_trace_id, observe, propagate_trace,
+                         start_metrics_server, timed)
+from src.prefetch import get_prefetcher
+from src.search_engine import (process_qa, stream_restaurant_search, stream_search)
+from src.card_index import RootCardIndex
+from src.concept_graph import (ConceptGraph, QUERY_NODE)
+from src.utils import (get_card_to_open, get_query_type, is_bonus_query, is_tds_qa, select_root_card,
+                       suggest_root_card_types)
+
+logger = get_logger("app")
 
 # App title
 st.title("Search")
@@ -40,155 +50,359 @@ def prepare_layout():
         st.markdown(res_instructions)
 
 
-def process_tds_search(query: str):
-    root_cards_list = process_search(search_query=query, search_engine_type=TDSSearchEngineType.MIX,
-                                     num_results_to_retrieve=TDS_NUM_RESULTS)
+def store_tds_search(root_cards_list: list):
+    # Cache the current global state
+    st.session_state.root_cards_list = root_cards_list
+    st.session_state.root_cards_index = RootCardIndex(root_cards_list)
+
+
+@timed("render_results")
+def render_tds_search(root_cards_list: list):
     if not root_cards_list:
         st.error("Something went wrong with the search engine :(")
         return
 
-    # Cache the current global state
-    st.session_state.root_cards_list = root_cards_list
-
     # Print number of results
-    num_results = 0
-    for root_card in root_cards_list:
-        num_results += root_card.get_num_children()
-    st.markdown("##### Found " + str(num_results) + " results")
+    st.markdown(format_num_results(root_cards_list))
 
     # Print root cards
     for root_card in root_cards_list:
-        st.markdown("***")
+        render_tds_root_card(root_card)
+
+
+def render_tds_root_card(root_card):
+    st.markdown("***")
 
-        # Card type
-        st.markdown("### " + root_card.card_type.title())
-        st.markdown("Collection type: " + root_card.card_type)
+    # Card type
+    st.markdown("### " + root_card.card_type.title())
+    st.markdown("Collection type: " + root_card.card_type)
 
-        # Number of children
-        num_cards = root_card.get_num_children()
-        st.markdown(str(num_cards) + " result" + "s" if num_cards > 1 else "")
+    # Number of children
+    num_cards = root_card.get_num_children()
+    st.markdown(str(num_cards) + " result" + "s" if num_cards > 1 else "")
 
-        # Top ranked results
-        st.markdown("Top ranked result:")
-        st.markdown("[" + root_card.top_ranked_result_title + '](' + root_card.top_ranked_result_url + ')')
+    # Top ranked results
+    st.markdown("Top ranked result:")
+    st.markdown("[" + root_card.top_ranked_result_title + '](' + root_card.top_ranked_result_url + ')')
+
+
+def stream_tds_search(query: str):
+    return stream_search(search_query=query, search_engine_type=TDS_SEARCH_ENGINE_TYPE,
+                         num_results_to_retrieve=TDS_NUM_RESULTS)
+
+
+def stream_restaurant(query: str):
+    return stream_restaurant_search(search_query=query, num_results_to_retrieve=RESTAURANT_NUM_RESULTS)
+
+
+def store_restaurant_search(root_cards_list: list):
+    # Cache the current global state
+    st.session_state.res_root_cards_list = root_cards_list
+    st.session_state.res_root_cards_index = RootCardIndex(root_cards_list)
 
 
 def process_restaurant_search(query: str):
-    root_cards_list = restaurant_search(search_query=query, num_results_to_retrieve=RESTAURANT_NUM_RESULTS)
+    signature = (query, RESTAURANT_NUM_RESULTS)
+    root_cards_list = get_last_run_result("restaurant_search", signature)
+    if root_cards_list is not None:
+        render_restaurant_search(root_cards_list)
+        return
+
+    # Show each category as soon as its first result arrives
+    root_cards_stream = stream_restaurant(query)
+    root_cards_list = render_search_stream(root_cards_stream, render_restaurant_root_card)
+
+    # A partial result would be replayed by the next runs: keep it only once complete
+    if root_cards_list and root_cards_stream.complete:
+        set_last_run_result("restaurant_search", signature, root_cards_list)
+        store_restaurant_search(root_cards_list)
+
+
+@timed("render_results")
+def render_restaurant_search(root_cards_list: list):
     if not root_cards_list:
         st.error("Something went wrong with the search engine :(")
         return
 
-    # Cache the current global state
-    st.session_state.res_root_cards_list = root_cards_list
-
     # Print number of results
-    num_results = 0
-    for root_card in root_cards_list:
-        num_results += root_card.get_num_children()
-    st.markdown("##### Found " + str(num_results) + " results")
+    st.markdown(format_num_results(root_cards_list))
 
     # Print root cards
     for root_card in root_cards_list:
-        st.markdown("***")
+        render_restaurant_root_card(root_card)
+
 
-        # Card type
-        st.markdown("### " + root_card.card_type.title())
+def render_restaurant_root_card(root_card):
+    st.markdown("***")
+
+    # Card type
+    st.markdown("### " + root_card.card_type.title())
+
+    # Number of children
+    num_cards = root_card.get_num_children()
+    st.markdown(str(num_cards) + " result" + "s" if num_cards > 1 else "")
+
+    # Top ranked results
+    st.markdown("Top ranked result:")
 
-        # Number of children
-        num_cards = root_card.get_num_children()
-        st.markdown(str(num_cards) + " result" + "s" if num_cards > 1 else "")
+    # Score
+    st.markdown("Score: " + str(root_card.top_ranked_score))
 
-        # Top ranked results
-        st.markdown("Top ranked result:")
+    # Preview of review matching the query
+    st.markdown("[" + root_card.top_ranked_result_name + '](' + root_card.top_ranked_result_url + ')')
+    st.write(root_card.top_ranked_review[:150] + "...")
 
-        # Score
-        st.markdown("Score: " + str(root_card.top_ranked_score))
 
-        # Preview of review matching the query
-        st.markdown("[" + root_card.top_ranked_result_name + '](' + root_card.top_ranked_result_url + ')')
-        st.write(root_card.top_ranked_review[:150] + "...")
+def format_num_results(root_cards_list: list) -> str:
+    num_results = 0
+    for root_card in root_cards_list:
+        num_results += root_card.get_num_children()
+    return "##### Found " + str(num_results) + " results"
+
 
+def render_search_stream(root_cards_stream, render_root_card, on_update=None) -> list:
+    """
+    Renders the root Cards while their results arrive, each category in its own placeholder.
+    :param root_cards_stream: yields a root Card each time it gets a new result, 'complete' once all arrived.
+    :param render_root_card: renders a single root Card.
+    :param on_update: called after each update, e.g. to render the other sections ready in the meantime.
+    :return: the list of root Cards, in order of their first result.
+    """
+    header = st.empty()
+    placeholders = dict()
+    root_cards_list = list()
 
-def process_tds_qa(query: str):
+    # Rendering time, without the time spent waiting for the results
+    render_time = 0.0
     with st.spinner('Processing...'):
-        # QA takes some time to process, tell the user
-        answer_list = process_qa(search_query=query, num_results_to_retrieve=TDS_QA_NUM_RESULTS,
-                                 num_results_reader=TDS_QA_NUM_READER)
-        if not answer_list:
-            st.error("Something went wrong with the search engine :(")
-            return
-
-        # Print answer, score, and the article the answer was taken from
-        st.markdown("***" + answer_list[0]["answer"] + "***")
-        st.markdown("Score: " + str(answer_list[0]["score"]))
-        st.markdown("Article: [" + answer_list[0]["card"]["title"] + '](' + answer_list[0]["card"]["url"] + ')')
-        with st.expander("Summary"):
-            st.write(answer_list[0]["card"]["summary"])
-
-        # Print other possible answers
-        if len(answer_list) > 1:
-            with st.expander("Similar results"):
-                for idx, ans in enumerate(answer_list):
-                    if idx == 0:
-                        continue
-                    st.markdown("***")
-                    st.markdown(answer_list[idx]["answer"])
-                    st.markdown("Score: " + str(answer_list[idx]["score"]))
-                    st.markdown("Article: [" + answer_list[0]["card"]["title"] + '](' + answer_list[0]["card"]["url"] + ')')
+        for root_card in root_cards_stream:
+            start = time.perf_counter()
+            placeholder = placeholders.get(root_card.card_type)
+            if placeholder is None:
+                # First result of this category: reserve its place below the previous ones
+                placeholder = st.empty()
+                placeholders[root_card.card_type] = placeholder
+                root_cards_list.append(root_card)
+            header.markdown(format_num_results(root_cards_list))
+            with placeholder.container():
+                render_root_card(root_card)
+            render_time += time.perf_counter() - start
+            if on_update is not None:
+                on_update()
+    observe("render_results", render_time)
 
+    if not root_cards_list:
+        header.error("Something went wrong with the search engine :(")
+    elif not root_cards_stream.complete:
+        st.warning("Some results could not be loaded, search again to get them all")
+    return root_cards_list
 
-def add_card_related_concepts(card):
-    # Build the graph to visualize
+
+def fetch_tds_qa(query: str) -> list:
+    return process_qa(search_query=query, num_results_to_retrieve=TDS_QA_NUM_RESULTS,
+                      num_results_reader=TDS_QA_NUM_READER)
+
+
+def render_tds_qa(answer_list: list):
+    if not answer_list:
+        st.error("Something went wrong with the search engine :(")
+        return
+
+    # Print answer, score, and the article the answer was taken from
+    st.markdown("***" + answer_list[0]["answer"] + "***")
+    st.markdown("Score: " + str(answer_list[0]["score"]))
+    st.markdown("Article: [" + answer_list[0]["card"]["title"] + '](' + answer_list[0]["card"]["url"] + ')')
+    with st.expander("Summary"):
+        st.write(answer_list[0]["card"]["summary"])
+
+    # Print other possible answers
+    if len(answer_list) > 1:
+        with st.expander("Similar results"):
+            for idx, ans in enumerate(answer_list):
+                if idx == 0:
+                    continue
+                st.markdown("***")
+                st.markdown(answer_list[idx]["answer"])
+                st.markdown("Score: " + str(answer_list[idx]["score"]))
+                st.markdown("Article: [" + answer_list[0]["card"]["title"] + '](' + answer_list[0]["card"]["url"] + ')')
+
+
+def get_concept_graph() -> ConceptGraph:
+    """
+    Returns the graph of the concepts of the Cards opened in this session.
+    :return: the concept graph.
+    """
+    if "concept_graph" not in st.session_state:
+        st.session_state.concept_graph = ConceptGraph()
+    return st.session_state.concept_graph
+
+
+def build_agraph(graph: ConceptGraph) -> tuple:
+    """
+    Builds the agraph nodes and edges of a concept graph, once per version of the graph:
+    the reruns that do not open a new Card, like the ones caused by clicks in the graph, reuse it.
+    :param graph: the concept graph.
+    :return: the nodes and the edges.
+    """
+    from streamlit_agraph import (Edge, Node)
+
+    last_build = st.session_state.get("concept_agraph")
+    if last_build is not None and last_build[0] == graph.version:
+        return last_build[1], last_build[2]
+
+    # Too many nodes make the graph unreadable and slow to lay out, keep the most connected ones
+    node_ids = graph.get_top_nodes(CONCEPT_GRAPH_MAX_NODES)
     nodes = list()
+    for node_id in node_ids:
+        if graph.nodes[node_id] == QUERY_NODE:
+            nodes.append(Node(id=node_id, size=400, symbolType='square'))
+        else:
+            nodes.append(Node(id=node_id, size=400))
+
+    # Queries lead to categories, categories to concepts, thicker for more Cards
     edges = list()
+    for source, target, weight in graph.get_edges(node_ids):
+        if graph.nodes[source] == QUERY_NODE:
+            edges.append(Edge(source=source, label="result", target=target, type="STRAIGHT", value=weight))
+        else:
+            edges.append(Edge(source=source, target=target, type="CURVE_SMOOTH", value=weight))
+
+    st.session_state.concept_agraph = (graph.version, nodes, edges)
+    return nodes, edges
+
+
+def get_agraph_config():
+    """
+    Returns the agraph config, the same for every version of the concept graph.
+    :return: the config.
+    """
+    from streamlit_agraph import Config
+
+    if "concept_agraph_config" not in st.session_state:
+        st.session_state.concept_agraph_config = Config(width=700,
+                                                        height=500,
+                                                        directed=True,
+                                                        nodeHighlightBehavior=True,
+                                                        highlightColor="#F7A7A6",  # or "blue"
+                                                        collapsible=False,
+                                                        node={'labelProperty': 'label'},
+                                                        link={'labelProperty': 'label', 'renderLabel': True},
+                                                        node_color="blue"
+                                                        # **kwargs e.g. node_size=1000 or node_color="blue"
+                                                        )
+    return st.session_state.concept_agraph_config
+
+
+def add_card_related_concepts(card):
+    # Only opened Cards show a graph, other reruns skip the import
+    from streamlit_agraph import agraph
 
-    # Current node
-    target_id = card.get_parent().card_type
-    nodes.append(Node(id=target_id, size=400))
-
-    # Parent node
-    parent_id = "Query: " + card.search_query
-    nodes.append(Node(id=parent_id, size=400, symbolType='square'))
-
-    # Connect parent to current node
-    edges.append(Edge(source=parent_id,
-                      label="result",
-                      target=target_id,
-                      type="STRAIGHT")
-                 )
-
-    # Connect all concepts to the Root card
-    for entity in card.related_concepts:
-        nodes.append(Node(id=entity["title"], size=400))
-        edges.append(Edge(source=target_id,
-                          # label="relates",
-                          target=entity["title"],
-                          type="CURVE_SMOOTH")
-                     )
-
-    # Build the graph
-    config = Config(width=700,
-                    height=500,
-                    directed=True,
-                    nodeHighlightBehavior=True,
-                    highlightColor="#F7A7A6",  # or "blue"
-                    collapsible=False,
-                    node={'labelProperty': 'label'},
-                    link={'labelProperty': 'label', 'renderLabel': True},
-                    node_color="blue"
-                    # **kwargs e.g. node_size=1000 or node_color="blue"
-                    )
+    # Add the concepts of this Card to the ones of the Cards opened before,
+    # unless the Wikifier failed: the Card is merged when opened again
+    graph = get_concept_graph()
+    if card.related_concepts:
+        graph.add_card(card.get_unique_id(), card.search_query, card.get_parent().card_type,
+                       [entity["title"] for entity in card.related_concepts])
 
     # Visualize the graph
     with st.expander("Related concepts"):
-        return_value = agraph(nodes=nodes, edges=edges, config=config)
+        if graph.nodes:
+            nodes, edges = build_agraph(graph)
+            return_value = agraph(nodes=nodes, edges=edges, config=get_agraph_config())
+            if len(nodes) < len(graph.nodes):
+                st.caption("Showing the " + str(len(nodes)) + " most connected of " + str(len(graph.nodes)) +
+                           " nodes")
 
         st.markdown("###### Concepts:")
         for entity in card.related_concepts:
             st.markdown("[" + entity["title"] + "](" + entity["url"] + ")")
 
 
+def get_last_run_result(name: str, signature: tuple):
+    """
+    Returns the result computed by a previous run of the script for the same request.
+    Streamlit reruns the whole script on every widget interaction: when the
+    request did not change, its result is rendered again instead of fetched again.
+    :param name: the name of the request.
+    :param signature: the query and the parameters of the request.
+    :return: the previous result, or None if the request changed.
+    """
+    last_run = st.session_state.get("last_run_" + name)
+    if last_run is not None and last_run[0] == signature:
+        return last_run[1]
+    return None
+
+
+def set_last_run_result(name: str, signature: tuple, result):
+    """
+    Stores the result of a request for the next runs of the script.
+    :param name: the name of the request.
+    :param signature: the query and the parameters of the request.
+    :param result: the result of the request.
+    :return: None
+    """
+    st.session_state["last_run_" + name] = (signature, result)
+
+
+def get_session_key() -> str:
+    """
+    Returns a key identifying the current user session.
+    :return: the session key.
+    """
+    if "session_key" not in st.session_state:
+        st.session_state.session_key = str(uuid.uuid4())
+    return st.session_state.session_key
+
+
+def render_debug_panel():
+    """
+    Shows the latency of each stage and the cache counters of this process in the sidebar.
+    :return: None
+    """
+    with st.sidebar.expander("Performance"):
+        st.markdown("###### Latency by stage (ms)")
+        st.table(get_stage_summary())
+        st.markdown("###### Caches and backend calls")
+        for name, _, _, labels, value in collect_samples():
+            label = ', '.join(str(value) for value in labels.values())
+            st.markdown("`" + name + ("{" + label + "}" if label else "") + "`: " + str(round(value, 3)))
+
+
+def set_page(page_key: str, page: int):
+    st.session_state[page_key] = page
+
+
+def render_pagination(name: str, num_items: int, owner) -> tuple:
+    """
+    Shows the page controls of a list of Cards and returns the page to display.
+    The page size and the page cursor are kept in the session state,
+    the cursor goes back to the first page when the list changes.
+    :param name: the name of the list, prefix of its session state keys.
+    :param num_items: the number of Cards in the list.
+    :param owner: identifies the content and the order of the list.
+    :return: the offset and the size of the page.
+    """
+    page_size = st.selectbox("Results per page", EXPLORE_PAGE_SIZES, index=EXPLORE_PAGE_SIZES.index(EXPLORE_PAGE_SIZE),
+                             key=name + "_page_size")
+    page_key = name + "_page"
+    if st.session_state.get(name + "_page_owner") != (owner, page_size):
+        st.session_state[name + "_page_owner"] = (owner, page_size)
+        st.session_state[page_key] = 0
+
+    num_pages = max(1, -(-num_items // page_size))
+    page = min(st.session_state[page_key], num_pages - 1)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.button("Previous", key=name + "_previous", disabled=page == 0, on_click=set_page,
+                  args=(page_key, page - 1))
+    with col2:
+        st.markdown("Page " + str(page + 1) + " of " + str(num_pages))
+    with col3:
+        st.button("Next", key=name + "_next", disabled=page == num_pages - 1, on_click=set_page,
+                  args=(page_key, page + 1))
+    return page * page_size, page_size
+
+
 def handle_invalid_query():
     """
     Handles an invalid user query.
@@ -200,6 +414,7 @@ def handle_invalid_query():
 # ------- Restaurant ------ #
 
 
+@timed("handle_restaurant_query")
 def handle_restaurant_query(query: str):
     """
     Handles the bonus 'restaurant' queries.
@@ -210,46 +425,55 @@ def handle_restaurant_query(query: str):
     process_restaurant_search(query)
 
 
+@timed("handle_explore_restaurant_query")
 def handle_explore_restaurant_query(query: str):
     """
     Handles an Explore Restaurant Root Card query.
     :param query: the query.
     :return: None
     """
-    if "res_root_cards_list" not in st.session_state:
+    if "res_root_cards_index" not in st.session_state:
         st.error("No Cards to explore, have you typed a query?")
         return
 
-    # Get the current list of root Cards
-    root_cards_list = st.session_state.res_root_cards_list
+    # Get the index over the current list of root Cards
+    root_cards_index = st.session_state.res_root_cards_index
 
     # Get the root selected by the user
-    cards_list = select_root_and_get_cards_list(query, root_cards_list)
-    if cards_list is None:
+    root_card = select_root_card(query, root_cards_index)
+    if root_card is None:
         st.error("Something went wrong while opening Cards :(")
+        suggestions = suggest_root_card_types(query, root_cards_index)
+        if suggestions:
+            st.markdown("Did you mean: " + ', '.join(suggestions) + "?")
         return
 
+    # Rank the Cards by the key chosen by the user
+    sort_key = st.selectbox("Sort by", root_card.SORT_KEYS, format_func=lambda key: key.name.lower(), key="res_sort_key")
+    root_card.set_sort_key(sort_key)
+
+    # Only the current page is rendered
+    offset, page_size = render_pagination("res_explore", root_card.get_num_children(),
+                                          (root_card.get_unique_id(), sort_key))
+
     # Process each Card
-    for idx, card in enumerate(cards_list):
+    for idx, card in enumerate(root_card.get_children(offset, page_size), start=offset):
         st.markdown("***")
 
         # Card title
-        st.markdown('##### ' + card.card_meta["name"])
+        st.markdown('##### ' + card.title)
 
         # Card info
-        st.markdown("[" + card.info["url"][:40] + "...](" + card.info["url"] + ")")
-        st.markdown("Rating: " + str(card.info["rating"]))
-        st.markdown("Price: " + str(card.info["price"]))
-        st.markdown("Location: " + card.info["city"])
-
-        # Other information
-        with st.expander("More info"):
-            st.markdown("Reviews: " + str(card.info["num_reviews"]))
-            categories = card.info["categories"]
-            st.markdown("Restaurant type: " + ', '.join(categories))
-
-        # Context
-        with st.expander("Context"):
+        st.markdown("[" + card.url[:40] + "...](" + card.url + ")")
+        st.markdown("Rating: " + str(card.rating))
+        st.markdown("Price: " + str(card.price))
+        st.markdown("Location: " + card.city)
+
+        # Other information and context, rendered only when asked for.
+        # Duplicate results have the same id, their position tells them apart
+        if st.checkbox("Show details", key="res_details_" + card.get_unique_id() + "_" + str(idx)):
+            st.markdown("Reviews: " + str(card.num_reviews))
+            st.markdown("Restaurant type: " + ', '.join(card.categories))
             st.markdown("**Query**: " + card.search_query)
             st.write(card.context)
 
@@ -265,6 +489,7 @@ def handle_open_restaurant_query(query: str):
 # ------- TDS ------ #
 
 
+@timed("handle_tds_query")
 def handle_tds_query(query: str):
     """
     Handles a standard TDS query.
@@ -273,69 +498,126 @@ def handle_tds_query(query: str):
     :param query: the TDS query.
     :return: None
     """
-    if is_tds_qa(query):
-        # Answer query first
-        process_tds_qa(query)
-
-    # Process standard TDS query
-    process_tds_search(query)
-
-
+    # The answer goes above the search results
+    qa_container = st.container() if is_tds_qa(query) else None
+    search_container = st.container()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Send the QA call in the background while the search results stream in
+        qa_signature = (query, TDS_QA_NUM_RESULTS, TDS_QA_NUM_READER)
+        qa_future = None
+        if qa_container is not None:
+            answer_list = get_last_run_result("tds_qa", qa_signature)
+            if answer_list is not None:
+                # Same request as the previous run: render only
+                with qa_container:
+                    render_tds_qa(answer_list)
+            else:
+                qa_future = executor.submit(propagate_trace(fetch_tds_qa), query)
+
+        def render_qa_if_ready(block: bool = False):
+            nonlocal qa_future
+            if qa_future is None or not (block or qa_future.done()):
+                return
+            answer_list = qa_future.result()
+            qa_future = None
+            if answer_list:
+                set_last_run_result("tds_qa", qa_signature, answer_list)
+            with qa_container:
+                render_tds_qa(answer_list)
+
+        search_signature = (query, TDS_SEARCH_ENGINE_TYPE, TDS_NUM_RESULTS)
+        root_cards_list = get_last_run_result("tds_search", search_signature)
+        with search_container:
+            if root_cards_list is not None:
+                render_tds_search(root_cards_list)
+            else:
+                # Show each category as soon as its first result arrives
+                root_cards_stream = stream_tds_search(query)
+                root_cards_list = render_search_stream(root_cards_stream, render_tds_root_card,
+                                                       on_update=render_qa_if_ready)
+
+                # A partial result would be replayed by the next runs: keep it only once complete
+                if root_cards_list and root_cards_stream.complete:
+                    set_last_run_result("tds_search", search_signature, root_cards_list)
+                    store_tds_search(root_cards_list)
+
+        if qa_future is not None:
+            with st.spinner('Processing...'):
+                render_qa_if_ready(block=True)
+
+
+@timed("handle_explore_query")
 def handle_explore_query(query: str):
     """
     Handles an Explore Root TDS Card query.
     :param query: the query.
     :return: None
     """
-    if "root_cards_list" not in st.session_state:
+    if "root_cards_index" not in st.session_state:
         st.error("No Cards to explore, have you typed a query?")
         return
 
-    # Get the current list of root Cards
-    root_cards_list = st.session_state.root_cards_list
+    # Get the index over the current list of root Cards
+    root_cards_index = st.session_state.root_cards_index
 
     # Get the root selected by the user
-    cards_list = select_root_and_get_cards_list(query, root_cards_list)
-    if cards_list is None:
+    root_card = select_root_card(query, root_cards_index)
+    if root_card is None:
         st.error("Something went wrong while opening Cards :(")
+        suggestions = suggest_root_card_types(query, root_cards_index)
+        if suggestions:
+            st.markdown("Did you mean: " + ', '.join(suggestions) + "?")
         return
 
+    # Rank the Cards by the key chosen by the user
+    sort_key = st.selectbox("Sort by", root_card.SORT_KEYS, format_func=lambda key: key.name.lower(), key="tds_sort_key")
+    root_card.set_sort_key(sort_key)
+    cards_list = root_card.get_children()
+
     # Cache the current list of Cards in the global state
     st.session_state.cards_list = cards_list
 
+    # Only the current page is rendered, and only its images are loaded
+    offset, page_size = render_pagination("tds_explore", len(cards_list), (root_card.get_unique_id(), sort_key))
+    page_cards = cards_list[offset:offset + page_size]
+
     # Process each Card
-    for idx, card in enumerate(cards_list):
+    for idx, card in enumerate(page_cards, start=offset):
         st.markdown("***")
 
         # Card title and index
-        st.markdown('##### ' + card.card_data["title"])
+        st.markdown('##### ' + card.title)
         st.markdown("###### Index: " + str(idx))
 
         # Add 2 columns: Card image |  Card MetaData
         col1, col2 = st.columns(2)
         with col1:
+            # Results without an image have an empty image URL
             image_url = card.image
-            st.image(
-                image_url,
-                width=200,
-            )
+            if image_url:
+                st.image(
+                    image_url,
+                    width=200,
+                )
         with col2:
-            st.markdown("[" + card.card_data["url"][:40] + "...](" + card.card_data["url"] + ")")
-            st.markdown("Votes: " + str(card.card_data["num_votes"]))
-            st.markdown("About: " + card.card_data["concept"])
-            st.markdown('Date: ' + card.card_data["date"])
-            card_topics = card.card_data["topics"]
-            if card_topics:
-                topics_list = list()
-                for topic in card_topics:
-                    topics_list.append(topic['topic'])
-                st.markdown("Keywords: " + ', '.join(topics_list))
-
-        # Article summary
-        with st.expander("Summary"):
-            st.write(card.card_data["summary"])
+            st.markdown("[" + card.url[:40] + "...](" + card.url + ")")
+            st.markdown("Votes: " + str(card.num_votes))
+            st.markdown("About: " + card.concept)
+            st.markdown('Date: ' + card.date)
+
+        # Keywords and article summary, rendered only when asked for.
+        # Duplicate results have the same id, their position tells them apart
+        if st.checkbox("Show details", key="tds_details_" + card.get_unique_id() + "_" + str(idx)):
+            if card.topics:
+                st.markdown("Keywords: " + ', '.join(card.topics))
+            st.write(card.summary)
 
+    # The user almost always opens one of the Cards on screen next: open the top ones in the background
+    get_prefetcher().prefetch(get_session_key(), page_cards)
 
+
+@timed("handle_open_query")
 def handle_open_query(query: str):
     """
     Handles an Open Card query.
@@ -347,52 +629,51 @@ def handle_open_query(query: str):
         return
     cards_list = st.session_state.cards_list
 
-    # Get the Card to open and open it
-    card = select_card_to_open(query, cards_list)
+    # Get the Card to open
+    card = get_card_to_open(query, cards_list)
+    if card is None:
+        st.error("Something went wrong while opening the Card :(")
+        return
+
+    # Reuse the background prefetch of this Card, if any, and open it
+    get_prefetcher().wait(card)
+    card.open_card()
 
     # Print the Card
     st.markdown("***")
-    st.markdown("[" + card.card_data["url"][:40] + "...](" + card.card_data["url"] + ")")
-    st.markdown("#### " + card.card_data["title"])
+    st.markdown("[" + card.url[:40] + "...](" + card.url + ")")
+    st.markdown("#### " + card.title)
 
     # Summary and about
-    st.write(card.card_data["summary"].replace('. ', '.\n'))
-    st.markdown("**About**: " + card.card_data["concept"])
+    st.write(card.summary.replace('. ', '.\n'))
+    st.markdown("**About**: " + card.concept)
 
     # Card MetaData
     with st.expander("MetaData"):
         col1, col2 = st.columns(2)
         with col1:
+            # Results without an image have an empty image URL
             image_url = card.image
-            st.image(
-                image_url,
-                width=250,
-            )
+            if image_url:
+                st.image(
+                    image_url,
+                    width=250,
+                )
         with col2:
             st.markdown('Type: ' + card.get_parent().card_type)
             st.markdown('Score: ' + str(card.score))
-            st.markdown('Date: ' + card.card_data["date"])
-            st.markdown('Has code: ' + card.card_data["meta"]["code"])
-            st.markdown('Length: ' + card.card_data["meta"]["length"])
-            st.markdown('Votes: ' + str(card.card_data["num_votes"]))
-            st.markdown('Responses: ' + str(card.card_data["num_responses"]))
+            st.markdown('Date: ' + card.date)
+            st.markdown('Has code: ' + card.has_code)
+            st.markdown('Length: ' + card.length)
+            st.markdown('Votes: ' + str(card.num_votes))
+            st.markdown('Responses: ' + str(card.num_responses))
 
     # Tag this Card
     with st.expander("Topics and Tags"):
-        topics = card.card_data["topics"]
-        tags_rank = card.card_data["tags_rank"]
-
-        topics_list = list()
-        for topic in topics:
-            topics_list.append(topic['topic'])
-        if topics_list:
-            st.markdown("Topics: " + ', '.join(topics_list))
-
-        tags_list = list()
-        for tag_rank in tags_rank:
-            tags_list.append(tag_rank["word"])
-        if tags_list:
-            st.markdown("Tags: " + ', '.join(tags_list))
+        if card.topics:
+            st.markdown("Topics: " + ', '.join(card.topics))
+        if card.tags:
+            st.markdown("Tags: " + ', '.join(card.tags))
 
     # Related concepts
     add_card_related_concepts(card)
@@ -405,6 +686,17 @@ def run():
 
     # Switch action based on query
     query_type = get_query_type(input_query)
+
+    # Tag the log lines of this run, including the ones of the backend calls
+    new_trace_id()
+    if query_type is not QueryType.EMPTY_QUERY:
+        logger.info("Handling %s: %s", query_type.name.lower(), input_query)
+
+    # Stop prefetching Cards the user is not going to open
+    if input_query != st.session_state.get("last_query") and query_type is not QueryType.OPEN_QUERY:
+        get_prefetcher().cancel(get_session_key())
+    st.session_state.last_query = input_query
+
     if query_type is QueryType.EMPTY_QUERY:
         # Nothing to do
         pass
@@ -431,5 +723,13 @@ if __name__ == "__main__":
     # Prepare layout
     prepare_layout()
 
+    # Expose the metrics to Prometheus, once per process
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+
     # Run the app
     run()
+
+    # Show the metrics, including the ones of this run
+    if METRICS_DEBUG_PANEL:
+        render_debug_panel()
@@ -0,0 +1,68 @@
+"""
+Measures the memory retained by the Card objects of 1,000 search results, twice:
+with the decoded payload built beforehand and still held elsewhere (e.g. by the results cache),
+only what the Cards add is counted; with the payload decoded from the response body and then
+dropped, everything the Cards keep alive is counted.
+
+    python -m benchmarks.bench_card_memory --num-cards 1000
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+from benchmarks.payloads import (make_restaurant_payload, make_tds_search_payload)
+from src.card_utils import (merge_cards, merge_restaurant_cards)
+from src.json_codec import (decode_restaurant_response, decode_search_response)
+from src.restaurant_card import RestaurantCard
+from src.tds_card import TDSCard
+
+
+def build_tds_tree(results: list) -> list:
+    cards_collection = dict()
+    for res in results:
+        cards_collection.setdefault(res["category"], list()).append(TDSCard("query", res))
+    return [merge_cards(key, card_list) for key, card_list in cards_collection.items()]
+
+
+def build_restaurant_tree(results: list) -> list:
+    cards_collection = dict()
+    for res in results:
+        cards_collection.setdefault(res["info"]["categories"][0], list()).append(RestaurantCard("query", res))
+    return [merge_restaurant_cards(key, card_list) for key, card_list in cards_collection.items()]
+
+
+def measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tree = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del tree
+    return after - before
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-cards", type=int, default=1000)
+    args = parser.parse_args()
+
+    tds_payload = make_tds_search_payload(args.num_cards)
+    restaurant_payload = make_restaurant_payload(args.num_cards)
+    tds_raw = json.dumps(tds_payload).encode()
+    restaurant_raw = json.dumps(restaurant_payload).encode()
+
+    scale = 1000 / args.num_cards / 1024
+    print("KB per 1,000 cards   payload held   payload dropped")
+    print("TDS cards:           %12.1f   %15.1f" %
+          (measure(lambda: build_tds_tree(tds_payload["result"])) * scale,
+           measure(lambda: build_tds_tree(decode_search_response(tds_raw)["result"])) * scale))
+    print("Restaurant cards:    %12.1f   %15.1f" %
+          (measure(lambda: build_restaurant_tree(restaurant_payload["result"])) * scale,
+           measure(lambda: build_restaurant_tree(decode_restaurant_response(restaurant_raw)["result"])) * scale))
+
+
+if __name__ == "__main__":
+    main()
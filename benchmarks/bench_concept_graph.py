@@ -0,0 +1,51 @@
+"""
+Measures merging opened Cards into the concept graph and pruning it to its most connected nodes.
+Exits with an error if a concept named like its category adds an edge or degree to the category.
+
+    python -m benchmarks.bench_concept_graph --num-cards 500 --num-concepts 10
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+
+from src.concept_graph import ConceptGraph
+from src.const import CONCEPT_GRAPH_MAX_NODES
+
+_CATEGORIES = ["how to", "article", "tutorial", "opinion", "news", "guide"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-cards", type=int, default=500)
+    parser.add_argument("--num-concepts", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    graph = ConceptGraph()
+    timings = list()
+    for idx in range(args.num_cards):
+        concepts = ["Concept " + str(rng.randrange(5 * args.num_concepts)) for _ in range(args.num_concepts)]
+        start = time.perf_counter()
+        graph.add_card("card-" + str(idx), "query " + str(idx % 50), rng.choice(_CATEGORIES), concepts)
+        timings.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    top_nodes = graph.get_top_nodes(CONCEPT_GRAPH_MAX_NODES)
+    graph.get_edges(top_nodes)
+    prune_time = (time.perf_counter() - start) * 1000
+    print("%d cards: %d nodes, %d edges" % (args.num_cards, len(graph.nodes), len(graph.edges)))
+    print("  add_card median %.3f ms, top %d nodes and their edges %.3f ms" %
+          (statistics.median(timings), CONCEPT_GRAPH_MAX_NODES, prune_time))
+
+    # A concept named like its category must not loop back to it
+    graph = ConceptGraph()
+    graph.add_card("card", "transformers", "tutorial", ["tutorial", "PyTorch"])
+    if ("tutorial", "tutorial") in graph.edges or graph.get_degree("tutorial") != 2:
+        print("concept named like its category: self-loop added")
+        sys.exit(1)
+    print("concept named like its category: no self-loop")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Measures the local dense index: exact and IVF searches, float16 and int8 vectors,
+with their recall against an exact float32 search.
+
+    python -m benchmarks.bench_dense_index --num-docs 50000 --dim 768
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from src.dense_index import (DenseIndex, build_dense_index)
+
+
+def make_embeddings(num_docs: int, dim: int, num_topics: int, seed: int = 0) -> tuple:
+    """
+    Article and query embeddings gathered around topics, like the ones of a trained encoder.
+    """
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((num_topics, dim)).astype(np.float32)
+    doc_topics = rng.integers(num_topics, size=num_docs)
+    embeddings = topics[doc_topics] + 0.8 * rng.standard_normal((num_docs, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings, topics
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-docs", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--num-queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=30)
+    parser.add_argument("--nlist", type=int, default=256)
+    args = parser.parse_args()
+
+    embeddings, topics = make_embeddings(args.num_docs, args.dim, num_topics=args.nlist)
+    rng = np.random.default_rng(1)
+    queries = topics[rng.integers(len(topics), size=args.num_queries)]
+    queries = queries + 0.8 * rng.standard_normal(queries.shape).astype(np.float32)
+    truth = [set(np.argsort(-(embeddings @ query))[:args.k]) for query in queries]
+    docs = [{"url": str(idx)} for idx in range(args.num_docs)]
+
+    for dtype in ("float16", "int8"):
+        index_dir = tempfile.mkdtemp(prefix="search_app_dense_")
+        start = time.perf_counter()
+        build_dense_index(docs, embeddings, index_dir, dtype=dtype, nlist=args.nlist)
+        vectors_size = os.path.getsize(os.path.join(index_dir, "dense_vectors.npy"))
+        print("%s: built in %.1f s, vectors %.1f MB" % (dtype, time.perf_counter() - start, vectors_size / 2 ** 20))
+        index = DenseIndex(index_dir)
+
+        # All the queries at once, as one batch
+        start = time.perf_counter()
+        index.search(queries, args.k)
+        print("  exact, batch of %d: %.2f ms per query" % (args.num_queries,
+                                                         (time.perf_counter() - start) * 1000 / args.num_queries))
+
+        for nprobe in (0, 1, 4, 16, 64):
+            timings = list()
+            recalls = list()
+            for query, relevant in zip(queries, truth):
+                start = time.perf_counter()
+                hits = index.search(query, args.k, nprobe=nprobe)[0]
+                timings.append((time.perf_counter() - start) * 1000)
+                recalls.append(len(relevant.intersection(doc_id for doc_id, _ in hits)) / args.k)
+            print("  %-10s median %7.2f ms  recall@%d %.3f" % ("exact" if not nprobe else "nprobe=" + str(nprobe),
+                                                              statistics.median(timings), args.k,
+                                                              statistics.fmean(recalls)))
+
+
+if __name__ == "__main__":
+    main()
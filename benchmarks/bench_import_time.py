@@ -0,0 +1,82 @@
+"""
+Measures the cold start of the app: the time to import its dependencies in a fresh interpreter,
+with python -X importtime. Fails if the median exceeds the budget, or if a module that should
+only be imported at first use is imported at startup.
+
+    python -m benchmarks.bench_import_time --budget-ms 600
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed by some queries: opened Cards, local indexes, searches grouping their results at once
+LAZY_MODULES = ("numpy", "streamlit_agraph", "src.bm25_index", "src.dense_index", "src.doc_store", "src.result_set")
+
+
+def import_times(module: str) -> dict:
+    """
+    Imports a module in a fresh interpreter.
+    :param module: the module to import.
+    :return: a dict module name -> (self time, cumulative time) in milliseconds, for the module
+    and the modules it imported.
+    """
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stderr
+    times = dict()
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+
+        # The modules imported at interpreter start come first, each top-level one after its own imports
+        if not name.startswith("  ") and name.strip() != module:
+            times = dict()
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=600.0,
+                        help="maximum median time to import the dependencies of the module")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.repeat)]
+
+    # The body of the module itself is left out: importing the app outside of streamlit run
+    # makes its first Streamlit call print a warning, which is slow and not part of a real start
+    timings = sorted(run[args.module][1] - run[args.module][0] for run in runs)
+    median = statistics.median(timings)
+    print("%s: dependencies imported in median %.1f ms, min %.1f ms (budget %.1f ms)" %
+          (args.module, median, timings[0], args.budget_ms))
+
+    # Slowest top-level packages of the median run
+    run = runs[[run[args.module][1] - run[args.module][0] for run in runs].index(timings[len(timings) // 2])]
+    packages = dict()
+    for name, (_, cumulative) in run.items():
+        if name != args.module:
+            package = name.split(".")[0]
+            packages[package] = max(packages.get(package, 0.0), cumulative)
+    for package, cumulative in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print("  %-32s %8.1f ms" % (package, cumulative))
+
+    ok = median <= args.budget_ms
+    if not ok:
+        print("over budget")
+    eager = [module for module in LAZY_MODULES if module in run]
+    if eager:
+        print("imported at startup: " + ", ".join(eager))
+        ok = False
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares the previous decode path, json.loads(response.text), with the bytes decoders of src/json_codec.py.
+Exits with an error if a restaurant without categories is not skipped.
+
+    python -m benchmarks.bench_json_decode --repeat 200
+"""
+import argparse
+import json
+import sys
+import timeit
+
+import requests
+
+from benchmarks.payloads import (make_qa_payload, make_restaurant_payload, make_tds_search_payload, to_bytes)
+from src.json_codec import (JSON_BACKEND, decode_qa_response, decode_restaurant_response, decode_search_response)
+
+
+def make_response(raw: bytes) -> requests.Response:
+    # Same headers as the backend: no charset, so requests guesses the encoding of .text
+    response = requests.Response()
+    response.status_code = 200
+    response.headers["Content-Type"] = "application/json"
+    response._content = raw
+    return response
+
+
+def text_path(raw: bytes):
+    return json.loads(make_response(raw).text)
+
+
+def bytes_stdlib_path(raw: bytes):
+    return json.loads(make_response(raw).content)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    cases = [
+        ("search (30 results)", to_bytes(make_tds_search_payload(30)), decode_search_response),
+        ("qa (3 answers)", to_bytes(make_qa_payload(3)), decode_qa_response),
+        ("restaurant (30 results)", to_bytes(make_restaurant_payload(30)), decode_restaurant_response),
+    ]
+
+    print("backend: " + JSON_BACKEND)
+    for name, raw, decoder in cases:
+        assert decoder(make_response(raw).content) == text_path(raw)
+        text_time = timeit.timeit(lambda: text_path(raw), number=args.repeat) / args.repeat
+        stdlib_time = timeit.timeit(lambda: bytes_stdlib_path(raw), number=args.repeat) / args.repeat
+        codec_time = timeit.timeit(lambda: decoder(make_response(raw).content), number=args.repeat) / args.repeat
+        print("%-24s %7.1f KB  json.loads(text): %8.3f ms  json.loads(bytes): %8.3f ms  "
+              "json_codec: %8.3f ms  (%.1fx)" % (name, len(raw) / 1024, text_time * 1000, stdlib_time * 1000,
+                                                 codec_time * 1000, text_time / codec_time))
+
+    # A restaurant without categories cannot be grouped: it must be skipped, not kept
+    payload = make_restaurant_payload(3)
+    payload["result"][1]["info"]["categories"] = list()
+    result = decode_restaurant_response(to_bytes(payload))["result"]
+    if len(result) != 2 or any(not item["info"]["categories"] for item in result):
+        print("restaurant without categories: not skipped")
+        sys.exit(1)
+    print("restaurant without categories: skipped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Measures the local BM25 engine: MaxScore top-k against scoring every posting of the query terms.
+Also checks that both return the same top-k and that the postings varints decode to what was encoded,
+and exits with an error otherwise.
+
+    python -m benchmarks.bench_local_bm25 --num-docs 20000
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.payloads import (make_corpus, make_corpus_queries)
+from src.bm25_index import (BM25Index, _encode_varint, build_bm25_index, decode_varints, tokenize)
+
+
+def exhaustive_search(index: BM25Index, query: str, k: int) -> list:
+    doc_ids = list()
+    scores = list()
+    for term in set(tokenize(query)):
+        if term not in index._vocabulary:
+            continue
+        term_doc_ids, tfs = index._decode_blocks(term, np.arange(index._vocabulary[term][1]))
+        doc_ids.append(term_doc_ids)
+        scores.append(index._score(term, term_doc_ids, tfs))
+    if not doc_ids:
+        return list()
+    unique_doc_ids, inverse = np.unique(np.concatenate(doc_ids), return_inverse=True)
+    total_scores = np.bincount(inverse, weights=np.concatenate(scores))
+    top = np.lexsort((unique_doc_ids, -total_scores))[:k]
+    return [(int(unique_doc_ids[idx]), float(total_scores[idx])) for idx in top]
+
+
+def check_varints(num_values: int = 100000, seed: int = 0) -> int:
+    """
+    Encodes values of every varint length, then decodes them.
+    :return: the number of values decoded wrongly.
+    """
+    rng = random.Random(seed)
+    values = [0, 1, 0x7f, 0x80, 0x3fff, 0x4000, 2 ** 21 - 1, 2 ** 21, 2 ** 28, 2 ** 32 - 1, 2 ** 35, 2 ** 62]
+    values += [rng.getrandbits(rng.randint(1, 62)) for _ in range(num_values)]
+    data = bytearray()
+    for value in values:
+        _encode_varint(value, data)
+    decoded = decode_varints(np.frombuffer(bytes(data), dtype=np.uint8))
+    if len(decoded) != len(values):
+        return len(values)
+    return int(np.count_nonzero(decoded != np.array(values, dtype=np.int64)))
+
+
+def count_mismatches(index: BM25Index, queries: list, k: int) -> int:
+    """
+    Compares the MaxScore top-k with an exhaustive ranking: same documents, in the same order, with the same scores.
+    :return: the number of queries with a different top-k.
+    """
+    mismatches = 0
+    for query in queries:
+        hits = index.search(query, k)
+        expected = exhaustive_search(index, query, k)
+        if ([doc_id for doc_id, _ in hits] != [doc_id for doc_id, _ in expected] or
+                not np.allclose([score for _, score in hits], [score for _, score in expected])):
+            mismatches += 1
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-docs", type=int, default=20000)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=30)
+    args = parser.parse_args()
+
+    index_dir = tempfile.mkdtemp(prefix="search_app_bm25_")
+    start = time.perf_counter()
+    build_bm25_index(make_corpus(args.num_docs), index_dir)
+    print("indexed %d articles in %.1f s" % (args.num_docs, time.perf_counter() - start))
+
+    index = BM25Index(index_dir)
+    queries = make_corpus_queries(args.num_queries)
+    for name, search in (("maxscore", index.search), ("exhaustive", lambda q, k: exhaustive_search(index, q, k))):
+        timings = list()
+        for query in queries:
+            start = time.perf_counter()
+            search(query, args.k)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        print("%-12s median %6.2f ms  p95 %6.2f ms" % (name, statistics.median(timings),
+                                                       timings[int(len(timings) * 0.95)]))
+
+    # Small k prune the most postings
+    failed = False
+    for k in sorted({1, 10, args.k}):
+        mismatches = count_mismatches(index, queries, k)
+        print("queries with a different top-%d: %d" % (k, mismatches))
+        failed = failed or mismatches > 0
+
+    wrong_varints = check_varints()
+    print("varints decoded wrongly: %d" % wrong_varints)
+    if failed or wrong_varints:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Measures the semantic cache against exact-key caching: hits on variants of the same queries,
+reuse of hand-written paraphrases, and wrong reuse between close but different queries.
+Exits with an error if any near miss is reused, e.g. a query answered from the same query
+with one term less.
+
+    python -m benchmarks.bench_semantic_cache --num-topics 200 --num-variants 5
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from benchmarks.payloads import (NEAR_MISSES, PARAPHRASES, make_query_variants)
+from src.cache import normalize_query
+from src.semantic_cache import SemanticCache
+
+
+def make_cache(threshold: float) -> SemanticCache:
+    return SemanticCache() if threshold is None else SemanticCache(threshold=threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-topics", type=int, default=200)
+    parser.add_argument("--num-variants", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=None)
+    args = parser.parse_args()
+
+    # Stream of variants: each topic is cached on its first miss
+    queries = make_query_variants(args.num_topics, args.num_variants)
+    num_topics = len(set(topic_id for topic_id, _ in queries))
+    exact_cache = dict()
+    exact_hits = 0
+    for topic_id, query in queries:
+        key = normalize_query(query)
+        if key in exact_cache:
+            exact_hits += 1
+        else:
+            exact_cache[key] = topic_id
+
+    semantic_cache = make_cache(args.threshold)
+    semantic_hits = 0
+    wrong_hits = 0
+    timings = list()
+    for topic_id, query in queries:
+        start = time.perf_counter()
+        cached_topic_id = semantic_cache.get("search", query)
+        if cached_topic_id is None:
+            semantic_cache.put("search", query, topic_id)
+        timings.append((time.perf_counter() - start) * 1000)
+        if cached_topic_id is not None:
+            semantic_hits += 1
+            wrong_hits += cached_topic_id != topic_id
+
+    # Every topic misses once at best
+    print("variants: %d queries on %d topics, at best %d hits" % (len(queries), num_topics,
+                                                                 len(queries) - num_topics))
+    print("  exact-key cache: %d hits (%.1f%%)" % (exact_hits, 100.0 * exact_hits / len(queries)))
+    print("  semantic cache:  %d hits (%.1f%%), %d with the results of another topic (%.1f%% of the hits)" %
+          (semantic_hits, 100.0 * semantic_hits / len(queries), wrong_hits,
+           100.0 * wrong_hits / semantic_hits if semantic_hits else 0.0))
+    timings.sort()
+    print("  semantic lookup: median %.3f ms  p95 %.3f ms" % (statistics.median(timings),
+                                                              timings[int(len(timings) * 0.95)]))
+
+    # Held-out paraphrases, both ways: the share answered from the other one
+    reused = 0
+    for first, second in PARAPHRASES:
+        for cached, looked_up in ((first, second), (second, first)):
+            cache = make_cache(args.threshold)
+            cache.put("search", cached, cached)
+            reused += cache.get("search", looked_up) is not None
+    print("paraphrases: %d of %d lookups reused (%.1f%%)" % (reused, 2 * len(PARAPHRASES),
+                                                            50.0 * reused / len(PARAPHRASES)))
+
+    # Near misses, both ways: any reuse is wrong
+    false_reuses = list()
+    for first, second in NEAR_MISSES:
+        for cached, looked_up in ((first, second), (second, first)):
+            cache = make_cache(args.threshold)
+            cache.put("search", cached, cached)
+            if cache.get("search", looked_up) is not None:
+                false_reuses.append((looked_up, cached))
+    print("near misses: %d of %d lookups wrongly reused (%.1f%%)" % (len(false_reuses), 2 * len(NEAR_MISSES),
+                                                                    50.0 * len(false_reuses) / len(NEAR_MISSES)))
+    for looked_up, cached in false_reuses:
+        print("  %r answered with %r" % (looked_up, cached))
+    if false_reuses:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
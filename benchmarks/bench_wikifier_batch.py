@@ -0,0 +1,63 @@
+"""
+Compares sequential Wikifier calls with the batch path against a local stand-in server.
+
+    python -m benchmarks.bench_wikifier_batch --num-cards 15 --latency 0.05
+"""
+import argparse
+import os
+import tempfile
+import time
+
+# Keep the benchmark away from the real caches
+os.environ["SEARCH_APP_CACHE_DIR"] = tempfile.mkdtemp(prefix="search_app_bench_")
+
+from benchmarks.stub_servers import wikifier_server
+from src.card_utils import annotate_cards
+from src.tds_card import TDSCard
+from src.utils import (run_wikifier, run_wikifier_batch)
+
+
+def make_card(idx: int) -> TDSCard:
+    return TDSCard("how to train a transformer", {
+        "score": 0.9,
+        "image": "",
+        "title": "Article " + str(idx),
+        "url": "https://towardsdatascience.com/article-" + str(idx),
+        "category": "how to",
+        "summary_prefix": "Training Transformers with PyTorch",
+        "summary": "Card " + str(idx) + " explains how Hugging Face models are fine tuned on Google Colab.",
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-cards", type=int, default=15)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with wikifier_server(latency=args.latency) as server:
+        endpoint = server.url + "/wikifier"
+        cards = [make_card(idx) for idx in range(args.num_cards)]
+        texts = [card.get_wikifier_text() for card in cards]
+
+        start = time.perf_counter()
+        sequential = [run_wikifier(text, endpoint) for text in texts]
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = run_wikifier_batch(texts, endpoint=endpoint)
+        batch_time = time.perf_counter() - start
+        assert batch == sequential
+
+        annotate_cards(cards, endpoint=endpoint)
+        for card, result in zip(cards, batch):
+            assert [concept["title"] for concept in card.related_concepts] == \
+                   [entity["title"] for entity in result["entities"]]
+
+    print("cards: %d, latency: %.3fs" % (args.num_cards, args.latency))
+    print("sequential: %.3fs" % sequential_time)
+    print("batch:      %.3fs" % batch_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Realistic backend payloads, shaped like the responses of the TDS, QA, Wikifier and restaurant APIs.
+"""
+import json
+import random
+
+_WORDS = ("data science machine learning model training transformer python pandas neural network "
+          "regression classification feature engineering deployment pipeline dataset gradient "
+          "optimization tensorflow pytorch visualization statistics clustering embedding").split()
+
+_CATEGORIES = ["how to", "article", "tutorial", "opinion", "news", "guide"]
+
+_CUISINES = ["American (New)", "Italian", "Mexican", "Bars", "Japanese", "Cafes", "Pizza", "Thai"]
+
+
+def _text(rng: random.Random, num_words: int) -> str:
+    return ' '.join(rng.choice(_WORDS) for _ in range(num_words)).capitalize() + '.'
+
+
+def make_tds_result(rng: random.Random, idx: int) -> dict:
+    title = _text(rng, 8)
+    return {
+        "score": round(rng.uniform(0.5, 1.0), 4),
+        "title": title,
+        "url": "https://towardsdatascience.com/" + title.lower().replace(' ', '-')[:60] + "-" + str(idx),
+        "image": "https://miro.medium.com/max/1200/" + str(rng.getrandbits(64)) + ".jpeg",
+        "category": rng.choice(_CATEGORIES),
+        "concept": rng.choice(_WORDS),
+        "date": "2021-%02d-%02d" % (rng.randint(1, 12), rng.randint(1, 28)),
+        "num_votes": rng.randint(0, 5000),
+        "num_responses": rng.randint(0, 80),
+        "summary_prefix": _text(rng, 12),
+        "summary": ' '.join(_text(rng, 20) for _ in range(12)),
+        "topics": [{"topic": rng.choice(_WORDS), "score": rng.random()} for _ in range(6)],
+        "tags_rank": [{"word": rng.choice(_WORDS), "rank": rank} for rank in range(10)],
+        "meta": {"code": rng.choice(["yes", "no"]), "length": str(rng.randint(3, 25)) + " min"},
+    }
+
+
+def make_tds_search_payload(num_results: int = 30, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {"result": [make_tds_result(rng, idx) for idx in range(num_results)]}
+
+
+def make_qa_payload(num_answers: int = 3, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {"result": [{"answer": _text(rng, 10), "score": rng.random(), "card": make_tds_result(rng, idx)}
+                       for idx in range(num_answers)]}
+
+
+def make_restaurant_result(rng: random.Random, idx: int) -> dict:
+    name = ' '.join(rng.choice(_WORDS) for _ in range(2)).title()
+    return {
+        "score": round(rng.uniform(0.3, 1.0), 4),
+        "meta": {"name": name, "id": str(rng.getrandbits(48))},
+        "context": ' '.join(_text(rng, 15) for _ in range(5)),
+        "info": {
+            "name": name,
+            "url": "https://www.yelp.com/biz/" + name.lower().replace(' ', '-') + "-" + str(idx),
+            "rating": rng.choice([3.0, 3.5, 4.0, 4.5, 5.0]),
+            "price": rng.choice(["$", "$$", "$$$"]),
+            "city": rng.choice(["Austin", "Boston", "Portland"]),
+            "num_reviews": rng.randint(5, 3000),
+            "categories": rng.sample(_CUISINES, 2),
+        },
+    }
+
+
+def make_restaurant_payload(num_results: int = 30, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    return {"result": [make_restaurant_result(rng, idx) for idx in range(num_results)]}
+
+
+def make_wikifier_payload(num_entities: int = 20, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    entities = list()
+    for _ in range(num_entities):
+        title = rng.choice(_WORDS).title()
+        entities.append({"title": title, "label": title.lower(), "url": "https://en.wikipedia.org/wiki/" + title})
+    return {"entities": entities}
+
+
+def to_bytes(payload: dict) -> bytes:
+    return json.dumps(payload).encode('utf-8')
+
+
+def make_corpus(num_docs: int, vocabulary_size: int = 20000, seed: int = 0) -> list:
+    """
+    Articles with a Zipf-distributed vocabulary, like natural text, to build local indexes from.
+    """
+    rng = random.Random(seed)
+    vocabulary = ["w" + str(idx) for idx in range(vocabulary_size)]
+    cum_weights = list()
+    total = 0.0
+    for idx in range(vocabulary_size):
+        total += 1.0 / (idx + 1)
+        cum_weights.append(total)
+
+    corpus = list()
+    for idx in range(num_docs):
+        doc = make_tds_result(rng, idx)
+        del doc["score"]
+        doc["title"] = ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=8))
+        doc["summary"] = ' '.join(rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(50, 300)))
+        corpus.append(doc)
+    return corpus
+
+
+def make_corpus_queries(num_queries: int, vocabulary_size: int = 20000, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    vocabulary = ["w" + str(idx) for idx in range(vocabulary_size)]
+    weights = [1.0 / (idx + 1) for idx in range(vocabulary_size)]
+    return [' '.join(rng.choices(vocabulary, weights=weights, k=rng.randint(2, 6))) for _ in range(num_queries)]
+
+
+# Ways of asking written independently of the filler words of the semantic cache:
+# some of their words are fillers to it, the others make the query differ
+_PHRASINGS = ["{}", "{}", "{} tutorial", "tips on {}", "i'd like to learn {}", "{} explained", "{} for beginners",
+              "could you find {}", "what are good resources on {}", "{}, with code"]
+
+
+def make_query_variants(num_topics: int, num_variants: int, seed: int = 2) -> list:
+    """
+    Queries as users type them: each topic is searched several times with a different casing,
+    punctuation, word order or phrasing. Topics are 3 to 6 words and share words with each other,
+    so some of them are close enough to be taken for one another. Typos and synonyms are left out.
+    :return: a list of (topic id, query), in random order.
+    """
+    rng = random.Random(seed)
+    queries = list()
+    topics = list()
+    for topic_id in range(num_topics):
+        if topics and rng.random() < 0.3:
+            # A close topic: another one with a word replaced
+            words = list(rng.choice(topics))
+            words[rng.randrange(len(words))] = rng.choice([word for word in _WORDS if word not in words])
+        else:
+            words = rng.sample(_WORDS, rng.randint(3, 6))
+        if frozenset(words) in map(frozenset, topics):
+            continue
+        topics.append(words)
+        for _ in range(num_variants):
+            variant = list(words)
+            if rng.random() < 0.3:
+                rng.shuffle(variant)
+            query = rng.choice(_PHRASINGS).format(' '.join(variant))
+            if rng.random() < 0.5:
+                query = query.capitalize()
+            queries.append((topic_id, query + rng.choice(["", "", "?", ".", "!"])))
+    rng.shuffle(queries)
+    return queries
+
+
+# Rephrasings of the same request, written by hand and not derived from the cache normalization
+PARAPHRASES = [
+    ("How to train a transformer model in PyTorch?", "pytorch: training a transformer model, how to"),
+    ("pandas groupby tutorial", "Tutorial on groupby in Pandas"),
+    ("I need an introduction to gradient boosting", "Gradient boosting: an introduction"),
+    ("deploy a model with docker", "Deploying a model with Docker"),
+    ("what is a convolutional neural network", "What's a convolutional neural network?"),
+    ("best practices for feature engineering", "feature engineering best practices"),
+    ("k-means clustering in scikit-learn", "scikit-learn k-means clustering example"),
+    ("explain attention in transformers", "attention in transformers explained"),
+    ("time series forecasting with LSTM", "LSTM for time series forecasting"),
+    ("how to handle missing values in a dataset", "Handling missing values in datasets: how to"),
+]
+
+# Close queries asking for different things: reusing the results of one for the other is wrong
+NEAR_MISSES = [
+    ("c++ tutorial", "c tutorial"),
+    ("C# tutorial", "C++ tutorial"),
+    ("news about python", "new python features"),
+    ("how to deploy a model", "why deploy a model"),
+    ("how to avoid overfitting a model", "how not to avoid overfitting a model"),
+    ("pandas groupby", "pandas merge"),
+    ("python lists vs tuples", "python lists and tuples"),
+    ("R for data science", "data science"),
+    ("tensorflow 1 vs 2", "tensorflow 2"),
+    ("résumé for data scientists", "data scientists"),
+    ("what is bias in machine learning", "what is variance in machine learning"),
+    ("node.js machine learning", "machine learning"),
+    ("optimization model python tensorflow", "optimization model tensorflow"),
+    ("i'd like to learn pandas groupby", "i'd like to learn pandas merge"),
+]
@@ -0,0 +1,43 @@
+"""
+Records responses from the real backends into benchmarks/recordings/, for the stub servers to replay.
+
+    python -m benchmarks.record_payloads "how to train a transformer" "res: cozy italian place"
+"""
+import argparse
+import json
+import os
+
+from benchmarks.stub_servers import RECORDINGS_DIR
+from src.const import *
+from src.transport import post_json
+
+
+def record(name: str, endpoint: str, payload: dict) -> None:
+    result = post_json(endpoint, payload)
+    if not result:
+        print("Failed to record " + name)
+        return
+    os.makedirs(RECORDINGS_DIR, exist_ok=True)
+    with open(os.path.join(RECORDINGS_DIR, name + ".json"), "w") as f:
+        json.dump(result, f)
+    print("Recorded " + name)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("tds_query")
+    parser.add_argument("restaurant_query")
+    args = parser.parse_args()
+
+    search = {"query": args.tds_query, "num_results": TDS_NUM_RESULTS}
+    record("tds_keyword_search", TDS_KEYWORD_SEARCH_ENDPOINT, search)
+    record("tds_dpr_search", TDS_DPR_SEARCH_ENDPOINT, search)
+    record("tds_mixed_search", TDS_MIX_SEARCH_ENDPOINT, search)
+    record("tds_qa_search", TDS_QA_ENDPOINT, {"query": args.tds_query, "num_results": TDS_QA_NUM_RESULTS,
+                                              "num_reader": TDS_QA_NUM_READER})
+    record("res_keyword_search", RESTAURANT_SEARCH_ENDPOINT, {"query": args.restaurant_query, "location_list": [],
+                                                              "num_results": RESTAURANT_NUM_RESULTS})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Offline micro-benchmarks of the search pipeline against local stub backends.
+
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --compare bench.json
+
+Results are written as JSON so they can be compared across commits: with --compare,
+the run fails if a benchmark's median regressed by more than --max-regression.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.payloads import (make_corpus, make_corpus_queries, make_tds_search_payload)
+from benchmarks.stub_servers import (LatencyModel, backend_server)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def measure(fn, repeat: int, warmup: int = 3) -> dict:
+    """
+    Times a function.
+    :param fn: the function to time, called with the iteration number.
+    :param repeat: the number of timed calls.
+    :param warmup: the number of untimed calls first.
+    :return: timing statistics, in milliseconds.
+    """
+    counter = itertools.count()
+    for _ in range(warmup):
+        fn(next(counter))
+    timings = list()
+    for _ in range(repeat):
+        idx = next(counter)
+        start = time.perf_counter()
+        fn(idx)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "repeat": repeat,
+        "mean_ms": statistics.fmean(timings),
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "min_ms": timings[0],
+    }
+
+
+def run(repeat: int) -> dict:
+    # Imported once the environment points the app to the stubs
+    from src.bm25_index import (BM25Index, build_bm25_index)
+    from src.card_index import RootCardIndex
+    from src.card_utils import merge_cards
+    from src.const import (RESTAURANT_NUM_RESULTS, TDS_NUM_RESULTS, TDSSearchEngineType)
+    from src.search_engine import (process_search, restaurant_search)
+    from src.tds_card import TDSCard
+    from src.utils import select_root_and_get_cards_list
+
+    results = dict()
+
+    # Full search pipelines: unique queries miss the results cache, a repeated query hits it
+    results["process_search"] = measure(
+        lambda idx: process_search("query " + str(idx), TDSSearchEngineType.MIX, TDS_NUM_RESULTS), repeat)
+    results["process_search_cached"] = measure(
+        lambda idx: process_search("query", TDSSearchEngineType.MIX, TDS_NUM_RESULTS), repeat)
+    results["restaurant_search"] = measure(
+        lambda idx: restaurant_search("query " + str(idx), RESTAURANT_NUM_RESULTS), repeat)
+
+    # Card tree operations
+    rows = make_tds_search_payload(TDS_NUM_RESULTS)["result"]
+    results["merge_cards"] = measure(
+        lambda idx: merge_cards("how to", [TDSCard("query", row) for row in rows]), repeat * 100)
+
+    root_cards_list = process_search("query", TDSSearchEngineType.MIX, TDS_NUM_RESULTS)
+    root_cards_index = RootCardIndex(root_cards_list)
+    card_types = [root_card.card_type for root_card in root_cards_list]
+    results["select_root_and_get_cards_list"] = measure(
+        lambda idx: select_root_and_get_cards_list("explore: " + card_types[idx % len(card_types)][:3],
+                                                   root_cards_index), repeat * 100)
+
+    # Opening Cards: unique articles call the Wikifier, a repeated article hits the Wikifier cache
+    def open_card(idx: int, unique: bool):
+        row = dict(rows[0], summary=rows[0]["summary"] + (" Article" + str(idx) if unique else ""))
+        TDSCard("query", row).open_card()
+    results["open_card"] = measure(lambda idx: open_card(idx, True), repeat)
+    results["open_card_cached"] = measure(lambda idx: open_card(idx, False), repeat)
+
+    # Local keyword search, no backend call
+    index_dir = tempfile.mkdtemp(prefix="search_app_bm25_")
+    build_bm25_index(make_corpus(5000), index_dir)
+    index = BM25Index(index_dir)
+    queries = make_corpus_queries(repeat * 10)
+    results["local_bm25_search"] = measure(lambda idx: index.search(queries[idx % len(queries)], TDS_NUM_RESULTS),
+                                           repeat * 10)
+    return results
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> bool:
+    """
+    Prints the change of each median against a baseline run.
+    :return: True if no benchmark regressed by more than max_regression.
+    """
+    ok = True
+    print("%-32s %12s %12s %8s" % ("benchmark", "baseline ms", "current ms", "change"))
+    for name, stats in results.items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["median_ms"]
+        after = stats["median_ms"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > max_regression:
+            flag = "  REGRESSION"
+            ok = False
+        print("%-32s %12.3f %12.3f %+7.1f%%%s" % (name, before, after, change * 100, flag))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--latency-median", type=float, default=0.005)
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON results to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+
+    latency = LatencyModel(args.latency_median, args.latency_sigma, args.error_rate, seed=args.seed)
+    with backend_server(latency) as server:
+        os.environ["SEARCH_APP_TDS_URL"] = server.url
+        os.environ["SEARCH_APP_WIKIFIER_URL"] = server.url
+        os.environ["SEARCH_APP_RESTAURANT_URL"] = server.url
+        os.environ["SEARCH_APP_CACHE_DIR"] = tempfile.mkdtemp(prefix="search_app_bench_")
+        results = run(args.repeat)
+        requests_served = dict(server.num_requests)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "requests_served": requests_served,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.max_regression):
+            sys.exit(1)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
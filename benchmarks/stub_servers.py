@@ -0,0 +1,240 @@
+"""
+Local stand-ins for the search, QA, Wikifier and restaurant backends.
+
+Run them all on one port and point the app to them:
+
+    python -m benchmarks.stub_servers --port 8001 --latency-median 0.05
+    SEARCH_APP_TDS_URL=http://127.0.0.1:8001 SEARCH_APP_WIKIFIER_URL=http://127.0.0.1:8001 \\
+    SEARCH_APP_RESTAURANT_URL=http://127.0.0.1:8001 streamlit run app.py
+
+The stubs serve the payloads recorded with benchmarks.record_payloads when
+present, and realistic generated payloads otherwise.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from http.server import (BaseHTTPRequestHandler, ThreadingHTTPServer)
+
+from benchmarks.payloads import (make_qa_payload, make_restaurant_payload, make_tds_search_payload)
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+
+class LatencyModel:
+    """
+    Log-normal response latency with a given median, plus a rate of 503 errors.
+    """
+    def __init__(self, median: float = 0.0, sigma: float = 0.0, error_rate: float = 0.0, seed: int = None):
+        self.median = median
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> tuple:
+        """
+        Draws the latency and the outcome of one request.
+        :return: (latency in seconds, whether the request fails).
+        """
+        with self._lock:
+            latency = self.median * math.exp(self._rng.gauss(0.0, self.sigma)) if self.median else 0.0
+            return latency, self._rng.random() < self.error_rate
+
+
+class StubServer:
+    """
+    A local stand-in for one or more of the backend APIs, served from a background thread.
+    Each route maps a path to a function taking the decoded JSON request
+    and returning the JSON-serializable response.
+    """
+    def __init__(self, routes: dict, latency=0.0, host: str = "127.0.0.1", port: int = 0, stream: bool = False):
+        self.routes = routes
+        self.latency = latency if isinstance(latency, LatencyModel) else LatencyModel(median=latency)
+
+        # Answer search requests accepting NDJSON one result per line, spread over the latency
+        self.stream = stream
+
+        # Requests received, by path
+        self.num_requests = dict()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            # Headers and body are written separately: do not let Nagle delay the body
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                route = server.routes.get(self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if route is None:
+                    self._reply(404, {})
+                    return
+                server.num_requests[self.path] = server.num_requests.get(self.path, 0) + 1
+                latency, fails = server.latency.sample()
+                body = None if fails else route(request)
+                if (server.stream and body is not None and isinstance(body.get("result"), list) and
+                        "application/x-ndjson" in self.headers.get("Accept", "")):
+                    self._stream(body["result"], latency)
+                    return
+                if latency:
+                    time.sleep(latency)
+                if fails:
+                    self._reply(503, {})
+                    return
+                self._reply(200, body)
+
+            def _stream(self, results: list, latency: float):
+                # The first result comes after a share of the latency, the next ones follow
+                delay = latency / (len(results) + 1)
+                time.sleep(delay)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for result in results:
+                    line = json.dumps(result).encode("utf-8") + b"\n"
+                    self.wfile.write(("%x\r\n" % len(line)).encode("ascii") + line + b"\r\n")
+                    self.wfile.flush()
+                    time.sleep(delay)
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _reply(self, status: int, body: dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return "http://" + host + ":" + str(port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def load_recording(name: str):
+    """
+    Returns a payload recorded from the real backend, if any.
+    :param name: the name of the recording.
+    :return: the recorded payload, or None.
+    """
+    path = os.path.join(RECORDINGS_DIR, name + ".json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _search_route(name: str, seed: int):
+    recording = load_recording(name)
+
+    def route(request: dict) -> dict:
+        num_results = request.get("num_results", 30)
+        if recording is not None:
+            return {"result": recording["result"][:num_results]}
+        return make_tds_search_payload(num_results, seed)
+    return route
+
+
+def qa_route(request: dict) -> dict:
+    recording = load_recording("tds_qa_search")
+    if recording is not None:
+        return recording
+    return make_qa_payload(3)
+
+
+def restaurant_route(request: dict) -> dict:
+    recording = load_recording("res_keyword_search")
+    num_results = request.get("num_results", 30)
+    if recording is not None:
+        return {"result": recording["result"][:num_results]}
+    return make_restaurant_payload(num_results)
+
+
+def wikifier_route(request: dict) -> dict:
+    """
+    Stand-in Wikifier: every capitalized word of the text is an entity.
+    """
+    entities = list()
+    seen = set()
+    for word in re.findall(r"\b[A-Z][a-zA-Z]+\b", request.get("text", "")):
+        if word in seen:
+            continue
+        seen.add(word)
+        entities.append({
+            "title": word,
+            "label": word.lower(),
+            "url": "https://en.wikipedia.org/wiki/" + word,
+        })
+    return {"entities": entities}
+
+
+def backend_routes() -> dict:
+    """
+    Returns the routes of all the backend APIs used by the app.
+    """
+    return {
+        "/tds_keyword_search": _search_route("tds_keyword_search", seed=1),
+        "/tds_dpr_search": _search_route("tds_dpr_search", seed=2),
+        "/tds_mixed_search": _search_route("tds_mixed_search", seed=3),
+        "/tds_qa_search": qa_route,
+        "/wikifier": wikifier_route,
+        "/res_keyword_search": restaurant_route,
+    }
+
+
+def backend_server(latency: LatencyModel = None, port: int = 0, stream: bool = False) -> StubServer:
+    return StubServer(backend_routes(), latency=latency or LatencyModel(), port=port, stream=stream)
+
+
+def wikifier_server(latency: float = 0.0) -> StubServer:
+    return StubServer({"/wikifier": wikifier_route}, latency=latency)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-median", type=float, default=0.05)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--stream", action="store_true", help="stream search results as NDJSON")
+    args = parser.parse_args()
+
+    latency = LatencyModel(args.latency_median, args.latency_sigma, args.error_rate)
+    server = backend_server(latency, port=args.port, stream=args.stream)
+    print("Stub backends listening on " + server.url)
+    server._httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
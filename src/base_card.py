@@ -1,35 +1,138 @@
+import hashlib
+import itertools
 import uuid
-from abc import ABC
+import zlib
+from abc import (ABC, abstractmethod)
 
 
 class CardMetaData:
     """
     MetaData for Cards.
+    Cards from the same source share one interned instance, see for_source().
     """
+    __slots__ = ('name',)
+
+    # Source name -> shared MetaData
+    _interned = dict()
+
     def __init__(self, name: str = ""):
         self.name = name
 
+    @classmethod
+    def for_source(cls, name: str):
+        """
+        Returns the shared MetaData for the given source.
+        :param name: the name of the source.
+        :return: the MetaData of the source.
+        """
+        metadata = cls._interned.get(name)
+        if metadata is None:
+            metadata = cls._interned.setdefault(name, cls(name))
+        return metadata
+
+
+def pack_text(text: str) -> bytes:
+    """
+    Compresses a long, rarely shown text kept by a Card, e.g. an article summary.
+    :param text: the text.
+    :return: the compressed text.
+    """
+    return zlib.compress(text.encode('utf-8'))
+
+
+def unpack_text(data: bytes) -> str:
+    """
+    Decompresses a text compressed by pack_text.
+    :param data: the compressed text.
+    :return: the text.
+    """
+    return zlib.decompress(data).decode('utf-8')
+
+
+class CardIdStrategy(ABC):
+    """
+    Strategy computing the unique identifier of a Card.
+    """
+    @abstractmethod
+    def make_id(self, card) -> str:
+        pass
+
+
+class ContentIdStrategy(CardIdStrategy):
+    """
+    Stable identifier derived from the Card content (see BaseCard.get_identity),
+    the same result gets the same identifier across reruns and sessions.
+    """
+    def make_id(self, card) -> str:
+        identity = '\x1f'.join(card.get_identity())
+        return hashlib.blake2b(identity.encode('utf-8'), digest_size=10).hexdigest()
+
+
+class CounterIdStrategy(CardIdStrategy):
+    """
+    Fast process-wide counter, unique within the process only.
+    """
+    def __init__(self):
+        self._counter = itertools.count(1)
+
+    def make_id(self, card) -> str:
+        return str(next(self._counter))
+
+
+class RandomIdStrategy(CardIdStrategy):
+    """
+    Random UUID for each Card.
+    """
+    def make_id(self, card) -> str:
+        return str(uuid.uuid4())
+
+
+_id_strategy = ContentIdStrategy()
+
+
+def set_id_strategy(strategy: CardIdStrategy) -> None:
+    """
+    Sets the strategy used to compute the identifiers of the Cards.
+    Identifiers already computed are not changed.
+    :param strategy: the new strategy.
+    :return: None
+    """
+    global _id_strategy
+    _id_strategy = strategy
+
 
 class BaseCard(ABC):
     """
     A parent base Card for any other type of Card.
     """
+    __slots__ = ('_parent', '_id', '_metadata')
+
     def __init__(self, metadata: CardMetaData):
         # Parent card
         self._parent = None
 
-        # Unique identifier for this card
-        self._id = uuid.uuid4()
+        # Unique identifier for this card, computed on demand
+        self._id = None
 
         # MetaData for this card
         self._metadata = metadata
 
+    def get_identity(self) -> tuple:
+        """
+        Returns the content identifying this card, used to derive its unique identifier.
+        Defaults to the source name only: subclasses add what distinguishes their Cards.
+        :return: a tuple of strings.
+        """
+        return (self._metadata.name,)
+
     def get_unique_id(self) -> str:
         """
         Returns this card unique identifier.
         :return: this card's unique identifier.
         """
-        return str(self._id)
+        if self._id is None:
+            self._id = _id_strategy.make_id(self)
+        return self._id
 
     def get_metadata(self) -> CardMetaData:
         """
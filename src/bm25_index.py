@@ -0,0 +1,310 @@
+"""
+Local BM25 keyword search over a dump of the TDS articles.
+
+    python -m src.bm25_index corpus.jsonl index_dir
+
+The corpus is a JSON lines file of articles shaped like the results of the search endpoints.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+from src.const import (BM25_B, BM25_BLOCK_SIZE, BM25_INDEX_DIR, BM25_K1)
+from src.doc_store import (DocStore, write_doc_store)
+
+META_FILE = "bm25_meta.json"
+VOCABULARY_FILE = "bm25_vocabulary.json"
+POSTINGS_FILE = "bm25_postings.bin"
+DOC_LENGTHS_FILE = "bm25_doc_lengths.npy"
+BLOCK_LAST_DOCS_FILE = "bm25_block_last_docs.npy"
+BLOCK_OFFSETS_FILE = "bm25_block_offsets.npy"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = frozenset("""
+a an and are as at be but by can do for from has have how i if in into is it its not of on or so
+that the their them then there these they this to was we what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> list:
+    """
+    Splits a text into lowercase terms, without stopwords.
+    :param text: the text.
+    :return: the list of terms.
+    """
+    return [token for token in _TOKEN_RE.findall(text.lower()) if len(token) > 1 and token not in _STOPWORDS]
+
+
+def get_document_text(doc: dict) -> str:
+    return doc["title"] + " " + doc["summary"]
+
+
+def _encode_varint(value: int, out: bytearray) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """
+    Decodes a sequence of LEB128 varints at once.
+    :param data: the encoded bytes, as a uint8 array.
+    :return: the decoded values.
+    """
+    if not len(data):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    shifts = 7 * (np.arange(len(data)) - np.repeat(starts, ends - starts + 1))
+    return np.add.reduceat((data & 0x7f).astype(np.int64) << shifts, starts)
+
+
+def _term_score(idf: float, tf, doc_length, k1: float, b: float, avg_doc_length: float):
+    return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_length / avg_doc_length))
+
+
+def _idf(num_docs: int, df: int) -> float:
+    return math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+
+
+def build_bm25_index(docs, index_dir: str, k1: float = BM25_K1, b: float = BM25_B,
+                     block_size: int = BM25_BLOCK_SIZE) -> int:
+    """
+    Builds the BM25 index of a corpus.
+    Postings are stored by blocks of block_size documents, as varints of the document
+    gaps and term frequencies, so a search can decode only the blocks it needs.
+    :param docs: an iterable of articles.
+    :param index_dir: the directory to write the index to.
+    :param k1: the BM25 term frequency saturation.
+    :param b: the BM25 document length normalization.
+    :param block_size: the number of postings per block.
+    :return: the number of documents indexed.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+
+    # Term -> list of (document, term frequency), documents in increasing order
+    postings = dict()
+    doc_lengths = list()
+
+    def index_docs():
+        for doc_id, doc in enumerate(docs):
+            terms = tokenize(get_document_text(doc))
+            doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                postings.setdefault(term, []).append((doc_id, tf))
+            yield doc
+
+    num_docs = write_doc_store(index_docs(), index_dir)
+    doc_lengths = np.asarray(doc_lengths, dtype=np.uint32)
+    avg_doc_length = float(doc_lengths.mean()) if num_docs else 1.0
+
+    vocabulary = dict()
+    data = bytearray()
+    block_last_docs = list()
+    block_offsets = [0]
+    for term in sorted(postings):
+        term_postings = postings[term]
+        idf = _idf(num_docs, len(term_postings))
+        doc_ids = np.fromiter((doc_id for doc_id, _ in term_postings), dtype=np.int64, count=len(term_postings))
+        tfs = np.fromiter((tf for _, tf in term_postings), dtype=np.float64, count=len(term_postings))
+        max_score = float(_term_score(idf, tfs, doc_lengths[doc_ids], k1, b, avg_doc_length).max())
+
+        vocabulary[term] = [len(block_last_docs), -(-len(term_postings) // block_size), len(term_postings),
+                            max_score]
+        previous = 0
+        for start in range(0, len(term_postings), block_size):
+            for doc_id, tf in term_postings[start:start + block_size]:
+                _encode_varint(doc_id - previous, data)
+                _encode_varint(tf, data)
+                previous = doc_id
+            block_last_docs.append(previous)
+            block_offsets.append(len(data))
+
+    with open(os.path.join(index_dir, POSTINGS_FILE), "wb") as postings_file:
+        postings_file.write(data)
+    np.save(os.path.join(index_dir, DOC_LENGTHS_FILE), doc_lengths)
+    np.save(os.path.join(index_dir, BLOCK_LAST_DOCS_FILE), np.asarray(block_last_docs, dtype=np.int64))
+    np.save(os.path.join(index_dir, BLOCK_OFFSETS_FILE), np.asarray(block_offsets, dtype=np.int64))
+    with open(os.path.join(index_dir, VOCABULARY_FILE), "w") as vocabulary_file:
+        json.dump(vocabulary, vocabulary_file)
+
+    # Written last: an index without its meta file is incomplete
+    with open(os.path.join(index_dir, META_FILE), "w") as meta_file:
+        json.dump({"num_docs": num_docs, "avg_doc_length": avg_doc_length, "k1": k1, "b": b,
+                   "block_size": block_size}, meta_file)
+    return num_docs
+
+
+class BM25Index:
+    """
+    A BM25 index on local disk, memory-mapped.
+    Top-k searches use MaxScore, term at a time: query terms are processed by decreasing
+    score upper bound, and once the terms left cannot lift a new document into the top-k,
+    only the blocks holding the remaining candidates are decoded.
+    """
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        with open(os.path.join(index_dir, VOCABULARY_FILE)) as vocabulary_file:
+            self._vocabulary = json.load(vocabulary_file)
+        self.num_docs = meta["num_docs"]
+        self.avg_doc_length = meta["avg_doc_length"]
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self.block_size = meta["block_size"]
+
+        self._doc_lengths = np.load(os.path.join(index_dir, DOC_LENGTHS_FILE), mmap_mode="r")
+        self._block_last_docs = np.load(os.path.join(index_dir, BLOCK_LAST_DOCS_FILE), mmap_mode="r")
+        self._block_offsets = np.load(os.path.join(index_dir, BLOCK_OFFSETS_FILE), mmap_mode="r")
+        postings_path = os.path.join(index_dir, POSTINGS_FILE)
+        if os.path.getsize(postings_path):
+            self._postings = np.memmap(postings_path, dtype=np.uint8, mode="r")
+        else:
+            self._postings = np.zeros(0, dtype=np.uint8)
+        self.docs = DocStore(index_dir)
+
+    def _decode_blocks(self, term: str, blocks: np.ndarray) -> tuple:
+        """
+        Decodes some blocks of the postings of a term.
+        :param term: the term.
+        :param blocks: the indexes of the blocks, relative to the first block of the term, in increasing order.
+        :return: the document ids and the term frequencies.
+        """
+        first_block, num_blocks, df, _ = self._vocabulary[term]
+        absolute = blocks + first_block
+        starts = self._block_offsets[absolute]
+        ends = self._block_offsets[absolute + 1]
+        if len(blocks) == num_blocks:
+            data = self._postings[starts[0]:ends[-1]]
+        else:
+            data = np.concatenate([self._postings[start:end] for start, end in zip(starts, ends)])
+        values = decode_varints(np.asarray(data))
+        gaps = values[0::2]
+        tfs = values[1::2]
+
+        # Gaps restart at each block, from the last document of the previous block
+        counts = np.full(len(blocks), self.block_size)
+        counts[blocks == num_blocks - 1] = df - self.block_size * (num_blocks - 1)
+        bases = np.where(blocks > 0, self._block_last_docs[np.maximum(absolute - 1, 0)], 0)
+        block_starts = np.cumsum(counts) - counts
+        sums = np.cumsum(gaps)
+        before = np.where(block_starts > 0, sums[np.maximum(block_starts - 1, 0)], 0)
+        return sums + np.repeat(bases - before, counts), tfs
+
+    def _score(self, term: str, doc_ids: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+        idf = _idf(self.num_docs, self._vocabulary[term][2])
+        return _term_score(idf, tfs, self._doc_lengths[doc_ids], self.k1, self.b, self.avg_doc_length)
+
+    def get_max_score(self, query: str) -> float:
+        """
+        Returns an upper bound of the BM25 scores of a query: the sum of the highest score of each of its terms.
+        A term missing from the corpus counts for the highest score of a term found in a single document,
+        so that matching only some terms of a query scores lower.
+        :param query: the query.
+        :return: the upper bound.
+        """
+        missing_term_score = _idf(self.num_docs, 1) * (self.k1 + 1)
+        return float(sum(self._vocabulary[term][3] if term in self._vocabulary else missing_term_score
+                         for term in set(tokenize(query))))
+
+    def search(self, query: str, k: int) -> list:
+        """
+        Returns the k documents with the highest BM25 score for a query.
+        :param query: the query.
+        :param k: the number of documents to return.
+        :return: a list of (document id, score), by decreasing score.
+        """
+        terms = [term for term in set(tokenize(query)) if term in self._vocabulary]
+        if not terms or k <= 0:
+            return list()
+        terms.sort(key=lambda term: self._vocabulary[term][3], reverse=True)
+
+        # Highest score the terms from i on can still add to a document
+        remaining = np.cumsum([self._vocabulary[term][3] for term in reversed(terms)])[::-1]
+
+        doc_ids = np.zeros(0, dtype=np.int64)
+        scores = np.zeros(0)
+        for i, term in enumerate(terms):
+            threshold = np.partition(scores, -k)[-k] if len(scores) >= k else 0.0
+            num_blocks = self._vocabulary[term][1]
+            if remaining[i] < threshold:
+                # No new document can reach the top-k: only score the candidates left
+                keep = scores + remaining[i] >= threshold
+                doc_ids, scores = doc_ids[keep], scores[keep]
+                term_last_docs = self._block_last_docs[self._vocabulary[term][0]:][:num_blocks]
+                blocks = np.unique(np.searchsorted(term_last_docs, doc_ids))
+                blocks = blocks[blocks < num_blocks]
+                if not len(blocks):
+                    continue
+                term_doc_ids, tfs = self._decode_blocks(term, blocks)
+                positions = np.searchsorted(term_doc_ids, doc_ids)
+                positions = np.minimum(positions, len(term_doc_ids) - 1)
+                found = term_doc_ids[positions] == doc_ids
+                scores[found] += self._score(term, doc_ids[found], tfs[positions[found]])
+            else:
+                term_doc_ids, tfs = self._decode_blocks(term, np.arange(num_blocks))
+                all_doc_ids = np.concatenate((doc_ids, term_doc_ids))
+                all_scores = np.concatenate((scores, self._score(term, term_doc_ids, tfs)))
+                doc_ids, inverse = np.unique(all_doc_ids, return_inverse=True)
+                scores = np.bincount(inverse, weights=all_scores)
+
+        # Best scores first, then the first documents of the corpus
+        top = np.lexsort((doc_ids, -scores))[:k]
+        return [(int(doc_ids[idx]), float(scores[idx])) for idx in top]
+
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_bm25_index():
+    """
+    Returns the process-wide local BM25 index, loaded on first use.
+    :return: the index, or None if no index was built.
+    """
+    global _index, _index_loaded
+    if not _index_loaded:
+        with _index_lock:
+            if not _index_loaded:
+                if os.path.exists(os.path.join(BM25_INDEX_DIR, META_FILE)):
+                    _index = BM25Index(BM25_INDEX_DIR)
+                _index_loaded = True
+    return _index
+
+
+def read_corpus(path: str):
+    """
+    Reads a corpus dump: one JSON article per line.
+    :param path: the path of the dump.
+    :return: a generator of articles.
+    """
+    with open(path) as corpus_file:
+        for line in corpus_file:
+            if line.strip():
+                doc = json.loads(line)
+                doc.pop("score", None)
+                yield doc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the local BM25 index of a corpus dump.")
+    parser.add_argument("corpus", help="JSON lines file of articles")
+    parser.add_argument("index_dir", nargs="?", default=BM25_INDEX_DIR)
+    args = parser.parse_args()
+    num_docs = build_bm25_index(read_corpus(args.corpus), args.index_dir)
+    print("Indexed " + str(num_docs) + " articles in " + args.index_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from src.const import (RESULT_CACHE_DB_PATH, RESULT_CACHE_DISK_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES,
+                       RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL, WIKIFIER_CACHE_DB_PATH,
+                       WIKIFIER_CACHE_DISK_MAX_ENTRIES, WIKIFIER_CACHE_MAX_BYTES, WIKIFIER_CACHE_MAX_ENTRIES)
+from src.metrics import register_collector
+
+
+class LRUCache:
+    """
+    In-process LRU cache bounded both by number of entries and by total size in bytes.
+    Entries older than the TTL are treated as missing.
+    """
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        # key -> (value, size in bytes, insertion time)
+        self._entries = OrderedDict()
+        self._num_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """
+        Returns the value stored under the key.
+        :param key: the key to look up.
+        :return: the cached value, or None if missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, size, created = entry
+            if self.ttl is not None and time.time() - created > self.ttl:
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value, size: int, created: float = None) -> None:
+        """
+        Stores a value, evicting the least recently used entries if needed.
+        :param key: the key.
+        :param value: the value to store.
+        :param size: the size of the value in bytes.
+        :param created: the time the value was produced, defaults to now.
+        :return: None
+        """
+        if size > self.max_bytes:
+            # Never let a single entry flush the whole cache
+            return
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (value, size, time.time() if created is None else created)
+            self._num_bytes += size
+            while len(self._entries) > self.max_entries or self._num_bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._num_bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteStore:
+    """
+    Persistent key/value store on local disk that survives restarts.
+    Values are raw bytes, the oldest accessed entries are evicted past max_entries.
+    """
+    def __init__(self, path: str, table: str, max_entries: int, ttl: float = None):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS " + table +
+                           " (key TEXT PRIMARY KEY, value BLOB, created REAL, accessed REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS " + table + "_accessed ON " + table + " (accessed)")
+
+    def get(self, key: str):
+        """
+        Returns the bytes stored under the key.
+        :param key: the key to look up.
+        :return: a (value, created) tuple, or None if missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM " + self.table + " WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._conn.execute("DELETE FROM " + self.table + " WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE " + self.table + " SET accessed = ? WHERE key = ?", (now, key))
+        return bytes(value), created
+
+    def put(self, key: str, value: bytes) -> None:
+        """
+        Stores the bytes under the key, evicting the least recently accessed entries if needed.
+        :param key: the key.
+        :param value: the bytes to store.
+        :return: None
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO " + self.table + " VALUES (?, ?, ?, ?)",
+                               (key, sqlite3.Binary(value), now, now))
+            num_entries = self._conn.execute("SELECT COUNT(*) FROM " + self.table).fetchone()[0]
+            if num_entries > self.max_entries:
+                self._conn.execute("DELETE FROM " + self.table + " WHERE key IN (SELECT key FROM " + self.table +
+                                   " ORDER BY accessed LIMIT ?)", (num_entries - self.max_entries,))
+
+
+class TwoTierCache:
+    """
+    A memory LRU in front of a persistent on-disk store.
+    Values must be JSON-serializable. Disk errors are treated as misses.
+    """
+    def __init__(self, memory: LRUCache, disk: SQLiteStore = None):
+        self.memory = memory
+        self.disk = disk
+
+        # Hit/miss counters
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        """
+        Returns the value stored under the key, promoting disk hits to memory.
+        :param key: the key to look up.
+        :return: the cached value, or None on a miss.
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+
+        if self.disk is not None:
+            try:
+                entry = self.disk.get(key)
+            except sqlite3.Error:
+                entry = None
+            if entry is not None:
+                raw, created = entry
+                value = json.loads(raw)
+                self.memory.put(key, value, len(raw), created)
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value) -> None:
+        """
+        Stores the value in both tiers.
+        :param key: the key.
+        :param value: a JSON-serializable value.
+        :return: None
+        """
+        raw = json.dumps(value, separators=(',', ':')).encode('utf-8')
+        self.memory.put(key, value, len(raw))
+        if self.disk is not None:
+            try:
+                self.disk.put(key, raw)
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters of this cache.
+        :return: a dict with the counters and the hit ratio.
+        """
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+        }
+
+
+def make_key(*parts) -> str:
+    """
+    Builds a compact cache key from JSON-serializable parts.
+    :param parts: the parts identifying the cached value.
+    :return: the key as a hex digest.
+    """
+    raw = json.dumps(parts, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query for cache lookups: case and whitespace insensitive.
+    :param query: the query.
+    :return: the normalized query.
+    """
+    return ' '.join(query.lower().split())
+
+
+_caches = dict()
+_caches_lock = threading.Lock()
+
+
+def _get_cache(name: str, db_path: str, max_entries: int, max_bytes: int, disk_max_entries: int,
+               ttl: float = None) -> TwoTierCache:
+    """
+    Returns the process-wide cache with the given name, created on first use.
+    Falls back to a memory only cache if the disk store cannot be opened.
+    """
+    cache = _caches.get(name)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(name)
+            if cache is None:
+                memory = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+                try:
+                    disk = SQLiteStore(db_path, table=name, max_entries=disk_max_entries, ttl=ttl)
+                except (OSError, sqlite3.Error):
+                    disk = None
+                cache = TwoTierCache(memory, disk)
+                _caches[name] = cache
+    return cache
+
+
+def get_result_cache() -> TwoTierCache:
+    """
+    Returns the process-wide cache for search results.
+    :return: the search results cache.
+    """
+    return _get_cache("search_results", RESULT_CACHE_DB_PATH, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES,
+                      RESULT_CACHE_DISK_MAX_ENTRIES, RESULT_CACHE_TTL)
+
+
+def get_wikifier_cache() -> TwoTierCache:
+    """
+    Returns the process-wide cache for Wikifier concepts.
+    Articles never change, so these entries do not expire.
+    :return: the Wikifier concepts cache.
+    """
+    return _get_cache("wikifier_concepts", WIKIFIER_CACHE_DB_PATH, WIKIFIER_CACHE_MAX_ENTRIES,
+                      WIKIFIER_CACHE_MAX_BYTES, WIKIFIER_CACHE_DISK_MAX_ENTRIES)
+
+
+def result_cache_key(endpoint: str, search_query: str, num_results: int, location_list: list = None) -> str:
+    """
+    Returns the cache key of a search call.
+    :param endpoint: the search endpoint.
+    :param search_query: the search query.
+    :param num_results: the number of results requested.
+    :param location_list: the list of locations, for restaurant searches.
+    :return: the cache key.
+    """
+    return make_key(endpoint, normalize_query(search_query), num_results, location_list)
+
+
+def wikifier_cache_key(text: str, threshold: float) -> str:
+    """
+    Returns the cache key of the Wikifier concepts for a text.
+    :param text: the text sent to the Wikifier.
+    :param threshold: the Wikifier threshold.
+    :return: the cache key.
+    """
+    return make_key(hashlib.sha1(text.encode('utf-8')).hexdigest(), threshold)
+
+
+def _collect_cache_metrics() -> list:
+    """
+    Returns the counters of the caches created so far, for the metrics export.
+    """
+    samples = list()
+    for name, cache in list(_caches.items()):
+        stats = cache.stats()
+        for result in ("memory_hits", "disk_hits", "misses"):
+            samples.append(("search_app_cache_lookups_total", "counter", "Cache lookups by result.",
+                            {"cache": name, "result": result}, stats[result]))
+        samples.append(("search_app_cache_hit_ratio", "gauge", "Share of cache lookups that were hits.",
+                        {"cache": name}, stats["hit_ratio"]))
+    return samples
+
+
+register_collector(_collect_cache_metrics)
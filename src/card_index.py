@@ -0,0 +1,79 @@
+from bisect import bisect_left
+from difflib import get_close_matches
+
+
+def normalize_card_type(card_type: str) -> str:
+    return card_type.strip().lower()
+
+
+class RootCardIndex:
+    """
+    Lookup index over a list of root Cards by card type, built once per search.
+    Resolves a card type by exact match, then ignoring spaces, then by prefix,
+    and suggests close card types when nothing matches.
+    """
+    def __init__(self, root_cards_list: list):
+        self.root_cards_list = root_cards_list
+
+        # Normalized card type -> position of the first root Card with that type
+        self._exact = dict()
+        self._no_space = dict()
+        for position, root_card in enumerate(root_cards_list):
+            name = normalize_card_type(root_card.card_type)
+            self._exact.setdefault(name, position)
+            self._no_space.setdefault(name.replace(' ', ''), position)
+
+        # Sorted (normalized card type, position) pairs for prefix searches, with and without spaces
+        self._sorted_names = sorted(self._exact.items())
+        self._sorted_no_space_names = sorted(self._no_space.items())
+
+    def lookup(self, card_type: str):
+        """
+        Returns the root Card matching the card type.
+        :param card_type: the card type typed by the user.
+        :return: the matching root Card, or None.
+        """
+        name = normalize_card_type(card_type)
+        position = self._exact.get(name)
+        if position is None:
+            # Try query without spaces
+            position = self._no_space.get(name.replace(' ', ''))
+        if position is None:
+            # Try starts with, then starts with ignoring spaces, the first root Card wins
+            matches = (self._prefix_matches(self._sorted_names, name) or
+                       self._prefix_matches(self._sorted_no_space_names, name.replace(' ', '')))
+            position = min(matches) if matches else None
+        if position is None:
+            return None
+        return self.root_cards_list[position]
+
+    def suggest(self, card_type: str, max_suggestions: int = 3) -> list:
+        """
+        Suggests card types close to the given one.
+        :param card_type: the card type typed by the user.
+        :param max_suggestions: the maximum number of suggestions.
+        :return: a list of card types.
+        """
+        name = normalize_card_type(card_type)
+
+        # The close matches first, best first, then the card types starting alike
+        positions = [self._exact[close_name]
+                     for close_name in get_close_matches(name, self._exact.keys(), n=max_suggestions, cutoff=0.5)]
+        prefix_matches = set(self._prefix_matches(self._sorted_names, name[:3]))
+        prefix_matches.update(self._prefix_matches(self._sorted_no_space_names, name.replace(' ', '')[:3]))
+        for position in sorted(prefix_matches):
+            if position not in positions:
+                positions.append(position)
+        return [self.root_cards_list[position].card_type for position in positions[:max_suggestions]]
+
+    @staticmethod
+    def _prefix_matches(sorted_names: list, prefix: str) -> list:
+        matches = list()
+        idx = bisect_left(sorted_names, (prefix,))
+        while idx < len(sorted_names) and sorted_names[idx][0].startswith(prefix):
+            matches.append(sorted_names[idx][1])
+            idx += 1
+        return matches
+
+    def __len__(self) -> int:
+        return len(self.root_cards_list)
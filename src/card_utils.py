@@ -1,7 +1,18 @@
+import time
+from typing import TYPE_CHECKING
+from src.cache import get_wikifier_cache
+from src.const import WIKIFIER_ENDPOINT
+from src.metrics import (observe, timed)
 from src.restaurant_card import RestaurantRootCard
-from src.tds_card import TDSRootCard
+from src.tds_card import (TDSRootCard, get_related_concepts)
+from src.utils import run_wikifier_batch
 
+if TYPE_CHECKING:
+    # Imports NumPy, only needed by the searches grouping their results at once
+    from src.result_set import ResultSet
 
+
+@timed("merge_cards")
 def merge_cards(key: str, card_list: list) -> TDSRootCard:
     """
     Merges the Cards in the list of cards and returns a RootCard
@@ -10,7 +21,8 @@ def merge_cards(key: str, card_list: list) -> TDSRootCard:
     :return: a root Card
     """
     # Create a new card with given key
-    root_card = TDSRootCard(card_type=key)
+    search_query = card_list[0].search_query if card_list else ""
+    root_card = TDSRootCard(card_type=key, search_query=search_query)
 
     # Add all sub-cards
     for card in card_list:
@@ -23,6 +35,7 @@ def merge_cards(key: str, card_list: list) -> TDSRootCard:
     return root_card
 
 
+@timed("merge_cards")
 def merge_restaurant_cards(key: str, card_list: list) -> RestaurantRootCard:
     """
     Merges the Cards in the list of cards and returns a RootCard
@@ -31,7 +44,8 @@ def merge_restaurant_cards(key: str, card_list: list) -> RestaurantRootCard:
     :return: a root Card
     """
     # Create a new card with given key
-    root_card = RestaurantRootCard(card_type=key)
+    search_query = card_list[0].search_query if card_list else ""
+    root_card = RestaurantRootCard(card_type=key, search_query=search_query)
 
     # Add all sub-cards
     for card in card_list:
@@ -42,3 +56,141 @@ def merge_restaurant_cards(key: str, card_list: list) -> RestaurantRootCard:
 
     # Return the root Card
     return root_card
+
+
+@timed("build_root_cards")
+def build_root_cards(root_card_class, card_class, search_query: str, result_set: 'ResultSet') -> list:
+    """
+    Creates a root Card per category of the result set.
+    The children Cards are only built when a root Card is explored.
+    :param root_card_class: the class of the root Cards.
+    :param card_class: the class of the children Cards.
+    :param search_query: the query producing the results.
+    :param result_set: the selected results.
+    :return: the list of root Cards.
+    """
+    rows = result_set.rows
+    top_offsets = result_set.argmax_per_category()
+
+    root_cards_list = list()
+    for category, offsets in result_set.group_by_category():
+        root_card = root_card_class(card_type=category, search_query=search_query)
+        root_card.set_top_ranked_result(rows[top_offsets[category]])
+
+        # Each root Card keeps only its own selected results, not the whole response
+        category_rows = [rows[offset] for offset in offsets]
+        root_card.set_pending_children(
+            lambda category_rows=category_rows: _build_cards(card_class, search_query, category_rows),
+            len(category_rows))
+        root_cards_list.append(root_card)
+    return root_cards_list
+
+
+class RootCardStream:
+    """
+    Groups results into root Cards as they arrive.
+    Each new result is added to the results of its category, whose root Card is created on its first result;
+    as with build_root_cards, the children Cards are only built when a root Card is explored.
+    Iterating yields the root Card updated by each result, 'complete' then tells whether all the
+    results were received.
+    """
+    def __init__(self, root_card_class, card_class, search_query: str, results, category_of,
+                 min_score: float = None):
+        """
+        :param root_card_class: the class of the root Cards.
+        :param card_class: the class of the children Cards.
+        :param search_query: the query producing the results.
+        :param results: a stream of results, with a 'complete' flag.
+        :param category_of: returns the category of a result.
+        :param min_score: results below this score are skipped.
+        """
+        self.root_card_class = root_card_class
+        self.card_class = card_class
+        self.search_query = search_query
+        self.category_of = category_of
+        self.min_score = min_score
+        self._results = results
+
+    @property
+    def complete(self) -> bool:
+        return self._results.complete
+
+    def __iter__(self):
+        # Category -> [root Card, its results in arrival order, its top score]
+        categories = dict()
+
+        # Grouping time, without the time spent waiting for the results
+        group_time = 0.0
+        try:
+            for result in self._results:
+                start = time.perf_counter()
+                root_card = self._add_result(categories, result)
+                group_time += time.perf_counter() - start
+                if root_card is not None:
+                    yield root_card
+        finally:
+            observe("group_results", group_time)
+
+    def _add_result(self, categories: dict, result: dict):
+        """
+        Adds a result to the root Card of its category.
+        :param categories: category -> [root Card, its results in arrival order, its top score].
+        :param result: the new result.
+        :return: the updated root Card, or None if the result is skipped.
+        """
+        if self.min_score is not None and result["score"] < self.min_score:
+            return None
+        card_class = self.card_class
+        search_query = self.search_query
+        category = self.category_of(result)
+        entry = categories.get(category)
+        if entry is None:
+            entry = [self.root_card_class(card_type=category, search_query=search_query), list(), None]
+            categories[category] = entry
+        root_card, rows, top_score = entry
+        rows.append(result)
+
+        # The top-ranked result is the first one with the highest score
+        if top_score is None or result["score"] > top_score:
+            entry[2] = result["score"]
+            root_card.set_top_ranked_result(result)
+        root_card.set_pending_children(lambda: _build_cards(card_class, search_query, rows), len(rows))
+        return root_card
+
+
+def _build_cards(card_class, search_query: str, rows: list) -> list:
+    with timed("card_construction"):
+        return [card_class(search_query, row) for row in rows]
+
+
+def annotate_cards(card_list: list, endpoint: str = WIKIFIER_ENDPOINT) -> None:
+    """
+    Computes the related concepts of many TDS Cards at once.
+    Cards already annotated or found in the Wikifier cache are skipped,
+    the others are sent to the Wikifier in a single batch.
+    :param card_list: the list of TDS Cards to annotate.
+    :param endpoint: the Wikifier endpoint.
+    :return: None
+    """
+    cache = get_wikifier_cache()
+
+    # Collect the Cards that need a Wikifier call
+    cards_to_annotate = list()
+    for card in card_list:
+        if card.related_concepts:
+            continue
+        related_concepts = cache.get(card.get_wikifier_cache_key())
+        if related_concepts is not None:
+            card.related_concepts = list(related_concepts)
+        else:
+            cards_to_annotate.append(card)
+
+    # Annotate them in one batch and map the entities back to each Card
+    results = run_wikifier_batch([card.get_wikifier_text() for card in cards_to_annotate], endpoint=endpoint)
+    for card, result in zip(cards_to_annotate, results):
+        if not result:
+            # Something went wrong, try again next time
+            continue
+        related_concepts = get_related_concepts(result)
+        cache.put(card.get_wikifier_cache_key(), related_concepts)
+        card.related_concepts = list(related_concepts)
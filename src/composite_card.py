@@ -1,11 +1,15 @@
 from __future__ import annotations
+from bisect import bisect_right
 from src.base_card import (BaseCard, CardMetaData)
+from src.const import SortKey
 
 
 class ComponentCard(BaseCard):
     """
     The base Component class in a Composite pattern.
     """
+    __slots__ = ()
+
     def __init__(self, meta_data: CardMetaData):
         super().__init__(meta_data)
 
@@ -40,6 +44,8 @@ class LeafCard(ComponentCard):
     """
     A LeafCard is a Card with no children.
     """
+    __slots__ = ()
+
     def __init__(self, meta_data: CardMetaData):
         super().__init__(meta_data)
 
@@ -49,26 +55,129 @@ class CompositeCard(ComponentCard):
     The CompositeCard is a Card that can have one or more children.
     Each child is a ComponentCard. This will recursively build a "tree"
     of Cards.
+    Children are kept ranked by the current sort key, best first, ties in arrival order.
     """
+    __slots__ = ('_children', '_pending_children', '_sort_key', '_rank_keys', '_ranked_children', '_num_added')
+
+    # Sort keys supported by this type of Card
+    SORT_KEYS = (SortKey.SCORE,)
+
     def __init__(self, meta_data: CardMetaData) -> None:
         super().__init__(meta_data)
 
         # All the children of this Card
         self._children = list()
 
+        # Children not built yet: (factory returning the children, number of children)
+        self._pending_children = None
+
+        # Ranked index over the children: (-rank value, arrival) keys and the matching children
+        self._sort_key = SortKey.SCORE
+        self._rank_keys = list()
+        self._ranked_children = list()
+        self._num_added = 0
+
+    def set_pending_children(self, factory, num_children: int) -> None:
+        """
+        Defers building the children of this Card until they are needed.
+        :param factory: a function returning the list of children.
+        :param num_children: the number of children the factory returns.
+        :return: None
+        """
+        self._pending_children = (factory, num_children)
+
+    def _build_pending_children(self) -> None:
+        if self._pending_children is not None:
+            factory, _ = self._pending_children
+            self._pending_children = None
+            for component in factory():
+                self._children.append(component)
+                component.parent = self
+            self._rank_children()
+
+    def get_rank_value(self, component: ComponentCard, sort_key: SortKey) -> float:
+        """
+        Returns the value children are ranked by, higher first.
+        :param component: a child of this Card.
+        :param sort_key: the sort key.
+        :return: the rank value of the child.
+        """
+        return component.score
+
+    def _rank_key(self, component: ComponentCard) -> tuple:
+        self._num_added += 1
+        return -self.get_rank_value(component, self._sort_key), self._num_added
+
+    def _rank_children(self) -> None:
+        self._num_added = 0
+        ranked = sorted(((self._rank_key(component), component) for component in self._children),
+                        key=lambda item: item[0])
+        self._rank_keys = [key for key, _ in ranked]
+        self._ranked_children = [component for _, component in ranked]
+
+    def set_sort_key(self, sort_key: SortKey) -> None:
+        """
+        Changes the order the children are ranked in.
+        :param sort_key: one of the SORT_KEYS of this Card.
+        :return: None
+        """
+        if sort_key not in self.SORT_KEYS:
+            raise ValueError("Unsupported sort key for " + type(self).__name__ + ": " + sort_key.name)
+        if sort_key is not self._sort_key:
+            self._sort_key = sort_key
+            self._rank_children()
+
+    def get_sort_key(self) -> SortKey:
+        return self._sort_key
+
     def add(self, component: ComponentCard) -> None:
+        self._build_pending_children()
         self._children.append(component)
         component.parent = self
 
+        # Insert the child at its rank
+        key = self._rank_key(component)
+        idx = bisect_right(self._rank_keys, key)
+        self._rank_keys.insert(idx, key)
+        self._ranked_children.insert(idx, component)
+
     def remove(self, component: ComponentCard) -> None:
+        self._build_pending_children()
         self._children.remove(component)
         component.parent = None
 
+        idx = next(idx for idx, child in enumerate(self._ranked_children) if child is component)
+        del self._rank_keys[idx]
+        del self._ranked_children[idx]
+
     def is_composite(self) -> bool:
         return True
 
     def get_num_children(self) -> int:
+        if self._pending_children is not None:
+            return len(self._children) + self._pending_children[1]
         return len(self._children)
 
-    def get_children(self) -> list:
-        return self._children
+    def get_children(self, offset: int = 0, limit: int = None) -> list:
+        """
+        Returns a page of the children of this Card, in ranked order.
+        :param offset: the rank of the first child to return.
+        :param limit: the maximum number of children to return, all of them if None.
+        :return: the list of children.
+        """
+        self._build_pending_children()
+        if limit is None:
+            return self._ranked_children[offset:]
+        return self._ranked_children[offset:offset + limit]
+
+    def get_top_ranked_child(self):
+        """
+        Returns the child with the highest score, the first one on ties.
+        :return: the top-ranked child, or None if this Card has no children.
+        """
+        self._build_pending_children()
+        if not self._children:
+            return None
+        if self._sort_key is SortKey.SCORE:
+            return self._ranked_children[0]
+        return max(self._children, key=lambda component: component.score)
@@ -0,0 +1,92 @@
+import heapq
+
+QUERY_NODE = "query"
+CATEGORY_NODE = "category"
+CONCEPT_NODE = "concept"
+
+
+class ConceptGraph:
+    """
+    The concepts of all the Cards opened in a session, in one graph:
+    each search query links to the categories of its opened Cards,
+    each category to the concepts of its opened Cards.
+    Nodes are shared by all the Cards, and an edge is weighted by the number of Cards it comes from.
+    The version changes with the graph, so what is derived from it can be reused until then.
+    """
+    def __init__(self):
+        # Node id -> kind, in insertion order
+        self.nodes = dict()
+        # (source id, target id) -> weight
+        self.edges = dict()
+        # Node id -> sum of the weights of its edges
+        self._degrees = dict()
+        # Unique ids of the Cards already merged
+        self._card_ids = set()
+        self.version = 0
+
+    def add_card(self, card_id: str, search_query: str, category: str, concepts: list) -> bool:
+        """
+        Merges the concepts of an opened Card into the graph, once per Card.
+        :param card_id: the unique id of the Card.
+        :param search_query: the query the Card was found with.
+        :param category: the category of the Card.
+        :param concepts: the titles of the related concepts of the Card.
+        :return: True if the graph changed.
+        """
+        if card_id in self._card_ids:
+            return False
+        self._card_ids.add(card_id)
+
+        query_id = get_query_node_id(search_query)
+        self._add_node(query_id, QUERY_NODE)
+        self._add_node(category, CATEGORY_NODE)
+        self._add_edge(query_id, category)
+        for concept in dict.fromkeys(concepts):
+            # A concept named like the category is the category node itself: no self-loop
+            if concept == category:
+                continue
+            self._add_node(concept, CONCEPT_NODE)
+            self._add_edge(category, concept)
+        self.version += 1
+        return True
+
+    def _add_node(self, node_id: str, kind: str) -> None:
+        # The first kind wins: a concept named like a category is the category
+        if node_id not in self.nodes:
+            self.nodes[node_id] = kind
+            self._degrees[node_id] = 0
+
+    def _add_edge(self, source: str, target: str) -> None:
+        self.edges[(source, target)] = self.edges.get((source, target), 0) + 1
+        self._degrees[source] += 1
+        self._degrees[target] += 1
+
+    def get_degree(self, node_id: str) -> int:
+        return self._degrees[node_id]
+
+    def get_top_nodes(self, max_nodes: int) -> list:
+        """
+        Returns the most connected nodes, for graphs too large to draw whole.
+        :param max_nodes: the maximum number of nodes.
+        :return: the ids of the nodes with the highest weighted degree, the oldest first on ties, in insertion order.
+        """
+        if len(self.nodes) <= max_nodes:
+            return list(self.nodes)
+        order = {node_id: idx for idx, node_id in enumerate(self.nodes)}
+        top_nodes = heapq.nsmallest(max_nodes, self.nodes, key=lambda node_id: (-self._degrees[node_id],
+                                                                                order[node_id]))
+        return sorted(top_nodes, key=order.__getitem__)
+
+    def get_edges(self, node_ids) -> list:
+        """
+        Returns the edges between some nodes.
+        :param node_ids: the ids of the nodes.
+        :return: a list of (source id, target id, weight).
+        """
+        node_ids = set(node_ids)
+        return [(source, target, weight) for (source, target), weight in self.edges.items()
+                if source in node_ids and target in node_ids]
+
+
+def get_query_node_id(search_query: str) -> str:
+    return "Query: " + search_query
@@ -1,23 +1,151 @@
+import os
 from enum import Enum
 
 TDS_NUM_RESULTS = 30
 TDS_QA_NUM_RESULTS = 10
 TDS_QA_NUM_READER = 3
-TDS_KEYWORD_SEARCH_ENDPOINT = "http://18.188.152.226:8001/tds_keyword_search"
-TDS_DPR_SEARCH_ENDPOINT = "http://18.188.152.226:8001/tds_dpr_search"
-TDS_MIX_SEARCH_ENDPOINT = "http://18.188.152.226:8001/tds_mixed_search"
-TDS_QA_ENDPOINT = "http://18.188.152.226:8001/tds_qa_search"
-WIKIFIER_ENDPOINT = "http://13.59.84.78:8001/wikifier"
+# Search results scoring less are not shown
+SEARCH_SCORE_THRESHOLD = 0.65
+
+
+def _backend_urls(env_var: str, default: str) -> list:
+    return [url.strip().rstrip("/") for url in os.environ.get(env_var, default).split(",") if url.strip()]
+
+
+# Backend replicas, can be overridden with comma-separated lists of hosts
+TDS_BACKEND_URLS = _backend_urls("SEARCH_APP_TDS_URL", "http://18.188.152.226:8001")
+WIKIFIER_BACKEND_URLS = _backend_urls("SEARCH_APP_WIKIFIER_URL", "http://13.59.84.78:8001")
+RESTAURANT_BACKEND_URLS = _backend_urls("SEARCH_APP_RESTAURANT_URL", "http://18.217.36.47:8001")
+
+# JSON file {"tds": [...], "wikifier": [...], "restaurant": [...]} overriding the replicas above
+ENDPOINTS_CONFIG_PATH = os.environ.get("SEARCH_APP_ENDPOINTS_CONFIG", "")
+
+# The first replica names the backend in the endpoints, calls are spread over all the replicas
+TDS_BACKEND_URL = TDS_BACKEND_URLS[0]
+WIKIFIER_BACKEND_URL = WIKIFIER_BACKEND_URLS[0]
+RESTAURANT_BACKEND_URL = RESTAURANT_BACKEND_URLS[0]
+
+TDS_KEYWORD_SEARCH_ENDPOINT = TDS_BACKEND_URL + "/tds_keyword_search"
+TDS_DPR_SEARCH_ENDPOINT = TDS_BACKEND_URL + "/tds_dpr_search"
+TDS_MIX_SEARCH_ENDPOINT = TDS_BACKEND_URL + "/tds_mixed_search"
+TDS_QA_ENDPOINT = TDS_BACKEND_URL + "/tds_qa_search"
+
+# Client-side fusion of keyword and DPR search (TDSSearchEngineType.LOCAL_MIX)
+HYBRID_SEARCH_DEADLINE = 2.0
+HYBRID_BM_25_WEIGHT = 1.0
+HYBRID_DPR_WEIGHT = 1.0
+HYBRID_FUSION = "rrf"  # or "score"
+HYBRID_RRF_K = 60
+# Fused scores are normalized by the one of a result ranked first by every engine: with two engines,
+# a result found by both passes, a result found by one engine alone must be in its top ranks
+HYBRID_SCORE_THRESHOLD = 0.4
+HYBRID_MAX_WORKERS = 8
+
+WIKIFIER_ENDPOINT = WIKIFIER_BACKEND_URL + "/wikifier"
 WIKIFIER_THRESHOLD = 0.8
+WIKIFIER_BATCH_MAX_WORKERS = 8
 
 RESTAURANT_NUM_RESULTS = 30
-RESTAURANT_SEARCH_ENDPOINT = "http://18.217.36.47:8001/res_keyword_search"
+RESTAURANT_SEARCH_ENDPOINT = RESTAURANT_BACKEND_URL + "/res_keyword_search"
+
+# HTTP transport shared by all the backend calls
+HTTP_CONNECT_TIMEOUT = 3.05
+HTTP_READ_TIMEOUT = 30
+HTTP_MAX_RETRIES = 2
+HTTP_BACKOFF_FACTOR = 0.3
+HTTP_RETRY_STATUS_CODES = (502, 503, 504)
+HTTP_POOL_SIZE = 16
+
+# Replica pools: a duplicate request goes to another replica past the observed latency quantile
+HEDGE_QUANTILE = 0.95
+HEDGE_LATENCY_WINDOW = 256
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = 1.0
+HEDGE_MIN_DELAY = 0.01
+HEDGE_MAX_ATTEMPTS = 2
+# A replica failing this many times in a row is skipped until the reset timeout
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
+# Cache for TDS and restaurant search results
+CACHE_DIR = os.environ.get("SEARCH_APP_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "search_app"))
+RESULT_CACHE_DB_PATH = os.path.join(CACHE_DIR, "results.sqlite3")
+RESULT_CACHE_TTL = 24 * 60 * 60
+RESULT_CACHE_MAX_ENTRIES = 512
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_DISK_MAX_ENTRIES = 20000
+
+# Reuse of the search and QA results of similar queries: same terms up to case, punctuation,
+# word order and filler words, with a Jaccard similarity of at least the threshold and neither
+# query adding terms to the other
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEARCH_APP_SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_NUM_PERM = 64
+SEMANTIC_CACHE_BANDS = 16
+SEMANTIC_CACHE_MAX_ENTRIES = 2048
+
+# Cache for Wikifier concepts, shared by all sessions
+WIKIFIER_CACHE_DB_PATH = os.path.join(CACHE_DIR, "wikifier.sqlite3")
+WIKIFIER_CACHE_MAX_ENTRIES = 2048
+WIKIFIER_CACHE_MAX_BYTES = 16 * 1024 * 1024
+WIKIFIER_CACHE_DISK_MAX_ENTRIES = 100000
+
+# Background opening of the top-ranked Cards of an explored category
+PREFETCH_TOP_N = 3
+PREFETCH_MAX_WORKERS = 4
+PREFETCH_WAIT_TIMEOUT = HTTP_READ_TIMEOUT
+
+# Cards listed per page when exploring a root Card
+EXPLORE_PAGE_SIZES = (5, 10, 25, 50)
+EXPLORE_PAGE_SIZE = 10
+
+# Nodes drawn in the concept graph of a session, the most connected ones first
+CONCEPT_GRAPH_MAX_NODES = 60
+
+# Port of the Prometheus metrics endpoint, 0 disables it
+METRICS_PORT = int(os.environ.get("SEARCH_APP_METRICS_PORT", "0"))
+# Shows the latency and cache metrics in the sidebar
+METRICS_DEBUG_PANEL = os.environ.get("SEARCH_APP_DEBUG_PANEL", "0") == "1"
+
+
+# Local BM25 index of the TDS articles (TDSSearchEngineType.LOCAL_BM_25)
+BM25_INDEX_DIR = os.environ.get("SEARCH_APP_BM25_INDEX", os.path.join(CACHE_DIR, "bm25_index"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+BM25_BLOCK_SIZE = 128
+# Local BM25 scores are divided by the highest score the query terms could add up to
+BM25_SCORE_THRESHOLD = 0.3
+
+# Local dense index of the TDS articles (TDSSearchEngineType.LOCAL_DPR)
+DENSE_INDEX_DIR = os.environ.get("SEARCH_APP_DENSE_INDEX", os.path.join(CACHE_DIR, "dense_index"))
+# Query encoder, as 'module:function', if not registered by code
+DENSE_ENCODER = os.environ.get("SEARCH_APP_DENSE_ENCODER", "")
+# Inverted lists scanned per query, 0 for exact searches
+DENSE_NPROBE = 0
+# Vectors scored at once, bounds the memory used by a search
+DENSE_CHUNK_ROWS = 4096
+# Local dense scores are divided by the norm of the query times the largest norm of the articles:
+# the cosine similarity for vectors of the same norm
+DENSE_SCORE_THRESHOLD = 0.5
 
 
 class TDSSearchEngineType(Enum):
     BM_25 = 1
     DPR = 2
     MIX = 3
+    LOCAL_MIX = 4
+    LOCAL_BM_25 = 5
+    LOCAL_DPR = 6
+
+
+# Search engine used for TDS queries
+TDS_SEARCH_ENGINE_TYPE = TDSSearchEngineType.MIX
+
+
+class SortKey(Enum):
+    SCORE = 1
+    VOTES = 2
+    DATE = 3
+    RATING = 4
 
 
 class QueryType(Enum):
@@ -0,0 +1,283 @@
+"""
+Local dense (DPR-style) search over precomputed article embeddings.
+
+    python -m src.dense_index corpus.jsonl embeddings.npy --dtype int8 --nlist 256
+
+The corpus is a JSON lines file of articles shaped like the results of the search endpoints,
+embeddings.npy holds their passage embeddings, one row per article, in the same order.
+Queries are embedded by the encoder registered with set_query_encoder, or named by
+SEARCH_APP_DENSE_ENCODER as 'module:function'.
+"""
+import argparse
+import importlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from src.bm25_index import read_corpus
+from src.const import (DENSE_CHUNK_ROWS, DENSE_ENCODER, DENSE_INDEX_DIR, DENSE_NPROBE)
+from src.doc_store import (DocStore, write_doc_store)
+
+META_FILE = "dense_meta.json"
+VECTORS_FILE = "dense_vectors.npy"
+SCALES_FILE = "dense_scales.npy"
+DOC_IDS_FILE = "dense_doc_ids.npy"
+CENTROIDS_FILE = "dense_centroids.npy"
+LIST_OFFSETS_FILE = "dense_list_offsets.npy"
+
+
+def _quantize(vectors: np.ndarray, dtype: str) -> tuple:
+    """
+    Converts float vectors to the storage type.
+    int8 vectors are scaled per row, so that the largest component is 127.
+    :return: the stored vectors and the scale of each row, None for float16.
+    """
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def _max_norm(vectors: np.ndarray, chunk_rows: int, scales: np.ndarray = None) -> float:
+    """
+    Returns the largest norm of the vectors, read by chunks.
+    :param scales: the scale of each row of int8 vectors.
+    """
+    max_norm = 0.0
+    for start in range(0, len(vectors), chunk_rows):
+        norms = np.linalg.norm(np.asarray(vectors[start:start + chunk_rows], dtype=np.float32), axis=1)
+        if scales is not None:
+            norms *= scales[start:start + chunk_rows]
+        max_norm = max(max_norm, float(norms.max()))
+    return max_norm
+
+
+def _kmeans(vectors: np.ndarray, nlist: int, num_iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Clusters vectors by inner product, with Lloyd iterations on a sample.
+    :return: the centroids.
+    """
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(len(vectors), nlist * 64), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(num_iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        for list_id in range(nlist):
+            members = sample[assignment == list_id]
+            if len(members):
+                centroids[list_id] = members.mean(axis=0)
+    return centroids
+
+
+def build_dense_index(docs, embeddings: np.ndarray, index_dir: str, dtype: str = "float16", nlist: int = 0,
+                      chunk_rows: int = DENSE_CHUNK_ROWS) -> int:
+    """
+    Builds the dense index of a corpus.
+    With nlist > 0, the articles are clustered into nlist inverted lists for approximate
+    searches, and the vectors are stored list after list.
+    :param docs: an iterable of articles.
+    :param embeddings: the embedding of each article, in the same order.
+    :param index_dir: the directory to write the index to.
+    :param dtype: the storage type of the vectors, float16 or int8.
+    :param nlist: the number of inverted lists, 0 for exact searches only.
+    :param chunk_rows: the number of vectors assigned to lists at once.
+    :return: the number of articles indexed.
+    """
+    if dtype not in ("float16", "int8"):
+        raise ValueError("Unsupported vector type: " + dtype)
+    os.makedirs(index_dir, exist_ok=True)
+    num_docs = write_doc_store(docs, index_dir)
+    if num_docs != len(embeddings):
+        raise ValueError("Got " + str(len(embeddings)) + " embeddings for " + str(num_docs) + " articles")
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+
+    doc_ids = np.arange(num_docs)
+    list_offsets = np.array([0, num_docs])
+    nlist = min(nlist, num_docs)
+    if nlist:
+        centroids = _kmeans(embeddings, nlist)
+        assignment = np.concatenate([np.argmax(embeddings[start:start + chunk_rows] @ centroids.T, axis=1)
+                                     for start in range(0, num_docs, chunk_rows)])
+        doc_ids = np.argsort(assignment, kind="stable")
+        list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=nlist))))
+        np.save(os.path.join(index_dir, CENTROIDS_FILE), centroids)
+
+    # Scores are computed from the stored vectors: so is their largest norm
+    vectors, scales = _quantize(embeddings[doc_ids], dtype)
+    max_norm = _max_norm(vectors, chunk_rows, scales)
+    np.save(os.path.join(index_dir, VECTORS_FILE), vectors)
+    if scales is not None:
+        np.save(os.path.join(index_dir, SCALES_FILE), scales)
+    np.save(os.path.join(index_dir, DOC_IDS_FILE), doc_ids.astype(np.int64))
+    np.save(os.path.join(index_dir, LIST_OFFSETS_FILE), list_offsets.astype(np.int64))
+
+    # Written last: an index without its meta file is incomplete
+    with open(os.path.join(index_dir, META_FILE), "w") as meta_file:
+        json.dump({"num_docs": num_docs, "dim": int(embeddings.shape[1]), "dtype": dtype, "nlist": nlist,
+                   "max_norm": max_norm}, meta_file)
+    return num_docs
+
+
+class DenseIndex:
+    """
+    A dense index on local disk, memory-mapped: its memory footprint is the size of the vectors
+    in the page cache plus one chunk of float32 scores per search.
+    Exact searches scan all the vectors by chunks, approximate searches scan the nprobe
+    inverted lists closest to each query: more lists, better recall, slower searches.
+    """
+    def __init__(self, index_dir: str, chunk_rows: int = DENSE_CHUNK_ROWS):
+        with open(os.path.join(index_dir, META_FILE)) as meta_file:
+            meta = json.load(meta_file)
+        self.num_docs = meta["num_docs"]
+        self.dim = meta["dim"]
+        self.dtype = meta["dtype"]
+        self.nlist = meta["nlist"]
+        self.chunk_rows = chunk_rows
+
+        self._vectors = np.load(os.path.join(index_dir, VECTORS_FILE), mmap_mode="r")
+        self._scales = np.load(os.path.join(index_dir, SCALES_FILE)) if self.dtype == "int8" else None
+        self._doc_ids = np.load(os.path.join(index_dir, DOC_IDS_FILE), mmap_mode="r")
+        self._list_offsets = np.load(os.path.join(index_dir, LIST_OFFSETS_FILE))
+        self._centroids = np.load(os.path.join(index_dir, CENTROIDS_FILE)) if self.nlist else None
+        self.docs = DocStore(index_dir)
+
+        # Largest norm of the article vectors, computed here for the indexes built without it
+        self.max_norm = meta.get("max_norm")
+        if self.max_norm is None:
+            self.max_norm = _max_norm(self._vectors, chunk_rows, self._scales)
+
+    def get_max_score(self, query: np.ndarray) -> float:
+        """
+        Returns an upper bound of the scores of a query: its inner product with an article vector
+        can be at most the product of their norms.
+        :param query: the query embedding.
+        :return: the upper bound.
+        """
+        return float(np.linalg.norm(np.asarray(query, dtype=np.float32))) * self.max_norm
+
+    def _score_rows(self, start: int, end: int, queries: np.ndarray) -> np.ndarray:
+        """
+        Scores a range of stored vectors against the queries.
+        :return: the inner products, one row per query.
+        """
+        scores = queries @ self._vectors[start:end].astype(np.float32).T
+        if self._scales is not None:
+            scores *= self._scales[start:end]
+        return scores
+
+    def search(self, queries: np.ndarray, k: int, nprobe: int = DENSE_NPROBE) -> list:
+        """
+        Returns the k articles with the highest inner product with each query.
+        :param queries: the query embeddings, one row per query.
+        :param k: the number of articles to return per query.
+        :param nprobe: the number of inverted lists to scan, 0 (or an index without lists) for an exact search.
+        :return: for each query, a list of (article id, score) by decreasing score.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if nprobe and self.nlist:
+            return [self._search_lists(query, k, nprobe) for query in queries]
+
+        # Keep the best k of each chunk, then the best k overall
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.num_docs, self.chunk_rows):
+            end = min(start + self.chunk_rows, self.num_docs)
+            scores = self._score_rows(start, end, queries)
+            rows = _top_k(scores, k) + start
+            best_rows = np.concatenate((best_rows, rows), axis=1)
+            best_scores = np.concatenate((best_scores, np.take_along_axis(scores, rows - start, axis=1)), axis=1)
+        return [self._hits(rows, scores, k) for rows, scores in zip(best_rows, best_scores)]
+
+    def _search_lists(self, query: np.ndarray, k: int, nprobe: int) -> list:
+        lists = _top_k((self._centroids @ query)[None, :], nprobe)[0]
+        rows = list()
+        scores = list()
+        for list_id in lists:
+            start, end = self._list_offsets[list_id], self._list_offsets[list_id + 1]
+            for chunk_start in range(start, end, self.chunk_rows):
+                chunk_end = min(chunk_start + self.chunk_rows, end)
+                rows.append(np.arange(chunk_start, chunk_end))
+                scores.append(self._score_rows(chunk_start, chunk_end, query[None, :])[0])
+        if not rows:
+            return list()
+        return self._hits(np.concatenate(rows), np.concatenate(scores), k)
+
+    def _hits(self, rows: np.ndarray, scores: np.ndarray, k: int) -> list:
+        # Best scores first, then the first articles of the corpus
+        doc_ids = self._doc_ids[rows]
+        top = np.lexsort((doc_ids, -scores))[:k]
+        return [(int(doc_ids[idx]), float(scores[idx])) for idx in top]
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Returns the columns of the k highest scores of each row, in no particular order.
+    """
+    if scores.shape[1] <= k:
+        return np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+_query_encoder = None
+
+
+def set_query_encoder(encoder) -> None:
+    """
+    Registers the function embedding the queries, e.g. the question encoder of the DPR model.
+    :param encoder: a function taking a list of queries and returning their embeddings, one row per query.
+    :return: None
+    """
+    global _query_encoder
+    _query_encoder = encoder
+
+
+def get_query_encoder():
+    """
+    Returns the registered query encoder, or the one named by SEARCH_APP_DENSE_ENCODER.
+    :return: the encoder, or None if there is none.
+    """
+    global _query_encoder
+    if _query_encoder is None and DENSE_ENCODER:
+        module_name, _, function_name = DENSE_ENCODER.partition(":")
+        _query_encoder = getattr(importlib.import_module(module_name), function_name)
+    return _query_encoder
+
+
+_index = None
+_index_loaded = False
+_index_lock = threading.Lock()
+
+
+def get_dense_index():
+    """
+    Returns the process-wide local dense index, loaded on first use.
+    :return: the index, or None if no index was built.
+    """
+    global _index, _index_loaded
+    if not _index_loaded:
+        with _index_lock:
+            if not _index_loaded:
+                if os.path.exists(os.path.join(DENSE_INDEX_DIR, META_FILE)):
+                    _index = DenseIndex(DENSE_INDEX_DIR)
+                _index_loaded = True
+    return _index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the local dense index of a corpus dump.")
+    parser.add_argument("corpus", help="JSON lines file of articles")
+    parser.add_argument("embeddings", help=".npy matrix of the article embeddings, in the corpus order")
+    parser.add_argument("index_dir", nargs="?", default=DENSE_INDEX_DIR)
+    parser.add_argument("--dtype", choices=("float16", "int8"), default="float16")
+    parser.add_argument("--nlist", type=int, default=0, help="number of inverted lists, 0 for exact searches only")
+    args = parser.parse_args()
+    num_docs = build_dense_index(read_corpus(args.corpus), np.load(args.embeddings, mmap_mode="r"), args.index_dir,
+                                 dtype=args.dtype, nlist=args.nlist)
+    print("Indexed " + str(num_docs) + " articles in " + args.index_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import json
+import mmap
+import os
+
+import numpy as np
+
+from src.json_codec import decode_json
+
+DOCS_FILE = "docs.jsonl"
+OFFSETS_FILE = "docs_offsets.npy"
+
+
+class DocStore:
+    """
+    Read-only store of the documents of a local index.
+    Documents are JSON lines in a memory-mapped file, found through a table of line offsets:
+    only the documents returned by a search are read and decoded.
+    """
+    def __init__(self, index_dir: str):
+        self._offsets = np.load(os.path.join(index_dir, OFFSETS_FILE), mmap_mode="r")
+        with open(os.path.join(index_dir, DOCS_FILE), "rb") as docs_file:
+            self._data = mmap.mmap(docs_file.fileno(), 0, access=mmap.ACCESS_READ) if len(self) else b""
+
+    def get(self, doc_id: int) -> dict:
+        """
+        Returns a document.
+        :param doc_id: the position of the document in the corpus.
+        :return: the document.
+        """
+        return decode_json(self._data[int(self._offsets[doc_id]):int(self._offsets[doc_id + 1])])
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+
+def write_doc_store(docs, index_dir: str) -> int:
+    """
+    Writes documents to a new store.
+    :param docs: an iterable of JSON-serializable documents.
+    :param index_dir: the directory of the index.
+    :return: the number of documents written.
+    """
+    offsets = [0]
+    with open(os.path.join(index_dir, DOCS_FILE), "wb") as docs_file:
+        for doc in docs:
+            line = json.dumps(doc, separators=(',', ':')).encode("utf-8") + b"\n"
+            docs_file.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(os.path.join(index_dir, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+    return len(offsets) - 1
@@ -0,0 +1,255 @@
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, ThreadPoolExecutor, wait)
+from urllib.parse import urlsplit
+
+from src.const import (BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT, ENDPOINTS_CONFIG_PATH, HEDGE_DEFAULT_DELAY,
+                       HEDGE_LATENCY_WINDOW, HEDGE_MAX_ATTEMPTS, HEDGE_MIN_DELAY, HEDGE_MIN_SAMPLES, HEDGE_QUANTILE,
+                       HTTP_POOL_SIZE, RESTAURANT_BACKEND_URL, RESTAURANT_BACKEND_URLS, TDS_BACKEND_URL,
+                       TDS_BACKEND_URLS, WIKIFIER_BACKEND_URL, WIKIFIER_BACKEND_URLS)
+from src.metrics import (propagate_trace, register_collector)
+
+# Runs the calls of the pools with more than one replica, so they can be hedged
+_executor = ThreadPoolExecutor(max_workers=2 * HTTP_POOL_SIZE, thread_name_prefix="backend-call")
+
+
+class BackendError(Exception):
+    """
+    A backend call failed: connection error, timeout, error status or malformed body.
+    """
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a replica after consecutive failures.
+    Once the reset timeout has elapsed, a single trial request is let through:
+    its success closes the circuit again, its failure keeps it open.
+    """
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._num_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Checks whether a request can be sent, claiming the trial request of an open circuit.
+        :return: True if the request can be sent.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial_in_flight and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._num_failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._num_failures += 1
+            self._trial_in_flight = False
+            if self._num_failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+
+class Replica:
+    """
+    One server of a backend, with its own circuit breaker.
+    """
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.breaker = CircuitBreaker()
+
+
+class ReplicaPool:
+    """
+    The replicas serving a backend.
+    Calls are spread over the replicas in turn. A call not answered by the observed
+    latency quantile is duplicated to the next replica and the first answer wins;
+    a failed call is retried at once on the next replica.
+    """
+    def __init__(self, name: str, base_urls: list):
+        self.name = name
+        self.replicas = [Replica(base_url) for base_url in base_urls]
+        self._turn = itertools.count()
+
+        # Latency of the last successful calls, in seconds
+        self._latencies = deque(maxlen=HEDGE_LATENCY_WINDOW)
+
+        self.num_hedges = 0
+        self.num_failovers = 0
+
+    def get_hedge_delay(self) -> float:
+        """
+        Returns how long to wait for a replica before sending the same call to another one.
+        :return: the delay, in seconds.
+        """
+        latencies = sorted(self._latencies)
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, latencies[int(HEDGE_QUANTILE * (len(latencies) - 1))])
+
+    def call(self, attempt, discard=None):
+        """
+        Runs a call on the replicas of the pool.
+        :param attempt: sends the call to the replica with the given base URL,
+        returns the result or raises BackendError.
+        :param discard: releases the result of an attempt that lost the race, e.g. closes a response.
+        :return: the result of the first successful attempt.
+        """
+        if len(self.replicas) == 1:
+            replica = self.replicas[0]
+            if not replica.breaker.allow():
+                raise BackendError(self.name + ": circuit open")
+            return self._run(replica, attempt)
+
+        # Next replicas in turn, skipping the ones with an open circuit
+        start = next(self._turn) % len(self.replicas)
+        candidates = iter(self.replicas[start:] + self.replicas[:start])
+
+        def launch():
+            for replica in candidates:
+                if replica.breaker.allow():
+                    return _executor.submit(propagate_trace(self._run), replica, attempt)
+            return None
+
+        future = launch()
+        if future is None:
+            raise BackendError(self.name + ": all circuits open")
+        in_flight = {future}
+        num_attempts = 1
+        error = None
+        while in_flight:
+            can_launch = num_attempts < HEDGE_MAX_ATTEMPTS
+            done, in_flight = wait(in_flight, timeout=self.get_hedge_delay() if can_launch else None,
+                                   return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except BackendError as attempt_error:
+                    error = attempt_error
+                    continue
+                if discard is not None:
+                    for other in (done | in_flight) - {future}:
+                        other.add_done_callback(lambda other: _discard_result(other, discard))
+                return result
+
+            # Hedge a slow call, or fail over once every call in flight has failed
+            if can_launch and (not done or not in_flight):
+                future = launch()
+                if future is not None:
+                    if in_flight:
+                        self.num_hedges += 1
+                    else:
+                        self.num_failovers += 1
+                    in_flight.add(future)
+                    num_attempts += 1
+        raise error
+
+    def _run(self, replica: Replica, attempt):
+        start = time.perf_counter()
+        try:
+            result = attempt(replica.base_url)
+        except BackendError:
+            replica.breaker.record_failure()
+            raise
+        replica.breaker.record_success()
+        self._latencies.append(time.perf_counter() - start)
+        return result
+
+
+def _discard_result(future, discard) -> None:
+    if not future.cancelled() and future.exception() is None:
+        discard(future.result())
+
+
+def _host(url: str) -> str:
+    parts = urlsplit(url)
+    return parts.scheme + "://" + parts.netloc
+
+
+def _load_pools() -> dict:
+    """
+    Builds the pool of each backend from the environment, or from the config file if any.
+    The pools are keyed by the host naming the backend in the endpoints.
+    """
+    backends = {
+        "tds": (TDS_BACKEND_URL, TDS_BACKEND_URLS),
+        "wikifier": (WIKIFIER_BACKEND_URL, WIKIFIER_BACKEND_URLS),
+        "restaurant": (RESTAURANT_BACKEND_URL, RESTAURANT_BACKEND_URLS),
+    }
+    config = dict()
+    if ENDPOINTS_CONFIG_PATH:
+        with open(ENDPOINTS_CONFIG_PATH) as config_file:
+            config = json.load(config_file)
+
+    pools = dict()
+    for name, (backend_url, base_urls) in backends.items():
+        base_urls = [url.rstrip("/") for url in config.get(name, base_urls)]
+        pools[_host(backend_url)] = ReplicaPool(name, base_urls)
+    return pools
+
+
+_pools = None
+_pools_lock = threading.Lock()
+
+
+def get_pools() -> dict:
+    """
+    Returns the process-wide replica pools, created on first use.
+    :return: a dict host naming the backend -> pool.
+    """
+    global _pools
+    if _pools is None:
+        with _pools_lock:
+            if _pools is None:
+                _pools = _load_pools()
+    return _pools
+
+
+def find_pool(url: str):
+    """
+    Finds the pool serving an endpoint.
+    :param url: the endpoint URL.
+    :return: the pool and the path of the endpoint, or (None, None) for hosts outside the pools.
+    """
+    host = _host(url)
+    pool = get_pools().get(host)
+    if pool is None:
+        return None, None
+    return pool, url[len(host):]
+
+
+def _collect_pool_metrics() -> list:
+    samples = list()
+    for pool in (_pools or dict()).values():
+        labels = {"backend": pool.name}
+        samples.append(("search_app_hedged_calls_total", "counter",
+                        "Calls duplicated to another replica after the hedge delay.", labels, pool.num_hedges))
+        samples.append(("search_app_failover_calls_total", "counter",
+                        "Calls retried on another replica after a failure.", labels, pool.num_failovers))
+        samples.append(("search_app_hedge_delay_seconds", "gauge", "Current hedge delay of a backend.", labels,
+                        pool.get_hedge_delay()))
+        for replica in pool.replicas:
+            samples.append(("search_app_replica_up", "gauge", "1 unless the circuit of the replica is open.",
+                            {"backend": pool.name, "replica": replica.base_url}, 0 if replica.breaker.is_open() else 1))
+    return samples
+
+
+register_collector(_collect_pool_metrics)
@@ -0,0 +1,57 @@
+def _fuse(result_lists: list, weights: list, contribution, max_contribution: float) -> list:
+    """
+    Merges ranked lists of search results, deduplicated by URL.
+    The fused score of a result replaces its score, normalized by the best possible fused score,
+    the one of a result ranked first by every engine: it is the ranking key of the results,
+    and the usual score threshold applies to it.
+    :param result_lists: the ranked lists of results, one per engine.
+    :param weights: the weight of each engine.
+    :param contribution: returns the contribution of a result given its rank and its list.
+    :param max_contribution: the contribution of the first result of a list.
+    :return: the fused list of results, by descending fused score.
+    """
+    fused = dict()
+    for results, weight in zip(result_lists, weights):
+        for rank, res in enumerate(results):
+            url = res["url"]
+            value = weight * contribution(rank, res, results)
+            if url not in fused:
+                # Copy: the results may be shared with the results cache
+                fused[url] = dict(res, score=value)
+            else:
+                fused[url]["score"] += value
+
+    best_score = sum(weights) * max_contribution
+    for res in fused.values():
+        res["score"] = res["score"] / best_score if best_score > 0 else 0.0
+    return sorted(fused.values(), key=lambda res: res["score"], reverse=True)
+
+
+def reciprocal_rank_fusion(result_lists: list, weights: list, k: int = 60) -> list:
+    """
+    Weighted reciprocal-rank fusion: a result at rank r contributes weight / (k + r + 1).
+    :param result_lists: the ranked lists of results, one per engine.
+    :param weights: the weight of each engine.
+    :param k: dampens the advantage of the top ranks.
+    :return: the fused list of results.
+    """
+    return _fuse(result_lists, weights, lambda rank, res, results: 1.0 / (k + rank + 1), 1.0 / (k + 1))
+
+
+def score_normalized_fusion(result_lists: list, weights: list) -> list:
+    """
+    Weighted sum of the min-max normalized scores of each engine.
+    :param result_lists: the ranked lists of results, one per engine.
+    :param weights: the weight of each engine.
+    :return: the fused list of results.
+    """
+    bounds = dict()
+    for results in result_lists:
+        scores = [res["score"] for res in results]
+        bounds[id(results)] = (min(scores), max(scores)) if scores else (0.0, 0.0)
+
+    def normalized_score(rank, res, results):
+        low, high = bounds[id(results)]
+        return (res["score"] - low) / (high - low) if high > low else 1.0
+
+    return _fuse(result_lists, weights, normalized_score, 1.0)
@@ -0,0 +1,221 @@
+import json
+
+from src.metrics import get_logger
+
+# Optional fast JSON backends, fastest first
+try:
+    import orjson
+
+    JSON_BACKEND = "orjson"
+    _loads = orjson.loads
+except ImportError:
+    try:
+        import msgspec
+
+        JSON_BACKEND = "msgspec"
+        _loads = msgspec.json.Decoder().decode
+    except ImportError:
+        # json.loads detects the UTF encoding of bytes itself
+        JSON_BACKEND = "json"
+        _loads = json.loads
+
+_NUMBER = (int, float)
+
+logger = get_logger("json_codec")
+
+
+class SchemaError(ValueError):
+    """
+    Raised when a backend response does not have the expected shape.
+    """
+    pass
+
+
+# Fields and their types for each response item.
+# Only the fields the app reads are checked, extra fields are kept as they are.
+TDS_RESULT_SCHEMA = {
+    "score": _NUMBER,
+    "image": str,
+    "title": str,
+    "url": str,
+    "category": str,
+    "summary": str,
+}
+
+# Optional fields, and the value they take when missing or null
+TDS_RESULT_DEFAULTS = {
+    "image": "",
+    "summary": "",
+}
+
+QA_RESULT_SCHEMA = {
+    "answer": str,
+    "score": _NUMBER,
+    "card": dict,
+}
+
+QA_CARD_SCHEMA = {
+    "title": str,
+    "url": str,
+    "summary": str,
+}
+
+QA_CARD_DEFAULTS = {
+    "summary": "",
+}
+
+RESTAURANT_RESULT_SCHEMA = {
+    "score": _NUMBER,
+    "meta": dict,
+    "context": str,
+    "info": dict,
+}
+
+RESTAURANT_RESULT_DEFAULTS = {
+    "context": "",
+}
+
+RESTAURANT_INFO_SCHEMA = {
+    "name": str,
+    "url": str,
+    "categories": list,
+}
+
+WIKIFIER_ENTITY_SCHEMA = {
+    "title": str,
+    "label": str,
+    "url": str,
+}
+
+
+def decode_json(raw: bytes):
+    """
+    Decodes a JSON body straight from bytes, without building an intermediate str.
+    :param raw: the raw response body.
+    :return: the decoded JSON value.
+    """
+    try:
+        return _loads(raw)
+    except ValueError:
+        raise
+    except Exception as e:
+        # msgspec raises its own error types
+        raise ValueError(str(e)) from e
+
+
+def _check_item(item, schema: dict, name: str, defaults: dict = None) -> None:
+    if not isinstance(item, dict):
+        raise SchemaError(name + " is not an object")
+    for field, field_type in schema.items():
+        value = item.get(field)
+        if value is None and defaults and field in defaults:
+            item[field] = defaults[field]
+        elif not isinstance(value, field_type):
+            raise SchemaError(name + "." + field + " is missing or has the wrong type")
+
+
+def _skip_invalid(check_item, item, name: str):
+    # A bad item is dropped, the other items of the response are kept
+    try:
+        return check_item(item)
+    except SchemaError as error:
+        logger.warning("Skipping an invalid %s item: %s", name, error)
+        return None
+
+
+def _decode_list(raw: bytes, list_key: str, check_item, name: str) -> dict:
+    result = decode_json(raw)
+    if not isinstance(result, dict) or list_key not in result:
+        raise SchemaError(name + " response has no '" + list_key + "' list")
+    items = result[list_key]
+    if items is None:
+        # A null list has no items
+        items = list()
+    elif not isinstance(items, list):
+        raise SchemaError(name + " response has no '" + list_key + "' list")
+    result[list_key] = [item for item in (_skip_invalid(check_item, item, name) for item in items)
+                        if item is not None]
+    return result
+
+
+def decode_search_response(raw: bytes) -> dict:
+    """
+    Decodes and checks a TDS search response: {"result": [TDS result, ...]}.
+    Invalid results are skipped.
+    :param raw: the raw response body.
+    :return: the decoded response.
+    """
+    return _decode_list(raw, "result", _check_search_result, "search")
+
+
+def _check_search_result(item) -> dict:
+    _check_item(item, TDS_RESULT_SCHEMA, "search", TDS_RESULT_DEFAULTS)
+    return item
+
+
+def check_search_result(item):
+    """
+    Checks a single TDS search result, e.g. a line of a streamed response.
+    :param item: the decoded result.
+    :return: the result, or None if it is invalid and must be skipped.
+    """
+    return _skip_invalid(_check_search_result, item, "search")
+
+
+def _check_qa_result(item) -> dict:
+    _check_item(item, QA_RESULT_SCHEMA, "qa")
+    _check_item(item["card"], QA_CARD_SCHEMA, "qa.card", QA_CARD_DEFAULTS)
+    return item
+
+
+def decode_qa_response(raw: bytes) -> dict:
+    """
+    Decodes and checks a TDS QA response: {"result": [answer, ...]}.
+    Invalid answers are skipped.
+    :param raw: the raw response body.
+    :return: the decoded response.
+    """
+    return _decode_list(raw, "result", _check_qa_result, "qa")
+
+
+def _check_restaurant_result(item) -> dict:
+    _check_item(item, RESTAURANT_RESULT_SCHEMA, "restaurant", RESTAURANT_RESULT_DEFAULTS)
+    _check_item(item["info"], RESTAURANT_INFO_SCHEMA, "restaurant.info")
+    # The first category is the one the results are grouped by
+    if not item["info"]["categories"]:
+        raise SchemaError("restaurant.info.categories is empty")
+    return item
+
+
+def decode_restaurant_response(raw: bytes) -> dict:
+    """
+    Decodes and checks a restaurant search response: {"result": [restaurant result, ...]}.
+    Invalid results are skipped.
+    :param raw: the raw response body.
+    :return: the decoded response.
+    """
+    return _decode_list(raw, "result", _check_restaurant_result, "restaurant")
+
+
+def check_restaurant_result(item):
+    """
+    Checks a single restaurant search result, e.g. a line of a streamed response.
+    :param item: the decoded result.
+    :return: the result, or None if it is invalid and must be skipped.
+    """
+    return _skip_invalid(_check_restaurant_result, item, "restaurant")
+
+
+def _check_wikifier_entity(item) -> dict:
+    _check_item(item, WIKIFIER_ENTITY_SCHEMA, "wikifier")
+    return item
+
+
+def decode_wikifier_response(raw: bytes) -> dict:
+    """
+    Decodes and checks a Wikifier response: {"entities": [entity, ...]}.
+    Invalid entities are skipped, null entities are an empty list.
+    :param raw: the raw response body.
+    :return: the decoded response.
+    """
+    return _decode_list(raw, "entities", _check_wikifier_entity, "wikifier")
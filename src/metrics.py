@@ -0,0 +1,275 @@
+import contextvars
+import functools
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from http.server import (BaseHTTPRequestHandler, ThreadingHTTPServer)
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Trace identifier of the query being processed, attached to the log lines
+_trace_id = contextvars.ContextVar("trace_id", default="-")
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets, in the Prometheus style.
+    """
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile as the upper bound of the bucket it falls in.
+        :param q: the quantile, between 0 and 1.
+        :return: the estimated value, in seconds.
+        """
+        with self._lock:
+            rank = q * self.count
+            cumulative = 0
+            for idx, count in enumerate(self.counts):
+                cumulative += count
+                if cumulative >= rank and count:
+                    return self.buckets[idx] if idx < len(self.buckets) else float("inf")
+        return 0.0
+
+
+_histograms = dict()
+_histograms_lock = threading.Lock()
+
+# Functions returning extra samples: lists of (name, type, help, labels, value)
+_collectors = list()
+
+
+def observe(stage: str, seconds: float) -> None:
+    """
+    Records the duration of a stage of the search pipeline.
+    :param stage: the name of the stage.
+    :param seconds: the duration.
+    :return: None
+    """
+    histogram = _histograms.get(stage)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(stage, Histogram())
+    histogram.observe(seconds)
+
+
+class timed:
+    """
+    Times a stage, as a context manager or as a function decorator:
+
+        with timed("decode"):
+            ...
+
+        @timed("merge_cards")
+        def merge_cards(...):
+    """
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self._start
+        observe(self.stage, self.elapsed)
+        return False
+
+    def __call__(self, fn):
+        stage = self.stage
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(stage, time.perf_counter() - start)
+        return wrapper
+
+
+def register_collector(collector) -> None:
+    """
+    Registers a function returning extra samples for the metrics export,
+    as a list of (name, type, help, labels, value).
+    :param collector: the function.
+    :return: None
+    """
+    _collectors.append(collector)
+
+
+def get_stage_summary() -> list:
+    """
+    Returns the count, mean, p50 and p95 latency of each stage, in milliseconds.
+    :return: a list with a summary per stage.
+    """
+    summary = list()
+    for stage, histogram in sorted(_histograms.items()):
+        summary.append({
+            "stage": stage,
+            "count": histogram.count,
+            "mean_ms": histogram.sum / histogram.count * 1000 if histogram.count else 0.0,
+            "p50_ms": histogram.quantile(0.5) * 1000,
+            "p95_ms": histogram.quantile(0.95) * 1000,
+        })
+    return summary
+
+
+def collect_samples() -> list:
+    """
+    Returns the samples of all the registered collectors.
+    :return: a list of (name, type, help, labels, value).
+    """
+    samples = list()
+    for collector in _collectors:
+        samples.extend(collector())
+    return samples
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(key + '="' + str(value).replace('"', '\\"') + '"' for key, value in labels.items()) + "}"
+
+
+def render_prometheus() -> str:
+    """
+    Renders all the metrics in the Prometheus text exposition format.
+    :return: the metrics text.
+    """
+    lines = ["# HELP search_app_stage_seconds Latency of each stage of the search pipeline.",
+             "# TYPE search_app_stage_seconds histogram"]
+    for stage, histogram in sorted(_histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append("search_app_stage_seconds_bucket" + _format_labels({"stage": stage, "le": le}) +
+                         " " + str(cumulative))
+        lines.append("search_app_stage_seconds_sum" + _format_labels({"stage": stage}) + " " + repr(histogram.sum))
+        lines.append("search_app_stage_seconds_count" + _format_labels({"stage": stage}) + " " +
+                     str(histogram.count))
+
+    # The samples of a metric must be contiguous
+    described = set()
+    for name, metric_type, help_text, labels, value in sorted(collect_samples(), key=lambda sample: sample[0]):
+        if name not in described:
+            described.add(name)
+            lines.append("# HELP " + name + " " + help_text)
+            lines.append("# TYPE " + name + " " + metric_type)
+        lines.append(name + _format_labels(labels) + " " + repr(float(value)))
+    return "\n".join(lines) + "\n"
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> None:
+    """
+    Serves the metrics on http://host:port/metrics from a background thread.
+    Only the first call in a process starts the server.
+    :param port: the port to listen on.
+    :param host: the interface to listen on.
+    :return: None
+    """
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is not None:
+            return
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                data = render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        _metrics_server = ThreadingHTTPServer((host, port), Handler)
+        _metrics_server.daemon_threads = True
+        threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+
+
+# ------- Tracing ------ #
+
+
+def new_trace_id() -> str:
+    """
+    Starts a new trace for the query being processed by this thread.
+    :return: the new trace identifier.
+    """
+    trace_id = uuid.uuid4().hex[:12]
+    _trace_id.set(trace_id)
+    return trace_id
+
+
+def get_trace_id() -> str:
+    return _trace_id.get()
+
+
+def propagate_trace(fn):
+    """
+    Wraps a function submitted to another thread so it runs under the current trace.
+    :param fn: the function.
+    :return: the wrapped function.
+    """
+    trace_id = _trace_id.get()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _trace_id.set(trace_id)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _trace_id.reset(token)
+    return wrapper
+
+
+class TraceIdFilter(logging.Filter):
+    """
+    Adds the current trace identifier to the log records as 'trace_id'.
+    """
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = _trace_id.get()
+        return True
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Returns a logger of the app, its records carry the current trace identifier.
+    :param name: the name of the logger, under 'search_app'.
+    :return: the logger.
+    """
+    root = logging.getLogger("search_app")
+    if not root.handlers:
+        handler = logging.StreamHandler()
+        handler.addFilter(TraceIdFilter())
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [trace=%(trace_id)s] %(name)s: "
+                                               "%(message)s"))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        root.propagate = False
+    return root.getChild(name)
@@ -0,0 +1,121 @@
+import heapq
+import threading
+from concurrent.futures import (CancelledError, ThreadPoolExecutor, TimeoutError)
+
+from src.const import (PREFETCH_MAX_WORKERS, PREFETCH_TOP_N, PREFETCH_WAIT_TIMEOUT)
+from src.metrics import propagate_trace
+
+
+class CardPrefetcher:
+    """
+    Opens Cards in the background before the user asks for them.
+    A single bounded pool is shared by all the sessions. Card ids depend on the content only,
+    so the sessions requesting the same Card share its prefetch: each session (owner) can drop
+    the prefetches it requested once it moves to another query, and a prefetch is only cancelled
+    once no session requests it anymore.
+    """
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="card-prefetch")
+
+        # Reentrant: cancelling a future runs its done callback right away
+        self._lock = threading.RLock()
+
+        # Card unique id -> future opening the Card
+        self._futures = dict()
+
+        # Card unique id -> owners requesting that Card
+        self._requesters = dict()
+
+        # Owner -> set of Card unique ids requested by that owner, while some are pending
+        self._owners = dict()
+
+    def prefetch(self, owner: str, cards: list, top_n: int = PREFETCH_TOP_N) -> None:
+        """
+        Starts opening the top-n Cards by score in the background.
+        Cards already opened are skipped, Cards already being opened are shared.
+        :param owner: the key of the session requesting the prefetch.
+        :param cards: the candidate Cards.
+        :param top_n: the number of Cards to open.
+        :return: None
+        """
+        top_cards = heapq.nlargest(top_n, cards, key=lambda card: card.score)
+        with self._lock:
+            for card in top_cards:
+                card_id = card.get_unique_id()
+                if card.related_concepts:
+                    continue
+                future = self._futures.get(card_id)
+                is_new = future is None
+                if is_new:
+                    future = self._executor.submit(propagate_trace(card.open_card))
+                    self._futures[card_id] = future
+                    self._requesters[card_id] = set()
+                self._requesters[card_id].add(owner)
+                self._owners.setdefault(owner, set()).add(card_id)
+                if is_new:
+                    # Registered last: the callback runs right away if the prefetch is already done
+                    future.add_done_callback(lambda _, card_id=card_id: self._forget(card_id))
+
+    def cancel(self, owner: str) -> None:
+        """
+        Drops the prefetches of an owner, and cancels the ones no other owner requests that have not started yet.
+        Running prefetches complete and still populate the Wikifier cache.
+        :param owner: the key of the session.
+        :return: None
+        """
+        with self._lock:
+            for card_id in self._owners.pop(owner, set()):
+                requesters = self._requesters.get(card_id)
+                if requesters is None:
+                    continue
+                requesters.discard(owner)
+                if not requesters:
+                    self._futures[card_id].cancel()
+
+    def wait(self, card, timeout: float = PREFETCH_WAIT_TIMEOUT) -> None:
+        """
+        Waits for a pending prefetch of the given Card, if any.
+        :param card: the Card about to be opened.
+        :param timeout: the maximum time to wait, in seconds.
+        :return: None
+        """
+        with self._lock:
+            future = self._futures.get(card.get_unique_id())
+        if future is None:
+            return
+        try:
+            future.result(timeout=timeout)
+        except (CancelledError, TimeoutError):
+            pass
+        except Exception:
+            # The Card will be opened again in the foreground
+            pass
+
+    def _forget(self, card_id: str) -> None:
+        with self._lock:
+            self._futures.pop(card_id, None)
+            for owner in self._requesters.pop(card_id, set()):
+                owned = self._owners.get(owner)
+                if owned is None:
+                    continue
+                owned.discard(card_id)
+                if not owned:
+                    # Nothing left pending for this owner
+                    del self._owners[owner]
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> CardPrefetcher:
+    """
+    Returns the process-wide Card prefetcher, created on first use.
+    :return: the Card prefetcher.
+    """
+    global _prefetcher
+    if _prefetcher is None:
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                _prefetcher = CardPrefetcher(max_workers=PREFETCH_MAX_WORKERS)
+    return _prefetcher
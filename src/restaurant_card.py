@@ -1,5 +1,7 @@
-from src.base_card import CardMetaData
+from src.base_card import (CardMetaData, pack_text, unpack_text)
 from src.composite_card import (CompositeCard, LeafCard)
+from src.const import SortKey
+from src.metrics import timed
 
 
 class RestaurantRootCard(CompositeCard):
@@ -7,53 +9,109 @@ class RestaurantRootCard(CompositeCard):
     A root class represent a common class that encapsulates
     the content of all (sub) classes under this Card.
     """
-    def __init__(self, card_type: str):
-        super().__init__(CardMetaData("Yelp"))
+    __slots__ = ('card_type', 'search_query', 'top_ranked_result_name', 'top_ranked_result_url',
+                 'top_ranked_score', 'top_ranked_review')
+
+    SORT_KEYS = (SortKey.SCORE, SortKey.VOTES, SortKey.RATING)
+
+    def __init__(self, card_type: str, search_query: str = ""):
+        super().__init__(CardMetaData.for_source("Yelp"))
 
         # Type of this root card: article, blog, etc.
-        self.card_type = card_type
+        self.card_type: str = card_type
+
+        # The query producing the children of this Card
+        self.search_query: str = search_query
 
         # Title of the top-ranked Card among all children Cards
-        self.top_ranked_result_name = ""
+        self.top_ranked_result_name: str = ""
 
         # URL of the top-ranked Card among all children Cards
-        self.top_ranked_result_url = ""
+        self.top_ranked_result_url: str = ""
 
         # Top score
-        self.top_ranked_score = 0
+        self.top_ranked_score: float = 0
 
         # Review matching the query
-        self.top_ranked_review = ""
+        self.top_ranked_review: str = ""
+
+    def get_identity(self) -> tuple:
+        return self._metadata.name, self.card_type, self.search_query
+
+    def set_top_ranked_result(self, card_data: dict):
+        """
+        Sets the top-ranked result without building the children Cards.
+        :param card_data: the top-ranked search result.
+        :return: None
+        """
+        self.top_ranked_score = card_data["score"]
+        self.top_ranked_result_name = card_data["info"]["name"]
+        self.top_ranked_result_url = card_data["info"]["url"]
+        self.top_ranked_review = card_data["context"]
 
+    def get_rank_value(self, component, sort_key: SortKey) -> float:
+        if sort_key is SortKey.VOTES:
+            return component.num_reviews
+        if sort_key is SortKey.RATING:
+            return component.rating
+        return component.score
+
+    @timed("sort_card")
     def sort_card(self):
         """
         Compute the top-ranked Card.
         :return: None
         """
-        for card in self._children:
-            if card.score > self.top_ranked_score:
-                self.top_ranked_score = card.score
+        card = self.get_top_ranked_child()
+        if card is not None:
+            self.top_ranked_score = card.score
 
-                # Set top-ranked Card data
-                self.top_ranked_result_name = card.info["name"]
-                self.top_ranked_result_url = card.info["url"]
-                self.top_ranked_review = card.context
+            # Set top-ranked Card data
+            self.top_ranked_result_name = card.name
+            self.top_ranked_result_url = card.url
+            self.top_ranked_review = card.context
 
 
 class RestaurantCard(LeafCard):
     """
     A leaf card encapsulating information representing a restaurant.
+    The fields rendered by the app are copied from the search result, which is not kept:
+    the review matching the query, long and only shown on demand, is kept compressed.
     """
+    __slots__ = ('search_query', 'score', 'name', 'title', 'url', 'category', 'categories', 'rating', 'price',
+                 'city', 'num_reviews', '_context')
+
     def __init__(self, query: str, card_data: dict):
-        super().__init__(CardMetaData("Yelp"))
+        super().__init__(CardMetaData.for_source("Yelp"))
 
         # The query producing this Card as a result
-        self.search_query = query
+        self.search_query: str = query
 
         # This Card's score w.r.t. the query
-        self.score = card_data['score']
+        self.score: float = card_data['score']
+
+        # Name, URL and categories of the restaurant, the first one is the main category
+        info = card_data["info"]
+        self.name: str = info["name"]
+        self.url: str = info["url"]
+        self.categories: tuple = tuple(info["categories"])
+        self.category: str = self.categories[0]
+
+        # Name displayed as the Card title
+        self.title: str = card_data["meta"].get("name", self.name)
+
+        # Rating, price range, location and popularity
+        self.rating: float = info.get("rating", 0)
+        self.price: str = info.get("price", "")
+        self.city: str = info.get("city", "")
+        self.num_reviews: int = info.get("num_reviews", 0)
+
+        # Review matching the query
+        self._context: bytes = pack_text(card_data["context"])
+
+    def get_identity(self) -> tuple:
+        return self._metadata.name, self.url
 
-        # The full information
-        self.card_meta = card_data["meta"]
-        self.context = card_data["context"]
-        self.info = card_data["info"]
+    @property
+    def context(self) -> str:
+        return unpack_text(self._context)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+class ResultSet:
+    """
+    Columnar view over the results of a search response.
+    Scores and category codes are NumPy arrays, rows are referenced by their
+    offset in the raw list of results, so filtering and grouping never
+    build a Python object per result.
+    """
+    def __init__(self, rows: list, categories: list, scores: np.ndarray, codes: np.ndarray, offsets: np.ndarray):
+        # The raw results, as decoded from the response
+        self.rows = rows
+
+        # Category names, indexed by category code
+        self.categories = categories
+
+        # One entry per selected result
+        self.scores = scores
+        self.codes = codes
+        self.offsets = offsets
+
+    @classmethod
+    def from_results(cls, rows: list, category_of) -> ResultSet:
+        """
+        Builds a ResultSet over a list of results.
+        :param rows: the raw results.
+        :param category_of: returns the category of a result.
+        :return: the ResultSet selecting all the results.
+        """
+        num_rows = len(rows)
+        scores = np.fromiter((row["score"] for row in rows), dtype=np.float64, count=num_rows)
+
+        # Encode the categories by order of first appearance
+        category_codes = dict()
+        codes = np.fromiter((category_codes.setdefault(category_of(row), len(category_codes)) for row in rows),
+                            dtype=np.intp, count=num_rows)
+        return cls(rows, list(category_codes), scores, codes, np.arange(num_rows, dtype=np.intp))
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def filter(self, min_score: float) -> ResultSet:
+        """
+        Selects the results with a score of at least min_score.
+        :param min_score: the score threshold.
+        :return: a new ResultSet over the same rows.
+        """
+        mask = self.scores >= min_score
+        return ResultSet(self.rows, self.categories, self.scores[mask], self.codes[mask], self.offsets[mask])
+
+    def _ranked_groups(self):
+        """
+        Orders the results by category, then by descending score, then by arrival.
+        :return: the order and, for each position, its rank within its category.
+        """
+        order = np.lexsort((self.offsets, -self.scores, self.codes))
+        sorted_codes = self.codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(order) else order
+        group_sizes = np.diff(np.r_[starts, len(order)])
+        ranks = np.arange(len(order)) - np.repeat(starts, group_sizes)
+        return order, ranks
+
+    def group_by_category(self) -> list:
+        """
+        Groups the results by category, in order of first appearance.
+        :return: a list of (category, row offsets in arrival order).
+        """
+        if not len(self):
+            return list()
+        order = np.argsort(self.codes, kind='stable')
+        sorted_codes = self.codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        groups = np.split(self.offsets[order], starts[1:])
+
+        # Categories show up in the order their first selected result arrived
+        first_offsets = self.offsets[order][starts]
+        return [(self.categories[sorted_codes[starts[idx]]], groups[idx]) for idx in np.argsort(first_offsets)]
+
+    def argmax_per_category(self) -> dict:
+        """
+        Finds the top-scored result of each category, the first one on ties.
+        :return: a dict category -> row offset.
+        """
+        return {category: offsets[0] for category, offsets in self.top_k_per_category(1).items()}
+
+    def top_k_per_category(self, k: int) -> dict:
+        """
+        Finds the k top-scored results of each category.
+        :param k: the number of results per category.
+        :return: a dict category -> row offsets by descending score.
+        """
+        if not len(self):
+            return dict()
+        order, ranks = self._ranked_groups()
+        selected = order[ranks < k]
+        codes = self.codes[selected]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        groups = np.split(self.offsets[selected], starts[1:])
+        return {self.categories[codes[start]]: group for start, group in zip(starts, groups)}
@@ -1,57 +1,213 @@
-from src.card_utils import (merge_cards, merge_restaurant_cards)
+from concurrent.futures import (ThreadPoolExecutor, wait)
+from src.card_utils import (RootCardStream, build_root_cards)
 from src.const import *
-from src.restaurant_card import RestaurantCard
-from src.tds_card import TDSCard
-from src.utils import (call_qa_endpoint, call_search_endpoint, call_restaurant_endpoint)
+from src.restaurant_card import (RestaurantCard, RestaurantRootCard)
+from src.fusion import (reciprocal_rank_fusion, score_normalized_fusion)
+from src.metrics import (propagate_trace, timed)
+from src.tds_card import (TDSCard, TDSRootCard)
+from src.transport import ResultList
+from src.utils import (call_qa_endpoint, call_search_endpoint, call_restaurant_endpoint, stream_restaurant_endpoint,
+                       stream_search_endpoint)
 
+# Shared by the hybrid searches: engines missing the deadline keep a worker until their timeout
+_hybrid_executor = ThreadPoolExecutor(max_workers=HYBRID_MAX_WORKERS, thread_name_prefix="hybrid-search")
 
+
+@timed("hybrid_search")
+def hybrid_search(search_query: str, num_results: int, deadline: float = HYBRID_SEARCH_DEADLINE) -> dict:
+    """
+    Queries the keyword and the DPR search engines concurrently and fuses their results.
+    Engines that miss the deadline or fail are left out of the fusion.
+    :param search_query: the search query.
+    :param num_results: the number of results to retrieve from each engine and to return.
+    :param deadline: the maximum time to wait for the engines, in seconds.
+    :return: the fused results, in the search endpoints format, scored by their normalized fused score,
+             or an empty dict if all engines failed.
+    """
+    engines = [(TDS_KEYWORD_SEARCH_ENDPOINT, HYBRID_BM_25_WEIGHT), (TDS_DPR_SEARCH_ENDPOINT, HYBRID_DPR_WEIGHT)]
+    futures = [_hybrid_executor.submit(propagate_trace(call_search_endpoint), endpoint=endpoint,
+                                       search_query=search_query, num_results=num_results)
+               for endpoint, _ in engines]
+    wait(futures, timeout=deadline)
+
+    # Use what the engines produced in time
+    result_lists = list()
+    weights = list()
+    for future, (_, weight) in zip(futures, engines):
+        if not future.done() or future.exception() is not None:
+            continue
+        result = future.result()
+        if result:
+            result_lists.append(result["result"])
+            weights.append(weight)
+    if not result_lists:
+        return {}
+
+    if HYBRID_FUSION == "score":
+        fused_results = score_normalized_fusion(result_lists, weights)
+    else:
+        fused_results = reciprocal_rank_fusion(result_lists, weights, k=HYBRID_RRF_K)
+    return {"result": fused_results[:num_results]}
+
+
+@timed("local_keyword_search")
+def local_keyword_search(search_query: str, num_results: int) -> dict:
+    """
+    Keyword search on the local BM25 index, without calling the backend.
+    Scores are relative to the highest score the query could get, see BM25Index.get_max_score.
+    :param search_query: the search query.
+    :param num_results: the number of results to return.
+    :return: the results, in the search endpoints format, or None if there is no local index.
+    """
+    # The local indexes and NumPy are only imported by the sessions using them
+    from src.bm25_index import get_bm25_index
+    index = get_bm25_index()
+    if index is None:
+        return None
+    return get_local_results(index.docs, index.search(search_query, num_results), index.get_max_score(search_query))
+
+
+@timed("local_dense_search")
+def local_dense_search(search_query: str, num_results: int) -> dict:
+    """
+    Dense search on the local index, without calling the backend.
+    Scores are relative to the highest score the query could get, see DenseIndex.get_max_score.
+    :param search_query: the search query.
+    :param num_results: the number of results to return.
+    :return: the results, in the search endpoints format, or None if there is no local index or query encoder.
+    """
+    from src.dense_index import (get_dense_index, get_query_encoder)
+    index = get_dense_index()
+    encoder = get_query_encoder()
+    if index is None or encoder is None:
+        return None
+    query_embedding = encoder([search_query])
+    return get_local_results(index.docs, index.search(query_embedding, num_results)[0],
+                             index.get_max_score(query_embedding[0]))
+
+
+def get_local_results(docs, hits: list, max_score: float) -> dict:
+    """
+    Turns the hits of a local index into results shaped like the ones of the search endpoints.
+    Scores are divided by an upper bound depending on the query only, so that a weak best match
+    still scores low and can be filtered out.
+    :param docs: the store of the indexed articles.
+    :param hits: a list of (article id, score), by decreasing score.
+    :param max_score: the highest score the query could get.
+    :return: the results.
+    """
+    if not hits or max_score <= 0:
+        return {"result": []}
+    results = list()
+    for doc_id, score in hits:
+        result = docs.get(doc_id)
+        result["score"] = score / max_score
+        results.append(result)
+    return {"result": results}
+
+
+def get_search_endpoint(search_engine_type: TDSSearchEngineType, num_results_to_retrieve: int) -> tuple:
+    """
+    Returns the backend endpoint serving a search engine and the number of results to ask it.
+    :param search_engine_type: the search engine, other than the local ones.
+    :param num_results_to_retrieve: the number of results wanted.
+    :return: the endpoint and the number of results.
+    """
+    if search_engine_type in (TDSSearchEngineType.BM_25, TDSSearchEngineType.LOCAL_BM_25):
+        return TDS_KEYWORD_SEARCH_ENDPOINT, num_results_to_retrieve
+    elif search_engine_type in (TDSSearchEngineType.DPR, TDSSearchEngineType.LOCAL_DPR):
+        return TDS_DPR_SEARCH_ENDPOINT, num_results_to_retrieve
+    else:
+        return TDS_MIX_SEARCH_ENDPOINT, num_results_to_retrieve // 2
+
+
+def get_score_threshold(search_engine_type: TDSSearchEngineType) -> float:
+    """
+    Returns the minimum score of the results of a search engine.
+    :param search_engine_type: the search engine.
+    :return: the score threshold.
+    """
+    # Fused and local scores have their own scales
+    if search_engine_type == TDSSearchEngineType.LOCAL_MIX:
+        return HYBRID_SCORE_THRESHOLD
+    if search_engine_type == TDSSearchEngineType.LOCAL_BM_25:
+        return BM25_SCORE_THRESHOLD
+    if search_engine_type == TDSSearchEngineType.LOCAL_DPR:
+        return DENSE_SCORE_THRESHOLD
+    return SEARCH_SCORE_THRESHOLD
+
+
+@timed("process_search")
 def process_search(search_query: str, search_engine_type: TDSSearchEngineType, num_results_to_retrieve: int,
-                   score_threshold: float = 0.65) -> list:
+                   score_threshold: float = None) -> list:
     # Call API based on the type of engine
-    if search_engine_type == TDSSearchEngineType.BM_25:
-        result = call_search_endpoint(endpoint=TDS_KEYWORD_SEARCH_ENDPOINT, search_query=search_query,
-                                      num_results=num_results_to_retrieve)
-    elif search_engine_type == TDSSearchEngineType.DPR:
-        result = call_search_endpoint(endpoint=TDS_DPR_SEARCH_ENDPOINT, search_query=search_query,
-                                      num_results=num_results_to_retrieve)
-    else:
-        num_results_to_retrieve = num_results_to_retrieve // 2
-        result = call_search_endpoint(endpoint=TDS_MIX_SEARCH_ENDPOINT, search_query=search_query,
+    result = None
+    if search_engine_type == TDSSearchEngineType.LOCAL_MIX:
+        result = hybrid_search(search_query=search_query, num_results=num_results_to_retrieve)
+    elif search_engine_type == TDSSearchEngineType.LOCAL_BM_25:
+        result = local_keyword_search(search_query=search_query, num_results=num_results_to_retrieve)
+    elif search_engine_type == TDSSearchEngineType.LOCAL_DPR:
+        result = local_dense_search(search_query=search_query, num_results=num_results_to_retrieve)
+    scored_by = search_engine_type
+    if result is None:
+        # Without a local index, the search of the backend is used, with the scores of the backend
+        endpoint, num_results_to_retrieve = get_search_endpoint(search_engine_type, num_results_to_retrieve)
+        result = call_search_endpoint(endpoint=endpoint, search_query=search_query,
                                       num_results=num_results_to_retrieve)
+        scored_by = TDSSearchEngineType.MIX
+    if score_threshold is None:
+        score_threshold = get_score_threshold(scored_by)
     if not result:
         # Something went wrong
         return []
 
-    # Filter out results with low score.
-    # Otherwise, build corresponding result Card
-    cards_collection = dict()
-    for res in result["result"]:
-        if res["score"] >= score_threshold:
-            # Given a results, build the corresponding Card
-            tds_card = TDSCard(search_query, res)
+    # Filter out results with low score and
+    # group the results by category: article, blog, how-to, etc.
+    from src.result_set import ResultSet
+    result_set = ResultSet.from_results(result["result"], category_of=lambda res: res["category"])
+    result_set = result_set.filter(score_threshold)
 
-            # Store cards by they category: article, blog, how-to, etc.
-            card_category = tds_card.card_data["category"]
-            if card_category not in cards_collection:
-                cards_collection[card_category] = list()
-            cards_collection[card_category].append(tds_card)
+    # Create a root category Card for each category,
+    # the result Cards are built when the category is explored
+    return build_root_cards(TDSRootCard, TDSCard, search_query, result_set)
 
-    # Create a root category Card for each category
-    root_cards_list = list()
-    for key, card_list in cards_collection.items():
-        root_card = merge_cards(key, card_list)
-        root_cards_list.append(root_card)
 
-    # Return the list of all root cards
-    return root_cards_list
+def stream_search(search_query: str, search_engine_type: TDSSearchEngineType, num_results_to_retrieve: int,
+                  score_threshold: float = None):
+    """
+    Same as process_search, but streams the root Cards while the results arrive:
+    each time a result is added to a root Card, that root Card is yielded.
+    :param search_query: the search query.
+    :param search_engine_type: the search engine.
+    :param num_results_to_retrieve: the number of results to retrieve.
+    :param score_threshold: results below this score are skipped, by default the threshold of the search engine.
+    :return: the stream of root Cards, 'complete' once all the results were received.
+    """
+    if search_engine_type in (TDSSearchEngineType.LOCAL_MIX, TDSSearchEngineType.LOCAL_BM_25,
+                              TDSSearchEngineType.LOCAL_DPR):
+        # The fusion needs the complete results of both engines, the local engines answer at once
+        return ResultList(process_search(search_query, search_engine_type, num_results_to_retrieve, score_threshold))
 
+    if score_threshold is None:
+        score_threshold = get_score_threshold(search_engine_type)
+    endpoint, num_results_to_retrieve = get_search_endpoint(search_engine_type, num_results_to_retrieve)
+    results = stream_search_endpoint(endpoint=endpoint, search_query=search_query,
+                                     num_results=num_results_to_retrieve)
+    return RootCardStream(TDSRootCard, TDSCard, search_query, results,
+                          category_of=lambda res: res["category"], min_score=score_threshold)
 
+
+@timed("process_qa")
 def process_qa(search_query: str, num_results_to_retrieve: int, num_results_reader: int):
     result = call_qa_endpoint(search_query=search_query, num_results=num_results_to_retrieve,
                               num_reader=num_results_reader)
+    if not result:
+        # Something went wrong
+        return []
     return result["result"]
 
 
+@timed("restaurant_search")
 def restaurant_search(search_query: str, num_results_to_retrieve: int):
     result = call_restaurant_endpoint(endpoint=RESTAURANT_SEARCH_ENDPOINT, search_query=search_query,
                                       num_results=num_results_to_retrieve, location_list=[])
@@ -59,22 +215,22 @@ def restaurant_search(search_query: str, num_results_to_retrieve: int):
         # Something went wrong
         return []
 
-    cards_collection = dict()
-    for res in result["result"]:
-        # Given a results, build the corresponding Card
-        res_card = RestaurantCard(search_query, res)
-
-        # Store cards by they category: article, blog, how-to, etc.
-        card_category = res_card.info["categories"][0]
-        if card_category not in cards_collection:
-            cards_collection[card_category] = list()
-        cards_collection[card_category].append(res_card)
+    # Group the results by category: American, Bars, Italian, etc.
+    from src.result_set import ResultSet
+    result_set = ResultSet.from_results(result["result"], category_of=lambda res: res["info"]["categories"][0])
 
     # Create a root category Card for each category
-    root_cards_list = list()
-    for key, card_list in cards_collection.items():
-        root_card = merge_restaurant_cards(key, card_list)
-        root_cards_list.append(root_card)
+    return build_root_cards(RestaurantRootCard, RestaurantCard, search_query, result_set)
+
 
-    # Return the list of all root cards
-    return root_cards_list
+def stream_restaurant_search(search_query: str, num_results_to_retrieve: int):
+    """
+    Same as restaurant_search, but streams each root Card when a result is added to it.
+    :param search_query: the search query.
+    :param num_results_to_retrieve: the number of results to retrieve.
+    :return: the stream of root Cards, 'complete' once all the results were received.
+    """
+    results = stream_restaurant_endpoint(endpoint=RESTAURANT_SEARCH_ENDPOINT, search_query=search_query,
+                                         num_results=num_results_to_retrieve, location_list=[])
+    return RootCardStream(RestaurantRootCard, RestaurantCard, search_query, results,
+                          category_of=lambda res: res["info"]["categories"][0])
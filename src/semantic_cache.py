@@ -0,0 +1,201 @@
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from src.const import (RESULT_CACHE_TTL, SEMANTIC_CACHE_BANDS, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_NUM_PERM,
+                       SEMANTIC_CACHE_THRESHOLD)
+from src.metrics import register_collector
+
+# Unicode words, keeping the symbols that tell terms apart: c, c++ and c#, node.js, t-sne
+_TOKEN_RE = re.compile(r"\w(?:[\w.'-]*\w)?[+#]*")
+
+# Words that do not change what a query is about
+_FILLER_WORDS = frozenset("""
+a about also am an and any are article articles as at be been best can could do does explain explained find for
+from get give good have help i i'd i'll i'm id im in into is it its just know learn like looking me more my need
+of on please read really resource resources show some something tell that the there this tip tips to understand
+use using want was way ways with would you your
+""".split())
+
+# Words that change what a query asks however long it is: "how to X" must not share the results of
+# "how not to X" or "why X", so similar queries must have the same ones
+_DECISIVE_WORDS = frozenset("""
+how never no nor not versus vs what when where which who why without
+""".split())
+
+# Universal hash functions h(x) = (a * x + b) mod p, the same in every process
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20211)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(SEMANTIC_CACHE_NUM_PERM)]
+
+
+def get_query_terms(query: str) -> frozenset:
+    """
+    Normalizes a query into the set of its meaningful terms:
+    case, punctuation between words, word order and filler words do not matter.
+    Words are not stemmed: "news" is not "new", nor "pandas" "panda".
+    :param query: the query.
+    :return: the set of terms.
+    """
+    terms = set()
+    for token in _TOKEN_RE.findall(query.lower()):
+        # "what's" asks what, "python's" is about python
+        if token.endswith("'s"):
+            token = token[:-2]
+        if token not in _FILLER_WORDS:
+            terms.add(token)
+    return frozenset(terms)
+
+
+def _hash_term(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def get_minhash(terms: frozenset) -> tuple:
+    """
+    Computes the MinHash signature of a set of terms: two sets agree on each
+    position of their signatures with a probability equal to their Jaccard similarity.
+    :param terms: the set of terms, not empty.
+    :return: the signature.
+    """
+    hashes = [_hash_term(term) for term in terms]
+    return tuple(min((a * x + b) % _PRIME for x in hashes) for a, b in _PERMUTATIONS)
+
+
+def jaccard(terms: frozenset, other_terms: frozenset) -> float:
+    return len(terms & other_terms) / len(terms | other_terms)
+
+
+class SemanticCache:
+    """
+    Cache of results keyed by queries, that also answers queries close to a cached one.
+    Signatures are split into bands and indexed by band (LSH): queries sharing a band
+    are candidates, and a candidate is only reused if the Jaccard similarity of its
+    terms with the query reaches the threshold. A query with a term more or less than
+    a cached one is narrower or broader: it is never answered from it.
+    """
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, num_bands: int = SEMANTIC_CACHE_BANDS,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES, ttl: float = RESULT_CACHE_TTL):
+        self.threshold = threshold
+        self.num_bands = num_bands
+        self.rows_per_band = SEMANTIC_CACHE_NUM_PERM // num_bands
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        # (namespace, terms) -> (value, insertion time), in LRU order
+        self._entries = OrderedDict()
+        # (namespace, band index, band) -> set of (namespace, terms)
+        self._buckets = dict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _bands(self, namespace, terms: frozenset) -> list:
+        signature = get_minhash(terms)
+        return [(namespace, idx, signature[idx * self.rows_per_band:(idx + 1) * self.rows_per_band])
+                for idx in range(self.num_bands)]
+
+    def get(self, namespace, query: str):
+        """
+        Returns the value cached for the query, or for the closest similar query.
+        :param namespace: the parameters the value depends on besides the query, e.g. the endpoint.
+        :param query: the query.
+        :return: the cached value, or None.
+        """
+        terms = get_query_terms(query)
+        if not terms:
+            return None
+        with self._lock:
+            key = (namespace, terms)
+            if key not in self._entries:
+                # Closest candidate sharing at least one band
+                best_similarity = self.threshold
+                key = None
+                decisive_terms = terms & _DECISIVE_WORDS
+                for band in self._bands(namespace, terms):
+                    for candidate in self._buckets.get(band, ()):
+                        if candidate[1] & _DECISIVE_WORDS != decisive_terms:
+                            continue
+                        if candidate[1] < terms or terms < candidate[1]:
+                            # One query only adds terms to the other
+                            continue
+                        similarity = jaccard(terms, candidate[1])
+                        if similarity >= best_similarity:
+                            best_similarity = similarity
+                            key = candidate
+            if key is not None:
+                value, created = self._entries[key]
+                if time.time() - created <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._pop(key)
+            self.misses += 1
+            return None
+
+    def put(self, namespace, query: str, value) -> None:
+        """
+        Caches the value of a query, evicting the least recently used queries if needed.
+        :param namespace: the parameters the value depends on besides the query.
+        :param query: the query.
+        :param value: the value, shared by all the callers: it must not be modified.
+        :return: None
+        """
+        terms = get_query_terms(query)
+        if not terms:
+            return
+        key = (namespace, terms)
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (value, time.time())
+            for band in self._bands(namespace, terms):
+                self._buckets.setdefault(band, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key) -> None:
+        del self._entries[key]
+        for band in self._bands(*key):
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+_semantic_cache = SemanticCache()
+
+
+def get_semantic_cache() -> SemanticCache:
+    """
+    Returns the process-wide cache of search and QA results for similar queries.
+    :return: the semantic cache.
+    """
+    return _semantic_cache
+
+
+def _collect_semantic_cache_metrics() -> list:
+    stats = _semantic_cache.stats()
+    return [("search_app_cache_lookups_total", "counter", "Cache lookups by result.",
+             {"cache": "semantic", "result": "hits"}, stats["hits"]),
+            ("search_app_cache_lookups_total", "counter", "Cache lookups by result.",
+             {"cache": "semantic", "result": "misses"}, stats["misses"]),
+            ("search_app_cache_hit_ratio", "gauge", "Share of cache lookups that were hits.",
+             {"cache": "semantic"}, stats["hit_ratio"])]
+
+
+register_collector(_collect_semantic_cache_metrics)
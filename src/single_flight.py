@@ -0,0 +1,104 @@
+import threading
+
+
+class _Call:
+    """
+    An outstanding call, shared by the callers waiting on it.
+    """
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: while a call for a key is in flight,
+    other callers with the same key wait for it and share its result
+    instead of making their own call.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = dict()
+
+        # Calls actually made, and calls served by another caller's call
+        self.num_calls = 0
+        self.num_coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Runs fn, or waits for the identical call already in flight.
+        :param key: identifies the call, must be hashable.
+        :param fn: the function making the call.
+        :return: the result of the call, shared by all the coalesced callers.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.num_coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.num_calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def begin(self, key):
+        """
+        Starts a call the caller makes itself, e.g. one whose result arrives in parts,
+        unless an identical call is already in flight.
+        The caller must end the call with finish, the other callers wait for it in do.
+        :param key: identifies the call, must be hashable.
+        :return: the call to finish, or None if an identical call is in flight.
+        """
+        with self._lock:
+            if key in self._calls:
+                return None
+            call = _Call()
+            self._calls[key] = call
+            self.num_calls += 1
+            return call
+
+    def finish(self, key, call: _Call, result) -> None:
+        """
+        Ends a call started with begin, and hands its result to the callers waiting for it.
+        :param key: identifies the call.
+        :param call: the call returned by begin.
+        :param result: the result of the call.
+        :return: None
+        """
+        call.result = result
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.done.set()
+
+    def stats(self) -> dict:
+        """
+        Returns the coalescing counters.
+        :return: a dict with the counters.
+        """
+        return {
+            "calls": self.num_calls,
+            "coalesced": self.num_coalesced,
+            "in_flight": len(self._calls),
+        }
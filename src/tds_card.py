@@ -1,82 +1,189 @@
-from src.base_card import CardMetaData
+from datetime import date
+from src.base_card import (CardMetaData, pack_text, unpack_text)
+from src.cache import (get_wikifier_cache, wikifier_cache_key)
 from src.composite_card import (CompositeCard, LeafCard)
+from src.const import (SortKey, WIKIFIER_THRESHOLD)
+from src.metrics import timed
 from src.utils import run_wikifier
 
+# Shared by all the Cards not opened yet
+_NO_CONCEPTS = ()
+
 
 class TDSRootCard(CompositeCard):
     """
     A root class represent a common class that encapsulates
     the content of all (sub) classes under this Card.
     """
-    def __init__(self, card_type: str):
-        super().__init__(CardMetaData("TowardsDataScience"))
+    __slots__ = ('card_type', 'search_query', 'top_ranked_result_title', 'top_ranked_result_url')
+
+    SORT_KEYS = (SortKey.SCORE, SortKey.VOTES, SortKey.DATE)
+
+    def __init__(self, card_type: str, search_query: str = ""):
+        super().__init__(CardMetaData.for_source("TowardsDataScience"))
 
         # Type of this root card: article, blog, etc.
-        self.card_type = card_type
+        self.card_type: str = card_type
+
+        # The query producing the children of this Card
+        self.search_query: str = search_query
 
         # Title of the top-ranked Card among all children Cards
-        self.top_ranked_result_title = ""
+        self.top_ranked_result_title: str = ""
 
         # URL of the top-ranked Card among all children Cards
-        self.top_ranked_result_url = ""
+        self.top_ranked_result_url: str = ""
+
+    def get_identity(self) -> tuple:
+        return self._metadata.name, self.card_type, self.search_query
+
+    def set_top_ranked_result(self, card_data: dict):
+        """
+        Sets the top-ranked result without building the children Cards.
+        :param card_data: the top-ranked search result.
+        :return: None
+        """
+        self.top_ranked_result_title = card_data["title"]
+        self.top_ranked_result_url = card_data["url"]
+
+    def get_rank_value(self, component, sort_key: SortKey) -> float:
+        if sort_key is SortKey.VOTES:
+            return component.num_votes
+        if sort_key is SortKey.DATE:
+            return _date_rank(component.date)
+        return component.score
 
+    @timed("sort_card")
     def sort_card(self):
         """
         Compute the top-ranked Card.
         :return: None
         """
-        top_score = 0
-        for card in self._children:
-            if card.score > top_score:
-                top_score = card.score
-
-                # Set top-ranked Card title and URL
-                self.top_ranked_result_title = card.card_data["title"]
-                self.top_ranked_result_url = card.card_data["url"]
+        card = self.get_top_ranked_child()
+        if card is not None:
+            # Set top-ranked Card title and URL
+            self.top_ranked_result_title = card.title
+            self.top_ranked_result_url = card.url
 
 
 class TDSCard(LeafCard):
     """
     A leaf card encapsulating information from a TDS article.
+    The fields rendered by the app are copied from the search result, which is not kept:
+    the summary, long and only shown on demand, is kept compressed.
     """
+    __slots__ = ('search_query', 'score', 'title', 'url', 'category', 'image', 'related_concepts', 'concept',
+                 'date', 'num_votes', 'num_responses', 'has_code', 'length', 'topics', 'tags', 'summary_prefix',
+                 '_summary')
+
     def __init__(self, query: str, card_data: dict):
-        super().__init__(CardMetaData("TowardsDataScience"))
+        super().__init__(CardMetaData.for_source("TowardsDataScience"))
 
         # The query producing this Card as a result
-        self.search_query = query
+        self.search_query: str = query
 
         # This Card's score w.r.t. the query
-        self.score = card_data['score']
+        self.score: float = card_data['score']
+
+        # Title, URL and category of the article
+        self.title: str = card_data['title']
+        self.url: str = card_data['url']
+        self.category: str = card_data['category']
 
         # List of related concepts to this Card.
         # Computed on demand
-        self.related_concepts = list()
+        self.related_concepts = _NO_CONCEPTS
 
         # URL of the image to display with this Card
-        self.image = card_data['image']
+        self.image: str = card_data['image']
+
+        # Main concept, publication date and popularity of the article
+        self.concept: str = card_data.get('concept', "")
+        self.date: str = card_data.get('date', "")
+        self.num_votes: int = card_data.get('num_votes', 0)
+        self.num_responses: int = card_data.get('num_responses', 0)
+
+        # Whether the article has code, and its reading time
+        meta = card_data.get('meta') or dict()
+        self.has_code: str = meta.get('code', "")
+        self.length: str = meta.get('length', "")
+
+        # Keywords and tags of the article, best first
+        self.topics: tuple = tuple(topic['topic'] for topic in card_data.get('topics') or ())
+        self.tags: tuple = tuple(tag_rank['word'] for tag_rank in card_data.get('tags_rank') or ())
 
-        # The full information
-        self.card_data = card_data
+        # Summary of the article
+        self.summary_prefix: str = card_data.get('summary_prefix', "")
+        self._summary: bytes = pack_text(card_data['summary'])
+
+    def get_identity(self) -> tuple:
+        return self._metadata.name, self.url
+
+    @property
+    def summary(self) -> str:
+        return unpack_text(self._summary)
+
+    def get_wikifier_text(self) -> str:
+        """
+        Returns the text of this Card to send to the Wikifier service.
+        :return: the text to annotate.
+        """
+        return self.summary_prefix + '\n' + self.summary
+
+    def get_wikifier_cache_key(self) -> str:
+        """
+        Returns the key of this Card's concepts in the Wikifier cache.
+        :return: the cache key.
+        """
+        return wikifier_cache_key(self.get_wikifier_text(), WIKIFIER_THRESHOLD)
 
     def open_card(self):
         if self.related_concepts:
             # Use cached data
             return self.related_concepts
 
-        # Prepare the text to send to the Wikifier service
-        card_text = self.card_data["summary_prefix"] + '\n' + self.card_data["summary"]
-
-        # Run the Wikifier
-        all_entities = run_wikifier(card_text)
-        all_entities = all_entities["entities"]
-        if not all_entities:
-            return
-
-        for entity in all_entities:
-            self.related_concepts.append(
-                {
-                    "title": entity["title"],
-                    "label": entity["label"],
-                    "url": entity["url"],
-                }
-            )
+        # The same article may have been opened already by any session
+        cache = get_wikifier_cache()
+        key = self.get_wikifier_cache_key()
+        related_concepts = cache.get(key)
+        if related_concepts is None:
+            # Run the Wikifier
+            all_entities = run_wikifier(self.get_wikifier_text())
+            if not all_entities:
+                # Something went wrong, try again next time
+                return
+            related_concepts = get_related_concepts(all_entities)
+            cache.put(key, related_concepts)
+
+        self.related_concepts = list(related_concepts)
+        return self.related_concepts
+
+
+def get_related_concepts(wikifier_result: dict) -> list:
+    """
+    Extracts the related concepts from a Wikifier result.
+    :param wikifier_result: the Wikifier result.
+    :return: the list of related concepts.
+    """
+    related_concepts = list()
+    for entity in wikifier_result.get("entities") or []:
+        related_concepts.append(
+            {
+                "title": entity["title"],
+                "label": entity["label"],
+                "url": entity["url"],
+            }
+        )
+    return related_concepts
+
+
+def _date_rank(card_date: str) -> int:
+    """
+    Converts a 'YYYY-MM-DD' article date to a rank value, unknown dates rank last.
+    :param card_date: the date of the article.
+    :return: the rank value.
+    """
+    try:
+        return date.fromisoformat(card_date[:10]).toordinal()
+    except (TypeError, ValueError):
+        return 0
@@ -0,0 +1,283 @@
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.const import (HTTP_BACKOFF_FACTOR, HTTP_CONNECT_TIMEOUT, HTTP_MAX_RETRIES, HTTP_POOL_SIZE,
+                       HTTP_READ_TIMEOUT, HTTP_RETRY_STATUS_CODES)
+from src.endpoints import (BackendError, find_pool)
+from src.json_codec import decode_json
+from src.metrics import (get_logger, observe, register_collector, timed)
+from src.single_flight import SingleFlight
+
+# One pooled Session per endpoint host, shared by all the Streamlit sessions
+_sessions = dict()
+_sessions_lock = threading.Lock()
+
+# Identical requests in flight at the same time, from any session, share one call
+_single_flight = SingleFlight()
+
+logger = get_logger("transport")
+
+_DEFAULT_HEADERS = {
+    'Content-Type': 'application/json',
+    'Accept': 'application/json',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+# Streaming backends answer in NDJSON, the others still in JSON
+_STREAM_HEADERS = {
+    'Accept': NDJSON_CONTENT_TYPE + ', application/json;q=0.9',
+}
+
+
+def _build_session(read_retries: int) -> requests.Session:
+    """
+    Builds a keep-alive Session with a bounded connection pool and retries.
+    :param read_retries: the number of retries after a read error or timeout.
+    :return: a new Session.
+    """
+    # All the backend calls are read-only searches, retrying a POST is safe
+    retry = Retry(total=HTTP_MAX_RETRIES,
+                  connect=HTTP_MAX_RETRIES,
+                  read=read_retries,
+                  status=HTTP_MAX_RETRIES,
+                  backoff_factor=HTTP_BACKOFF_FACTOR,
+                  status_forcelist=HTTP_RETRY_STATUS_CODES,
+                  allowed_methods=frozenset(["POST"]),
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(_DEFAULT_HEADERS)
+    return session
+
+
+def get_session(url: str, read_retries: int = HTTP_MAX_RETRIES) -> requests.Session:
+    """
+    Returns the pooled Session for the host serving the given URL.
+    :param url: the endpoint URL.
+    :param read_retries: the number of retries after a read error or timeout.
+    :return: the Session for the URL's host.
+    """
+    parts = urlsplit(url)
+    key = (parts.scheme + "://" + parts.netloc, read_retries)
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _build_session(read_retries)
+                _sessions[key] = session
+    return session
+
+
+def post_json(url: str, payload: dict, decoder=decode_json) -> dict:
+    """
+    POSTs a JSON payload to a backend endpoint and returns the decoded response.
+    Connection errors, timeouts, non-200 responses and malformed bodies all return an empty dict.
+    Concurrent identical requests are coalesced into one call and share its decoded result,
+    which must therefore not be modified.
+    :param url: the endpoint URL.
+    :param payload: the JSON-serializable request body.
+    :param decoder: decodes (and checks) the raw response bytes.
+    :return: the decoded JSON response, or an empty dict on failure.
+    """
+    data = json.dumps(payload, sort_keys=True)
+    return _single_flight.do((url, data), lambda: _post(url, data, decoder))
+
+
+def _post(url: str, data: str, decoder) -> dict:
+    # Spread the calls to a known backend over its replicas
+    pool, path = find_pool(url)
+    try:
+        if pool is None:
+            return _post_once(url, data, decoder)
+        # The pool hedges and fails over a stalled replica: retrying its reads would block
+        # the call for several read timeouts
+        return pool.call(lambda base_url: _post_once(base_url + path, data, decoder, read_retries=0))
+    except BackendError as error:
+        logger.warning("%s", error)
+        return {}
+
+
+def _post_once(url: str, data: str, decoder, read_retries: int = HTTP_MAX_RETRIES) -> dict:
+    session = get_session(url, read_retries)
+    try:
+        with timed("http_request") as timer:
+            response = session.post(url, data=data, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    except requests.RequestException as error:
+        raise BackendError("POST " + url + " failed: " + str(error))
+
+    if response.status_code != 200:
+        raise BackendError("POST " + url + " returned " + str(response.status_code))
+
+    try:
+        with timed("decode"):
+            result = decoder(response.content)
+    except ValueError as error:
+        raise BackendError("POST " + url + " returned a malformed body: " + str(error))
+    logger.debug("POST %s took %.1f ms, %d bytes", url, timer.elapsed * 1000, len(response.content))
+    return result
+
+
+class ResultStream:
+    """
+    Iterates over the results of a search response as they arrive.
+    'complete' tells whether the whole response was read without error.
+    """
+    def __init__(self, url: str, response: requests.Response = None, decoder=decode_json, check_item=None,
+                 on_done=None):
+        """
+        :param url: the endpoint URL.
+        :param response: the response, opened with stream=True, or None if the call failed.
+        :param decoder: decodes (and checks) a single JSON body.
+        :param check_item: checks a single streamed result, returns None for a result to skip.
+        :param on_done: called once with {"result": [...]} when the stream is complete, or {} otherwise.
+        """
+        self.url = url
+        self.complete = False
+        self._response = response
+        self._decoder = decoder
+        self._check_item = check_item
+        self._on_done = on_done
+
+    def __iter__(self):
+        results = list()
+        try:
+            if self._response is not None:
+                yield from self._read(results)
+        finally:
+            self._done({"result": results} if self.complete else {})
+
+    def _read(self, results: list):
+        start = time.perf_counter()
+        with self._response as response:
+            try:
+                if response.headers.get("Content-Type", "").startswith(NDJSON_CONTENT_TYPE):
+                    # One result per line
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        result = decode_json(line)
+                        if self._check_item is not None:
+                            result = self._check_item(result)
+                            if result is None:
+                                # An invalid result is skipped, the stream goes on
+                                continue
+                        if not results:
+                            observe("first_streamed_result", time.perf_counter() - start)
+                        results.append(result)
+                        yield result
+                else:
+                    # The backend does not stream: the results arrive all at once
+                    with timed("decode"):
+                        results.extend(self._decoder(response.content)["result"])
+                    yield from results
+            except (requests.RequestException, ValueError) as error:
+                logger.warning("Streaming %s failed after %d results: %s", self.url, len(results), error)
+                return
+        self.complete = True
+
+    def _done(self, result: dict) -> None:
+        on_done, self._on_done = self._on_done, None
+        if on_done is not None:
+            on_done(result)
+
+    def __del__(self):
+        # A stream dropped before being read must still release its response and its waiters
+        if self._response is not None:
+            self._response.close()
+        self._done({})
+
+
+class ResultList:
+    """
+    A stream over results received at once, e.g. from a cache: complete unless the call failed.
+    """
+    def __init__(self, results: list = None):
+        self.complete = results is not None
+        self._results = results if results is not None else list()
+
+    def __iter__(self):
+        return iter(self._results)
+
+
+def post_json_stream(url: str, payload: dict, decoder=decode_json, check_item=None):
+    """
+    POSTs a JSON payload to a search endpoint and streams the results back.
+    Backends answering in NDJSON, one result per line, are read incrementally;
+    backends answering {"result": [...]} in a single JSON body are decoded at once.
+    Errors end the stream early, as a failed call of post_json returns nothing.
+    A stream is coalesced with the identical calls of post_json: while it is read, they wait for its
+    results, and while one of them is in flight, the stream waits for its result instead of opening another.
+    :param url: the endpoint URL.
+    :param payload: the JSON-serializable request body.
+    :param decoder: decodes (and checks) a single JSON body.
+    :param check_item: checks a single streamed result, returns None for a result to skip.
+    :return: the stream of results, 'complete' once all of them were received.
+    """
+    data = json.dumps(payload, sort_keys=True)
+    key = (url, data)
+    call = _single_flight.begin(key)
+    if call is None:
+        result = _single_flight.do(key, lambda: _post(url, data, decoder))
+        return ResultList(result["result"] if result else None)
+
+    pool, path = find_pool(url)
+    try:
+        if pool is None:
+            response = _open_stream(url, data)
+        else:
+            # Hedged attempts race: the responses of the losers are closed, or their connections would leak
+            response = pool.call(lambda base_url: _open_stream(base_url + path, data, read_retries=0),
+                                 discard=lambda response: response.close())
+    except BackendError as error:
+        logger.warning("%s", error)
+        _single_flight.finish(key, call, {})
+        return ResultStream(url)
+    return ResultStream(url, response, decoder, check_item,
+                        on_done=lambda result: _single_flight.finish(key, call, result))
+
+
+def _open_stream(url: str, data: str, read_retries: int = HTTP_MAX_RETRIES) -> requests.Response:
+    session = get_session(url, read_retries)
+    try:
+        # Only the headers are read here, the body is read while iterating
+        with timed("http_request"):
+            response = session.post(url, data=data, headers=_STREAM_HEADERS, stream=True,
+                                    timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    except requests.RequestException as error:
+        raise BackendError("POST " + url + " failed: " + str(error))
+
+    if response.status_code != 200:
+        response.close()
+        raise BackendError("POST " + url + " returned " + str(response.status_code))
+    return response
+
+
+def get_coalescing_stats() -> dict:
+    """
+    Returns how many backend calls were made and how many were coalesced.
+    :return: a dict with the counters.
+    """
+    return _single_flight.stats()
+
+
+def _collect_coalescing_metrics() -> list:
+    stats = _single_flight.stats()
+    return [("search_app_backend_calls_total", "counter", "Backend calls actually made.", {}, stats["calls"]),
+            ("search_app_backend_calls_coalesced_total", "counter",
+             "Backend calls served by an identical call already in flight.", {}, stats["coalesced"])]
+
+
+register_collector(_collect_coalescing_metrics)
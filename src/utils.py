@@ -1,6 +1,13 @@
-import json
-import requests
-from src.const import (QueryType, TDS_QA_ENDPOINT, WIKIFIER_ENDPOINT, WIKIFIER_THRESHOLD)
+from concurrent.futures import ThreadPoolExecutor
+from src.cache import (get_result_cache, result_cache_key)
+from src.card_index import RootCardIndex
+from src.const import (QueryType, TDS_QA_ENDPOINT, WIKIFIER_BATCH_MAX_WORKERS, WIKIFIER_ENDPOINT,
+                       WIKIFIER_THRESHOLD)
+from src.json_codec import (check_restaurant_result, check_search_result, decode_qa_response,
+                            decode_restaurant_response, decode_search_response, decode_wikifier_response)
+from src.metrics import (propagate_trace, timed)
+from src.semantic_cache import get_semantic_cache
+from src.transport import (ResultList, post_json, post_json_stream)
 
 
 def get_query_type(query: str) -> QueryType:
@@ -29,67 +36,135 @@ def is_tds_qa(query: str):
     return query[-1] == '?'
 
 
+@timed("call_search_endpoint")
 def call_search_endpoint(endpoint: str, search_query: str, num_results: int) -> dict:
-    url = endpoint
-    payload = json.dumps({
+    # The indexes rarely change, serve popular queries, and their variants, from the caches
+    cache = get_result_cache()
+    key = result_cache_key(endpoint, search_query, num_results)
+    result = cache.get(key)
+    if result is not None:
+        return result
+    semantic_cache = get_semantic_cache()
+    namespace = (endpoint, num_results)
+    result = semantic_cache.get(namespace, search_query)
+    if result is not None:
+        return result
+
+    payload = {
         "query": search_query,
         "num_results": num_results
-    })
-    headers = {
-        'Content-Type': 'application/json'
     }
-
-    response = requests.request("POST", url, headers=headers, data=payload)
-    if response.status_code != 200:
-        return {}
-    return json.loads(response.text)
-
-
+    result = post_json(endpoint, payload, decoder=decode_search_response)
+    if result:
+        cache.put(key, result)
+        semantic_cache.put(namespace, search_query, result)
+    return result
+
+
+def stream_search_endpoint(endpoint: str, search_query: str, num_results: int):
+    """
+    Streams the results of a search call as they arrive.
+    Shares its cache with call_search_endpoint: cached results are streamed at once
+    and a complete response is cached for the next calls.
+    :param endpoint: the search endpoint.
+    :param search_query: the search query.
+    :param num_results: the number of results to retrieve.
+    :return: the stream of TDS search results, 'complete' once all of them were received.
+    """
+    cache = get_result_cache()
+    key = result_cache_key(endpoint, search_query, num_results)
+    result = cache.get(key)
+    if result is None:
+        result = get_semantic_cache().get((endpoint, num_results), search_query)
+    if result is not None:
+        return ResultList(result["result"])
+
+    payload = {
+        "query": search_query,
+        "num_results": num_results
+    }
+    semantic_cache = get_semantic_cache()
+
+    def cache_result(result: dict):
+        cache.put(key, result)
+        semantic_cache.put((endpoint, num_results), search_query, result)
+    return CachingStream(
+        post_json_stream(endpoint, payload, decoder=decode_search_response, check_item=check_search_result),
+        cache_result)
+
+
+class CachingStream:
+    """
+    Iterates over a stream of results, and caches them once the stream is complete.
+    """
+    def __init__(self, stream, cache_result):
+        self._stream = stream
+        self._cache_result = cache_result
+
+    @property
+    def complete(self) -> bool:
+        return self._stream.complete
+
+    def __iter__(self):
+        results = list()
+        for result in self._stream:
+            results.append(result)
+            yield result
+        if self._stream.complete and results:
+            self._cache_result({"result": results})
+
+
+@timed("call_qa_endpoint")
 def call_qa_endpoint(search_query: str, num_results: int, num_reader: int):
-    url = TDS_QA_ENDPOINT
-
-    payload = json.dumps({
+    # Rephrasings of a question share its answers
+    semantic_cache = get_semantic_cache()
+    namespace = (TDS_QA_ENDPOINT, num_results, num_reader)
+    result = semantic_cache.get(namespace, search_query)
+    if result is not None:
+        return result
+
+    payload = {
         "query": search_query,
         "num_results": num_results,
         "num_reader": num_reader
-    })
-    headers = {
-        'Content-Type': 'application/json'
     }
+    result = post_json(TDS_QA_ENDPOINT, payload, decoder=decode_qa_response)
+    if result:
+        semantic_cache.put(namespace, search_query, result)
+    return result
 
-    response = requests.request("POST", url, headers=headers, data=payload)
-
-    if response.status_code != 200:
-        return {}
-    return json.loads(response.text)
 
-
-def select_root_and_get_cards_list(query: str, root_card_list: list):
+def get_card_type(query: str):
     card_type_list = query.split(':')
     if len(card_type_list) == 1 or not card_type_list[1]:
         return None
     card_type_list = card_type_list[1:]
     card_type_list = [x.strip() for x in card_type_list]
-    card_type = ' '.join(card_type_list)
-    for root_card in root_card_list:
-        if card_type.strip().lower() == root_card.card_type.strip().lower():
-            return root_card.get_children()
+    return ' '.join(card_type_list)
 
-    # Try query without spaces
-    card_type_no_space = card_type.replace(' ', '')
-    for root_card in root_card_list:
-        if card_type_no_space.strip().lower() == root_card.card_type.strip().lower().replace(' ', ''):
-            return root_card.get_children()
 
-    # Try starts with
-    for root_card in root_card_list:
-        if root_card.card_type.strip().lower().startswith(card_type.strip().lower()):
-            return root_card.get_children()
+def select_root_card(query: str, root_card_index: RootCardIndex):
+    card_type = get_card_type(query)
+    if card_type is None:
+        return None
+    return root_card_index.lookup(card_type)
 
-    return None
 
+def select_root_and_get_cards_list(query: str, root_card_index: RootCardIndex):
+    root_card = select_root_card(query, root_card_index)
+    if root_card is None:
+        return None
+    return root_card.get_children()
 
-def select_card_to_open(query: str, card_list: list):
+
+def suggest_root_card_types(query: str, root_card_index: RootCardIndex) -> list:
+    card_type = get_card_type(query)
+    if card_type is None:
+        return list()
+    return root_card_index.suggest(card_type)
+
+
+def get_card_to_open(query: str, card_list: list):
     card_idx_list = query.split(':')
     if len(card_idx_list) == 1 or not card_idx_list[1]:
         return None
@@ -101,7 +176,13 @@ def select_card_to_open(query: str, card_list: list):
         return None
 
     # Get the Card
-    card = card_list[card_idx]
+    return card_list[card_idx]
+
+
+def select_card_to_open(query: str, card_list: list):
+    card = get_card_to_open(query, card_list)
+    if card is None:
+        return None
 
     # Explore the card
     card.open_card()
@@ -110,43 +191,77 @@ def select_card_to_open(query: str, card_list: list):
     return card
 
 
-def run_wikifier(text: str):
+@timed("run_wikifier")
+def run_wikifier(text: str, endpoint: str = WIKIFIER_ENDPOINT):
     text = text.replace('\n', ' ')
     text = text.replace('  ', ' ')
 
-    url = WIKIFIER_ENDPOINT
-    payload = json.dumps({
+    payload = {
         "text": text,
         "threshold": WIKIFIER_THRESHOLD,
         "coref": True
-    })
-    headers = {
-        'Content-Type': 'application/json'
     }
-
-    try:
-        response = requests.request("POST", url, headers=headers, data=payload)
-    except:
-        return {}
-
-    if response.status_code != 200:
-        return {}
-
-    return json.loads(response.text)
-
-
+    return post_json(endpoint, payload, decoder=decode_wikifier_response)
+
+
+def run_wikifier_batch(text_list: list, endpoint: str = WIKIFIER_ENDPOINT,
+                       max_workers: int = WIKIFIER_BATCH_MAX_WORKERS) -> list:
+    """
+    Runs the Wikifier on many texts, pipelining the calls over the pooled connections.
+    :param text_list: the texts to annotate.
+    :param endpoint: the Wikifier endpoint.
+    :param max_workers: the maximum number of calls in flight.
+    :return: the Wikifier results, in the same order as the texts.
+    Failed calls return an empty dict.
+    """
+    if not text_list:
+        return list()
+    if len(text_list) == 1:
+        return [run_wikifier(text_list[0], endpoint)]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(text_list))) as executor:
+        return list(executor.map(propagate_trace(lambda text: run_wikifier(text, endpoint)), text_list))
+
+
+@timed("call_restaurant_endpoint")
 def call_restaurant_endpoint(endpoint: str, search_query: str, num_results: int, location_list: list) -> dict:
-    url = endpoint
-    payload = json.dumps({
+    cache = get_result_cache()
+    key = result_cache_key(endpoint, search_query, num_results, location_list)
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    payload = {
         "query": search_query,
         "location_list": location_list,
         "num_results": num_results
-    })
-    headers = {
-        'Content-Type': 'application/json'
     }
-
-    response = requests.request("POST", url, headers=headers, data=payload)
-    if response.status_code != 200:
-        return {}
-    return json.loads(response.text)
+    result = post_json(endpoint, payload, decoder=decode_restaurant_response)
+    if result:
+        cache.put(key, result)
+    return result
+
+
+def stream_restaurant_endpoint(endpoint: str, search_query: str, num_results: int, location_list: list):
+    """
+    Streams the results of a restaurant search call as they arrive.
+    Shares its cache with call_restaurant_endpoint.
+    :param endpoint: the restaurant search endpoint.
+    :param search_query: the search query.
+    :param num_results: the number of results to retrieve.
+    :param location_list: the list of locations.
+    :return: the stream of restaurant search results, 'complete' once all of them were received.
+    """
+    cache = get_result_cache()
+    key = result_cache_key(endpoint, search_query, num_results, location_list)
+    result = cache.get(key)
+    if result is not None:
+        return ResultList(result["result"])
+
+    payload = {
+        "query": search_query,
+        "location_list": location_list,
+        "num_results": num_results
+    }
+    return CachingStream(
+        post_json_stream(endpoint, payload, decoder=decode_restaurant_response, check_item=check_restaurant_result),
+        lambda result: cache.put(key, result))